@@ -1,12 +1,13 @@
 # Initialize session state variables before any Streamlit commands
 import streamlit as st
 from streamlit_autorefresh import st_autorefresh
-from libs.db import get_conn
+from libs.db import try_get_conn
+from libs.db_utils import get_circuit_breaker
+from libs.price_ticker import get_price_ticker
 from libs.auth import render_login_sidebar
 from libs.ui_helpers import header
 from pages.notices import render_notices
 import time
-import psycopg2
 import traceback
 
 # Initialize session state variables
@@ -23,35 +24,19 @@ if 'db_initialized' not in st.session_state:
 if 'last_db_check' not in st.session_state:
     st.session_state.last_db_check = 0
 
-# Function to get a fresh connection for each operation
-def get_fresh_connection():
-    """Get a completely fresh database connection for this operation"""
-    try:
-        # Create a brand new connection using secrets
-        conn = psycopg2.connect(
-            user=st.secrets["user"],
-            password=st.secrets["password"],
-            host=st.secrets["host"],
-            port=st.secrets["port"],
-            dbname=st.secrets["dbname"],
-            keepalives=1,
-            keepalives_idle=30,
-            keepalives_interval=10,
-            keepalives_count=5
-        )
-        conn.autocommit = True
-        return conn, None
-    except Exception as e:
-        return None, str(e)
-
 # Global auto-refresh (30 seconds)
 st_autorefresh(interval=30000, key="global_autorefresh")
 
 # Only check database connection once every 5 minutes to reduce overhead
 current_time = time.time()
-if current_time - st.session_state.last_db_check > 300:  # 5 minutes in seconds
-    # Check if database is properly connected (without using cached connections)
-    conn, error = get_fresh_connection()
+breaker = get_circuit_breaker()
+if breaker.is_open():
+    # Fail fast while the shared breaker is open instead of waiting on another connect timeout
+    db_connected = False
+    st.error(f"Database connection error: 데이터베이스를 사용할 수 없습니다. {breaker.retry_in():.0f}초 후에 다시 시도합니다.")
+elif current_time - st.session_state.last_db_check > 300:  # 5 minutes in seconds
+    # Check if database is properly connected (borrowed from the shared pool)
+    conn, error = try_get_conn()
     if conn:
         try:
             cur = conn.cursor()
@@ -74,6 +59,8 @@ else:
 
 # Render login sidebar only if database is connected
 if db_connected:
+    # Prices refresh on a background thread, never inside a page run
+    get_price_ticker()
     render_login_sidebar()
 
 # Render header
@@ -109,7 +96,7 @@ if db_connected:
             
             if st.button("데이터베이스 테이블 초기화", key="init_db_button"):
                 try:
-                    conn, error = get_fresh_connection()
+                    conn, error = try_get_conn()
                     if conn:
                         from libs.db import init_tables
                         init_tables()
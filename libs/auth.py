@@ -1,7 +1,5 @@
 import streamlit as st
-import psycopg2
-import psycopg2.errors
-from libs.db import get_conn
+from libs.db import try_get_conn
 import re
 import hashlib
 
@@ -26,27 +24,6 @@ def hash_password(password):
     """Simple password hashing using SHA-256"""
     return hashlib.sha256(password.encode()).hexdigest()
 
-# Function to get a fresh connection for each operation
-def get_fresh_connection():
-    """Get a completely fresh database connection for this operation"""
-    try:
-        # Create a brand new connection using secrets
-        conn = psycopg2.connect(
-            user=st.secrets["user"],
-            password=st.secrets["password"],
-            host=st.secrets["host"],
-            port=st.secrets["port"],
-            dbname=st.secrets["dbname"],
-            keepalives=1,
-            keepalives_idle=30,
-            keepalives_interval=10,
-            keepalives_count=5
-        )
-        conn.autocommit = True
-        return conn, None
-    except Exception as e:
-        return None, str(e)
-
 def render_login_sidebar():
     """로그인/회원가입 사이드바를 렌더링 (연결 오류 방지 처리)"""
     
@@ -85,8 +62,8 @@ def render_login_sidebar():
                         # 비밀번호 해싱
                         hashed_pwd = hash_password(pwd)
                         
-                        # Get a fresh connection
-                        conn, error = get_fresh_connection()
+                        # Borrow a pooled connection
+                        conn, error = try_get_conn()
                         if not conn:
                             st.error(f"데이터베이스 연결 실패: {error}")
                             return
@@ -187,8 +164,8 @@ def render_login_sidebar():
                         # 비밀번호 해싱
                         hashed_np = hash_password(np)
                         
-                        # Get a fresh connection
-                        conn, error = get_fresh_connection()
+                        # Borrow a pooled connection
+                        conn, error = try_get_conn()
                         if not conn:
                             st.error(f"데이터베이스 연결 실패: {error}")
                             return
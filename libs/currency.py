@@ -1,6 +1,383 @@
 import streamlit as st
-from libs.db import get_conn
+import csv
+import io
+import numpy as np
+from libs.db import get_conn, select_query
+from libs.leaderboard import get_leaderboard
 from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+# ---------------------------------------------------------------------------
+# Ledger: the only code that changes users.currency
+# ---------------------------------------------------------------------------
+
+# Appends both legs for every row of a preceding `tx` CTE
+# (transaction_id, from_user_id, to_user_id, amount, created_at)
+LEDGER_ENTRY_CTES = """
+    legs AS (
+        SELECT transaction_id, from_user_id AS user_id, -amount AS amount, created_at FROM tx
+        UNION ALL
+        SELECT transaction_id, to_user_id, amount, created_at FROM tx
+    ),
+    entries AS (
+        INSERT INTO ledger_entries (transaction_id, user_id, amount, created_at)
+        SELECT transaction_id, user_id, amount, created_at FROM legs
+    )
+"""
+
+# The entries plus the summed balance deltas. Statements that create transactions end with this.
+LEDGER_CTES = LEDGER_ENTRY_CTES + """,
+    balances AS (
+        UPDATE users u
+        SET currency = COALESCE(u.currency, 0) + d.delta
+        FROM (
+            SELECT user_id, SUM(amount) AS delta
+            FROM legs
+            WHERE user_id IS NOT NULL
+            GROUP BY user_id
+        ) d
+        WHERE u.user_id = d.user_id
+    )
+"""
+
+POST_TRANSACTIONS_QUERY = """
+    WITH tx AS (
+        INSERT INTO transactions (from_user_id, to_user_id, amount, type, description, created_by)
+        SELECT *
+        FROM unnest(%(from_user_ids)s::int[], %(to_user_ids)s::int[], %(amounts)s::int[],
+                    %(types)s::text[], %(descriptions)s::text[], %(created_by)s::int[])
+        RETURNING transaction_id, from_user_id, to_user_id, amount, created_at
+    ),
+""" + LEDGER_CTES + """
+    SELECT transaction_id FROM tx ORDER BY transaction_id
+"""
+
+def post_transactions(cur, rows):
+    """
+    Record transactions, append their ledger entries and apply the balance changes in one statement.
+
+    rows: iterable of (from_user_id, to_user_id, amount, type, description, created_by).
+    A None user is the class treasury. Runs on the caller's cursor so it joins
+    the caller's transaction. Returns the new transaction ids.
+    """
+    rows = list(rows)
+    if not rows:
+        return []
+    from_user_ids, to_user_ids, amounts, types, descriptions, created_by = (list(column) for column in zip(*rows))
+    cur.execute(POST_TRANSACTIONS_QUERY, {
+        "from_user_ids": from_user_ids,
+        "to_user_ids": to_user_ids,
+        "amounts": [int(amount) for amount in amounts],
+        "types": types,
+        "descriptions": descriptions,
+        "created_by": created_by,
+    })
+    return [row[0] for row in cur.fetchall()]
+
+def post_transaction(cur, from_user_id, to_user_id, amount, type, description="", created_by=None):
+    """Record a single transaction through the ledger and return its id"""
+    return post_transactions(cur, [(from_user_id, to_user_id, amount, type, description, created_by)])[0]
+
+TRANSFER_QUERY = """
+    WITH debit AS (
+        UPDATE users
+        SET currency = currency - %(total)s
+        WHERE user_id = %(from_user_id)s AND role = 'teacher' AND currency >= %(total)s
+        RETURNING user_id, currency
+    ),
+    payouts AS (
+        SELECT p.to_user_id, p.amount
+        FROM unnest(%(to_user_ids)s::int[], %(amounts)s::int[]) AS p(to_user_id, amount)
+        WHERE EXISTS (SELECT 1 FROM debit)
+    ),
+    tx AS (
+        INSERT INTO transactions (from_user_id, to_user_id, amount, type, description, created_by)
+        SELECT %(from_user_id)s, to_user_id, amount, 'transfer', %(description)s, %(from_user_id)s
+        FROM payouts
+        RETURNING transaction_id, from_user_id, to_user_id, amount, created_at
+    ),
+    entries AS (
+        INSERT INTO ledger_entries (transaction_id, user_id, amount, created_at)
+        SELECT transaction_id, from_user_id, -amount, created_at FROM tx
+        UNION ALL
+        SELECT transaction_id, to_user_id, amount, created_at FROM tx
+    ),
+    credit AS (
+        UPDATE users u
+        SET currency = COALESCE(u.currency, 0) + p.amount
+        FROM (SELECT to_user_id, SUM(amount) AS amount FROM payouts GROUP BY to_user_id) p
+        WHERE u.user_id = p.to_user_id
+    )
+    SELECT (SELECT role FROM users WHERE user_id = %(from_user_id)s),
+           (SELECT currency FROM debit),
+           (SELECT COUNT(*) FROM tx)
+"""
+
+def bulk_transfer(from_user_id, payouts, description=""):
+    """
+    Pay a list of (to_user_id, amount) pairs from a teacher in one statement.
+
+    The sender is debited with a conditional UPDATE that holds the row lock and
+    rechecks the balance, so concurrent transfers cannot overdraw. Either every
+    payout is made or none. Returns the sender's new balance.
+    """
+    payouts = [(to_user_id, int(amount)) for to_user_id, amount in payouts]
+    if not payouts:
+        raise ValueError("No payouts")
+    if any(amount <= 0 for _, amount in payouts):
+        raise ValueError("Amounts must be positive")
+    if any(to_user_id == from_user_id for to_user_id, _ in payouts):
+        raise ValueError("Cannot transfer to yourself")
+
+    conn = get_conn()
+    cur = conn.cursor()
+    try:
+        cur.execute(TRANSFER_QUERY, {
+            "from_user_id": from_user_id,
+            "to_user_ids": [to_user_id for to_user_id, _ in payouts],
+            "amounts": [amount for _, amount in payouts],
+            "total": sum(amount for _, amount in payouts),
+            "description": description,
+        })
+        role, balance, _ = cur.fetchone()
+    finally:
+        cur.close()
+        conn.close()
+
+    if role != 'teacher':
+        raise PermissionError("Only teachers can transfer currency")
+    if balance is None:
+        raise ValueError("Insufficient balance")
+    return balance
+
+def verify_ledger(create_checkpoint=True, created_by=None):
+    """
+    Check the ledger entries added since the last checkpoint.
+
+    Every new transaction must balance to zero, and each user's last snapshot
+    plus their new entries must equal users.currency. If both hold and
+    create_checkpoint is set, a new checkpoint is written with a balance
+    snapshot for every user. Returns a report dict.
+    """
+    conn = get_conn()
+    conn.autocommit = False
+    cur = conn.cursor()
+    try:
+        # One snapshot for balances and entries, which always change together
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        cur.execute("""
+            SELECT checkpoint_id, last_entry_id
+            FROM ledger_checkpoints
+            ORDER BY checkpoint_id DESC
+            LIMIT 1
+        """)
+        previous = cur.fetchone()
+        previous_id, previous_last = previous if previous else (None, 0)
+
+        cur.execute("SELECT COALESCE(MAX(entry_id), 0) FROM ledger_entries")
+        last_entry_id = cur.fetchone()[0]
+
+        cur.execute("""
+            SELECT COUNT(*) FROM ledger_entries WHERE entry_id > %s AND entry_id <= %s
+        """, (previous_last, last_entry_id))
+        entries_checked = cur.fetchone()[0]
+
+        cur.execute("""
+            SELECT transaction_id, SUM(amount)
+            FROM ledger_entries
+            WHERE entry_id > %s AND entry_id <= %s
+            GROUP BY transaction_id
+            HAVING SUM(amount) <> 0
+        """, (previous_last, last_entry_id))
+        unbalanced = cur.fetchall()
+
+        cur.execute("""
+            CREATE TEMPORARY TABLE ledger_expected ON COMMIT DROP AS
+            SELECT u.user_id, u.username,
+                   COALESCE(s.balance, 0) + COALESCE(t.delta, 0) AS expected,
+                   COALESCE(u.currency, 0) AS actual
+            FROM users u
+            LEFT JOIN balance_snapshots s ON s.user_id = u.user_id AND s.checkpoint_id = %s
+            LEFT JOIN (
+                SELECT user_id, SUM(amount) AS delta
+                FROM ledger_entries
+                WHERE entry_id > %s AND entry_id <= %s AND user_id IS NOT NULL
+                GROUP BY user_id
+            ) t ON t.user_id = u.user_id
+        """, (previous_id, previous_last, last_entry_id))
+        cur.execute("""
+            SELECT user_id, username, expected, actual
+            FROM ledger_expected
+            WHERE expected <> actual
+            ORDER BY user_id
+        """)
+        mismatches = cur.fetchall()
+
+        checkpoint_id = None
+        if create_checkpoint and not unbalanced and not mismatches and (previous is None or last_entry_id > previous_last):
+            cur.execute("""
+                INSERT INTO ledger_checkpoints (last_entry_id, entries_checked, created_by)
+                VALUES (%s, %s, %s)
+                RETURNING checkpoint_id
+            """, (last_entry_id, entries_checked, created_by))
+            checkpoint_id = cur.fetchone()[0]
+            cur.execute("""
+                INSERT INTO balance_snapshots (checkpoint_id, user_id, balance)
+                SELECT %s, user_id, expected FROM ledger_expected
+            """, (checkpoint_id,))
+        conn.commit()
+        return {
+            "previous_checkpoint_id": previous_id,
+            "checkpoint_id": checkpoint_id,
+            "last_entry_id": last_entry_id,
+            "entries_checked": entries_checked,
+            "unbalanced": unbalanced,    # (transaction_id, sum of legs)
+            "mismatches": mismatches,    # (user_id, username, ledger balance, users.currency)
+            "ok": not unbalanced and not mismatches,
+        }
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+def get_balance_as_of(user_id, as_of):
+    """
+    Balance of a user at a point in time.
+
+    Starts from the last snapshot taken at or before as_of. It then adds only
+    that user's entries up to the next checkpoint, so the scan stays bounded.
+    """
+    row = select_query("""
+        WITH base AS (
+            SELECT checkpoint_id, last_entry_id
+            FROM ledger_checkpoints
+            WHERE created_at <= %(as_of)s
+            ORDER BY checkpoint_id DESC
+            LIMIT 1
+        ),
+        next_checkpoint AS (
+            SELECT last_entry_id
+            FROM ledger_checkpoints
+            WHERE created_at > %(as_of)s
+            ORDER BY checkpoint_id
+            LIMIT 1
+        )
+        SELECT COALESCE((
+                   SELECT s.balance
+                   FROM balance_snapshots s
+                   JOIN base ON s.checkpoint_id = base.checkpoint_id
+                   WHERE s.user_id = %(user_id)s
+               ), 0)
+             + COALESCE((
+                   SELECT SUM(e.amount)
+                   FROM ledger_entries e
+                   WHERE e.user_id = %(user_id)s
+                     AND e.entry_id > COALESCE((SELECT last_entry_id FROM base), 0)
+                     AND e.entry_id <= COALESCE((SELECT last_entry_id FROM next_checkpoint), 9223372036854775807)
+                     AND e.created_at <= %(as_of)s
+               ), 0)
+    """, {"user_id": user_id, "as_of": as_of}, fetch_all=False)
+    return row[0]
+
+def get_last_checkpoint():
+    """Latest ledger checkpoint as (checkpoint_id, last_entry_id, entries_checked, created_at) or None"""
+    return select_query("""
+        SELECT checkpoint_id, last_entry_id, entries_checked, created_at
+        FROM ledger_checkpoints
+        ORDER BY checkpoint_id DESC
+        LIMIT 1
+    """, fetch_all=False)
+
+# Records transactions and their ledger entries without touching users.currency:
+# a correction documents a balance change that already happened off the books
+RECORD_CORRECTIONS_QUERY = """
+    WITH tx AS (
+        INSERT INTO transactions (from_user_id, to_user_id, amount, type, description, created_by)
+        SELECT from_user_id, to_user_id, amount, 'correction', %(description)s, %(created_by)s
+        FROM unnest(%(from_user_ids)s::int[], %(to_user_ids)s::int[], %(amounts)s::int[])
+             AS c(from_user_id, to_user_id, amount)
+        RETURNING transaction_id, from_user_id, to_user_id, amount, created_at
+    ),
+""" + LEDGER_ENTRY_CTES + """
+    SELECT transaction_id FROM tx ORDER BY transaction_id
+"""
+
+def reconcile_balances(repair=False, created_by=None, chunk_size=5000):
+    """
+    Replay the ledger-backed transactions and compare the result with users.currency.
+
+    Transactions are streamed through a server-side cursor and folded into one
+    running total per user, so memory grows with the number of users, not with
+    the history. With repair set, every drift is recorded as a 'correction'
+    transaction from or to the treasury. The stored balance is kept and the
+    history is brought in line with it. Returns a report dict.
+    """
+    conn = get_conn()
+    conn.autocommit = False
+    try:
+        cur = conn.cursor()
+        # Transactions and balances must come from the same snapshot
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        # History before the opening balances is already folded into them
+        cur.execute("SELECT COALESCE(MIN(transaction_id), 0) FROM ledger_entries")
+        first_transaction_id = cur.fetchone()[0]
+
+        expected = {}
+        scanned = 0
+        stream = conn.cursor(name="balance_reconciliation")
+        stream.itersize = chunk_size
+        stream.execute("""
+            SELECT from_user_id, to_user_id, amount
+            FROM transactions
+            WHERE transaction_id >= %s
+        """, (first_transaction_id,))
+        while True:
+            rows = stream.fetchmany(chunk_size)
+            if not rows:
+                break
+            scanned += len(rows)
+            for from_user_id, to_user_id, amount in rows:
+                if from_user_id is not None:
+                    expected[from_user_id] = expected.get(from_user_id, 0) - amount
+                if to_user_id is not None:
+                    expected[to_user_id] = expected.get(to_user_id, 0) + amount
+        stream.close()
+
+        cur.execute("SELECT user_id, username, COALESCE(currency, 0) FROM users ORDER BY user_id")
+        users = cur.fetchall()
+        drift = [
+            (user_id, username, expected.get(user_id, 0), actual)
+            for user_id, username, actual in users
+            if expected.get(user_id, 0) != actual
+        ]
+
+        corrections = []
+        if repair and drift:
+            cur.execute(RECORD_CORRECTIONS_QUERY, {
+                "from_user_ids": [user_id if actual < balance else None for user_id, _, balance, actual in drift],
+                "to_user_ids": [user_id if actual > balance else None for user_id, _, balance, actual in drift],
+                "amounts": [abs(actual - balance) for _, _, balance, actual in drift],
+                "description": "잔고 대사 보정",
+                "created_by": created_by,
+            })
+            corrections = [row[0] for row in cur.fetchall()]
+        conn.commit()
+        cur.close()
+        return {
+            "transactions_scanned": scanned,
+            "users_checked": len(users),
+            "drift": drift,                  # (user_id, username, replayed balance, users.currency)
+            "total_drift": sum(actual - balance for _, _, balance, actual in drift),
+            "corrections": corrections,      # ids of the correction transactions
+            "ok": not drift,
+        }
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
 
 def get_user_currency(user_id):
     """Get user's current currency balance"""
@@ -12,37 +389,197 @@ def get_user_currency(user_id):
 
 def transfer_currency(from_user_id, to_user_id, amount, description=""):
     """Transfer currency between users (only teachers can do this)"""
+    bulk_transfer(from_user_id, [(to_user_id, amount)], description)
+    return True
+
+# ---------------------------------------------------------------------------
+# Savings: deposits are held by the treasury and compound daily. Nothing runs
+# on a schedule; an account's balance is brought forward in closed form from
+# touched_at whenever it is read or changed.
+# ---------------------------------------------------------------------------
+
+DEFAULT_SAVINGS_RATE = 0.05
+
+# Same formula as compound() below, for the balance of savings_accounts row `s` right now
+SAVINGS_BALANCE_SQL = """
+    s.balance * power(1 + s.annual_rate / 365, GREATEST(extract(epoch FROM now() - s.touched_at), 0) / 86400)
+"""
+
+SAVINGS_DEPOSIT_QUERY = """
+    WITH debit AS (
+        UPDATE users
+        SET currency = currency - %(amount)s
+        WHERE user_id = %(user_id)s AND currency >= %(amount)s
+        RETURNING user_id
+    ),
+    tx AS (
+        INSERT INTO transactions (from_user_id, to_user_id, amount, type, description, created_by)
+        SELECT user_id, NULL, %(amount)s, 'savings', '저축 입금', user_id FROM debit
+        RETURNING transaction_id, from_user_id, to_user_id, amount, created_at
+    ),
+""" + LEDGER_ENTRY_CTES + """,
+    account AS (
+        INSERT INTO savings_accounts AS s (user_id, balance, annual_rate)
+        SELECT user_id, %(amount)s, %(rate)s FROM debit
+        ON CONFLICT (user_id) DO UPDATE
+        SET balance = """ + SAVINGS_BALANCE_SQL + """ + EXCLUDED.balance,
+            annual_rate = EXCLUDED.annual_rate,
+            touched_at = now()
+        RETURNING balance
+    )
+    SELECT (SELECT balance FROM account)
+"""
+
+SAVINGS_WITHDRAW_QUERY = """
+    WITH account AS (
+        UPDATE savings_accounts s
+        SET balance = """ + SAVINGS_BALANCE_SQL + """ - %(amount)s,
+            annual_rate = %(rate)s,
+            touched_at = now()
+        WHERE s.user_id = %(user_id)s AND """ + SAVINGS_BALANCE_SQL + """ >= %(amount)s
+        RETURNING user_id, balance
+    ),
+    tx AS (
+        INSERT INTO transactions (from_user_id, to_user_id, amount, type, description, created_by)
+        SELECT NULL, user_id, %(amount)s, 'savings', '저축 출금', user_id FROM account
+        RETURNING transaction_id, from_user_id, to_user_id, amount, created_at
+    ),
+""" + LEDGER_ENTRY_CTES + """,
+    credit AS (
+        UPDATE users
+        SET currency = COALESCE(currency, 0) + %(amount)s
+        WHERE user_id IN (SELECT user_id FROM account)
+    )
+    SELECT (SELECT balance FROM account)
+"""
+
+def savings_rate():
+    """Annual interest rate applied from the next deposit or withdrawal on"""
+    return float(st.secrets.get("savings_annual_rate", DEFAULT_SAVINGS_RATE))
+
+def compound(balance, annual_rate, days):
+    """Balance after `days` of daily compounding; scalars or NumPy arrays"""
+    return balance * np.power(1 + annual_rate / 365, days)
+
+def _change_savings(query, user_id, amount):
+    amount = int(amount)
+    if amount <= 0:
+        raise ValueError("Amount must be positive")
     conn = get_conn()
     cur = conn.cursor()
-    
-    # Check if sender is a teacher
-    cur.execute("SELECT role FROM users WHERE user_id = %s", (from_user_id,))
-    sender_role = cur.fetchone()[0]
-    if sender_role != 'teacher':
-        raise PermissionError("Only teachers can transfer currency")
-    
-    # Check if sender has enough currency
-    sender_balance = get_user_currency(from_user_id)
-    if sender_balance < amount:
+    try:
+        cur.execute(query, {"user_id": user_id, "amount": amount, "rate": savings_rate()})
+        balance = cur.fetchone()[0]
+    finally:
+        cur.close()
+        conn.close()
+    if balance is None:
         raise ValueError("Insufficient balance")
-    
-    # Perform transaction
+    return float(balance)
+
+def deposit_savings(user_id, amount):
+    """
+    Move amount from the user's wallet into their savings account, opening it if needed.
+
+    Interest earned so far is booked first, so the new rate only applies from now.
+    Returns the new savings balance.
+    """
+    return _change_savings(SAVINGS_DEPOSIT_QUERY, user_id, amount)
+
+def withdraw_savings(user_id, amount):
+    """Move amount (principal or interest) from savings back to the wallet; returns the remaining savings balance"""
+    return _change_savings(SAVINGS_WITHDRAW_QUERY, user_id, amount)
+
+SAVINGS_ACCOUNTS_QUERY = """
+    SELECT s.user_id, u.username, s.balance::float8, s.annual_rate::float8,
+           GREATEST(extract(epoch FROM now() - s.touched_at), 0)::float8 / 86400
+    FROM savings_accounts s
+    JOIN users u ON s.user_id = u.user_id
+"""
+
+def get_savings_account(user_id):
+    """(balance right now, annual_rate) of a user's savings account, or None; read-only"""
+    row = select_query(SAVINGS_ACCOUNTS_QUERY + " WHERE s.user_id = %s", (user_id,), fetch_all=False)
+    if not row:
+        return None
+    _, _, balance, annual_rate, days = row
+    return float(compound(balance, annual_rate, days)), annual_rate
+
+def get_savings_overview(cache_ttl=60):
+    """
+    Every account brought forward to now in one vectorized step.
+
+    Returns (rows, total_balance, total_accrued) where rows are
+    (username, booked balance, accrued interest, current balance), largest first.
+    """
+    accounts = select_query(SAVINGS_ACCOUNTS_QUERY, cache_ttl=cache_ttl)
+    if not accounts:
+        return [], 0.0, 0.0
+    _, usernames, booked, rates, days = zip(*accounts)
+    booked = np.array(booked)
+    current = compound(booked, np.array(rates), np.array(days))
+    accrued = current - booked
+    order = np.argsort(-current)
+    rows = [(usernames[i], float(booked[i]), float(accrued[i]), float(current[i])) for i in order]
+    return rows, float(current.sum()), float(accrued.sum())
+
+# ---------------------------------------------------------------------------
+# Shop: the price is read and the buyer debited in the same statement
+# ---------------------------------------------------------------------------
+
+PURCHASE_ITEM_QUERY = """
+    WITH item AS (
+        SELECT item_id, name, price
+        FROM shop_items
+        WHERE item_id = %(item_id)s
+          AND NOT EXISTS (
+              SELECT 1 FROM user_items
+              WHERE user_id = %(user_id)s AND item_id = %(item_id)s AND is_active
+          )
+    ),
+    debit AS (
+        UPDATE users u
+        SET currency = u.currency - item.price
+        FROM item
+        WHERE u.user_id = %(user_id)s AND u.currency >= item.price
+        RETURNING u.user_id, u.currency, item.item_id, item.name, item.price
+    ),
+    owned AS (
+        INSERT INTO user_items (user_id, item_id)
+        SELECT user_id, item_id FROM debit
+    ),
+    tx AS (
+        INSERT INTO transactions (from_user_id, to_user_id, amount, type, description, created_by)
+        SELECT user_id, NULL, price, 'shop', '상점에서 ''' || name || ''' 아이템 구매', user_id FROM debit
+        RETURNING transaction_id, from_user_id, to_user_id, amount, created_at
+    ),
+""" + LEDGER_ENTRY_CTES + """
+    SELECT (SELECT price FROM item), (SELECT currency FROM debit)
+"""
+
+def purchase_item(user_id, item_id):
+    """
+    Buy a shop item at its current price in one statement.
+
+    The debit is a conditional UPDATE that holds the buyer's row lock and
+    rechecks the balance, so concurrent purchases cannot overdraw. The
+    inventory row and ledger entries are only written if it succeeds.
+    Raises LookupError if the item does not exist or is already owned, and
+    ValueError if the balance is insufficient. Returns the new balance.
+    """
+    conn = get_conn()
+    cur = conn.cursor()
     try:
-        # Update balances
-        cur.execute("UPDATE users SET currency = currency - %s WHERE user_id = %s", (amount, from_user_id))
-        cur.execute("UPDATE users SET currency = currency + %s WHERE user_id = %s", (amount, to_user_id))
-        
-        # Record transaction
-        cur.execute("""
-            INSERT INTO transactions (from_user_id, to_user_id, amount, type, description, created_by)
-            VALUES (%s, %s, %s, 'transfer', %s, %s)
-        """, (from_user_id, to_user_id, amount, description, from_user_id))
-        
-        conn.commit()
-        return True
-    except Exception as e:
-        conn.rollback()
-        raise e
+        cur.execute(PURCHASE_ITEM_QUERY, {"user_id": user_id, "item_id": item_id})
+        price, balance = cur.fetchone()
+    finally:
+        cur.close()
+        conn.close()
+    if price is None:
+        raise LookupError("Item not available")
+    if balance is None:
+        raise ValueError("Insufficient balance")
+    return balance
 
 def create_job(name, salary, description, created_by):
     """Create a new job with salary"""
@@ -64,30 +601,94 @@ def assign_job(user_id, job_id):
     cur.execute("UPDATE users SET job_id = %s WHERE user_id = %s", (job_id, user_id))
     conn.commit()
 
-def process_monthly_salaries():
-    """Process monthly salaries for all users with jobs"""
+# Class dates follow Seoul time, like the economy_daily rollup
+CLASS_TIMEZONE = ZoneInfo("Asia/Seoul")
+
+def current_pay_period():
+    """Pay period key for this month in Seoul time, e.g. '2024-05'"""
+    return datetime.now(CLASS_TIMEZONE).strftime("%Y-%m")
+
+def process_monthly_salaries(pay_period=None, created_by=None):
+    """
+    Pay every employed user their job salary once per pay period.
+
+    Runs in one transaction with a constant number of statements regardless of
+    class size. A period that already has a salary_runs row is not paid again.
+    Returns a dict: pay_period, run_id, paid_users, total_amount, already_paid.
+    """
+    pay_period = pay_period or current_pay_period()
     conn = get_conn()
+    conn.autocommit = False
     cur = conn.cursor()
-    
-    # Get all users with jobs
-    cur.execute("""
-        SELECT u.user_id, j.salary
-        FROM users u
-        JOIN jobs j ON u.job_id = j.job_id
-    """)
-    users_with_jobs = cur.fetchall()
-    
-    for user_id, salary in users_with_jobs:
-        # Add salary to user's balance
-        cur.execute("UPDATE users SET currency = currency + %s WHERE user_id = %s", (salary, user_id))
-        
-        # Record transaction
+    try:
+        # Claim the period; a concurrent run blocks here and then finds the row
         cur.execute("""
-            INSERT INTO transactions (from_user_id, to_user_id, amount, type, description, created_by)
-            VALUES (NULL, %s, %s, 'salary', 'Monthly salary', %s)
-        """, (user_id, salary, user_id))
-    
-    conn.commit()
+            INSERT INTO salary_runs (pay_period, created_by)
+            VALUES (%s, %s)
+            ON CONFLICT (pay_period) DO NOTHING
+            RETURNING run_id
+        """, (pay_period, created_by))
+        claimed = cur.fetchone()
+
+        if claimed is None:
+            conn.rollback()
+            cur.execute("""
+                SELECT run_id, paid_users, total_amount
+                FROM salary_runs
+                WHERE pay_period = %s
+            """, (pay_period,))
+            run_id, paid_users, total_amount = cur.fetchone()
+            return {"pay_period": pay_period, "run_id": run_id, "paid_users": paid_users,
+                    "total_amount": total_amount, "already_paid": True}
+
+        # Credit balances and write the matching transactions and ledger entries
+        # in one statement (the set-based form of post_transactions)
+        cur.execute("""
+            WITH paid AS (
+                UPDATE users u
+                SET currency = u.currency + j.salary
+                FROM jobs j
+                WHERE u.job_id = j.job_id AND j.salary > 0
+                RETURNING u.user_id, j.salary, j.name
+            ),
+            recorded AS (
+                INSERT INTO transactions (from_user_id, to_user_id, amount, type, description, created_by)
+                SELECT NULL, user_id, salary, 'salary', name || ' 월급 (' || %(period)s || ')', %(created_by)s
+                FROM paid
+                RETURNING transaction_id, to_user_id, amount, created_at
+            ),
+            entries AS (
+                INSERT INTO ledger_entries (transaction_id, user_id, amount, created_at)
+                SELECT transaction_id, to_user_id, amount, created_at FROM recorded
+                UNION ALL
+                SELECT transaction_id, NULL, -amount, created_at FROM recorded
+            )
+            UPDATE salary_runs
+            SET paid_users = (SELECT COUNT(*) FROM recorded),
+                total_amount = (SELECT COALESCE(SUM(amount), 0) FROM recorded)
+            WHERE run_id = %(run_id)s
+            RETURNING paid_users, total_amount
+        """, {"period": pay_period, "created_by": created_by, "run_id": claimed[0]})
+        paid_users, total_amount = cur.fetchone()
+        conn.commit()
+        return {"pay_period": pay_period, "run_id": claimed[0], "paid_users": paid_users,
+                "total_amount": total_amount, "already_paid": False}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+def get_salary_runs(limit=12):
+    """Most recent payroll runs as (pay_period, paid_users, total_amount, created_at, created_by username)"""
+    return select_query("""
+        SELECT r.pay_period, r.paid_users, r.total_amount, r.created_at, u.username
+        FROM salary_runs r
+        LEFT JOIN users u ON r.created_by = u.user_id
+        ORDER BY r.pay_period DESC
+        LIMIT %s
+    """, (limit,))
 
 def create_quest(title, description, reward, created_by, is_daily=False):
     """Create a new quest"""
@@ -102,39 +703,304 @@ def create_quest(title, description, reward, created_by, is_daily=False):
     conn.commit()
     return quest_id
 
-def complete_quest(user_id, quest_id, verified_by):
-    """Mark a quest as completed and reward the user"""
+APPROVE_COMPLETIONS_QUERY = """
+    WITH approved AS (
+        UPDATE quest_completions qc
+        SET verified_by = %(verified_by)s, verified_at = now()
+        FROM quests q
+        WHERE qc.completion_id = ANY(%(completion_ids)s::int[])
+          AND qc.verified_at IS NULL
+          AND q.quest_id = qc.quest_id
+        RETURNING qc.user_id, q.reward, q.title
+    ),
+    tx AS (
+        INSERT INTO transactions (from_user_id, to_user_id, amount, type, description, created_by)
+        SELECT NULL, user_id, reward, 'quest', '퀘스트 보상: ' || title, %(verified_by)s
+        FROM approved
+        RETURNING transaction_id, from_user_id, to_user_id, amount, created_at
+    ),
+""" + LEDGER_CTES + """
+    SELECT COUNT(*), COALESCE(SUM(amount), 0) FROM tx
+"""
+
+def verify_completions(completion_ids, verified_by):
+    """
+    Approve pending quest completions and pay their rewards in one statement.
+
+    Completions that are already verified are skipped, so approving the same
+    rows twice pays once. Returns (approved count, total reward).
+    """
+    completion_ids = [int(completion_id) for completion_id in completion_ids]
+    if not completion_ids:
+        return 0, 0
+    conn = get_conn()
+    cur = conn.cursor()
+    try:
+        cur.execute(APPROVE_COMPLETIONS_QUERY, {"completion_ids": completion_ids, "verified_by": verified_by})
+        return cur.fetchone()
+    finally:
+        cur.close()
+        conn.close()
+
+def get_pending_completions(after=None, limit=20):
+    """
+    One page of unverified completions, oldest first, as
+    (completion_id, completed_at, quest title, reward, username).
+
+    after is the (completed_at, completion_id) of the last row of the previous page.
+    """
+    if after is None:
+        return select_query("""
+            SELECT qc.completion_id, qc.completed_at, q.title, q.reward, u.username
+            FROM quest_completions qc
+            JOIN quests q ON qc.quest_id = q.quest_id
+            JOIN users u ON qc.user_id = u.user_id
+            WHERE qc.verified_at IS NULL
+            ORDER BY qc.completed_at, qc.completion_id
+            LIMIT %s
+        """, (limit,))
+    return select_query("""
+        SELECT qc.completion_id, qc.completed_at, q.title, q.reward, u.username
+        FROM quest_completions qc
+        JOIN quests q ON qc.quest_id = q.quest_id
+        JOIN users u ON qc.user_id = u.user_id
+        WHERE qc.verified_at IS NULL
+          AND (qc.completed_at, qc.completion_id) > (%s, %s)
+        ORDER BY qc.completed_at, qc.completion_id
+        LIMIT %s
+    """, (after[0], after[1], limit))
+
+def count_pending_completions():
+    """Number of completions waiting for verification"""
+    return select_query("SELECT COUNT(*) FROM quest_completions WHERE verified_at IS NULL", fetch_all=False)[0]
+
+def request_completion(user_id, quest_id):
+    """Record a student's completion request (a second request is ignored)"""
     conn = get_conn()
     cur = conn.cursor()
-    
-    # Get quest details
-    cur.execute("SELECT reward FROM quests WHERE quest_id = %s", (quest_id,))
-    reward = cur.fetchone()[0]
-    
-    # Record completion
-    cur.execute("""
-        INSERT INTO quest_completions (quest_id, user_id, verified_by, verified_at)
-        VALUES (%s, %s, %s, now())
-    """, (quest_id, user_id, verified_by))
-    
-    # Add reward to user's balance
-    cur.execute("UPDATE users SET currency = currency + %s WHERE user_id = %s", (reward, user_id))
-    
-    # Record transaction
     cur.execute("""
-        INSERT INTO transactions (from_user_id, to_user_id, amount, type, description, created_by)
-        VALUES (NULL, %s, %s, 'quest', 'Quest reward', %s)
-    """, (user_id, reward, verified_by))
-    
-    conn.commit()
+        INSERT INTO quest_completions (quest_id, user_id)
+        VALUES (%s, %s)
+        ON CONFLICT (user_id, quest_id) DO NOTHING
+    """, (quest_id, user_id))
+    created = cur.rowcount == 1
+    cur.close()
+    conn.close()
+    return created
+
+def complete_quest(user_id, quest_id, verified_by):
+    """Mark a quest as completed and reward the user"""
+    request_completion(user_id, quest_id)
+    completion_id = select_query("""
+        SELECT completion_id FROM quest_completions WHERE user_id = %s AND quest_id = %s
+    """, (user_id, quest_id), fetch_all=False)[0]
+    verify_completions([completion_id], verified_by)
 
 def get_rankings():
     """Get user rankings by currency"""
+    # Served from the in-memory leaderboard, rebuilt only when balances change
+    return [(username, currency, role) for _, username, role, currency, _, _ in get_leaderboard().rows]
+
+# ---------------------------------------------------------------------------
+# Transaction explorer
+# ---------------------------------------------------------------------------
+
+# Every type the write paths above record
+TRANSACTION_TYPES = ['transfer', 'salary', 'quest', 'shop', 'refund', 'stock', 'opening', 'correction', 'savings']
+
+TRANSACTION_COLUMNS = ["ID", "보낸 사람", "받은 사람", "금액", "유형", "설명", "시간"]
+
+def _transaction_filters(user_id=None, tx_type=None, start=None, end=None):
+    """WHERE clauses and params for the explorer filters (end is exclusive)"""
+    clauses, params = [], []
+    if user_id is not None:
+        clauses.append("(t.from_user_id = %s OR t.to_user_id = %s)")
+        params += [user_id, user_id]
+    if tx_type:
+        clauses.append("t.type = %s")
+        params.append(tx_type)
+    if start is not None:
+        clauses.append("t.created_at >= %s")
+        params.append(start)
+    if end is not None:
+        clauses.append("t.created_at < %s")
+        params.append(end)
+    return clauses, params
+
+def _transactions_query(clauses):
+    return """
+        SELECT t.transaction_id,
+               COALESCE(u1.username, '시스템') as from_user,
+               COALESCE(u2.username, '시스템') as to_user,
+               t.amount, t.type, t.description, t.created_at
+        FROM transactions t
+        LEFT JOIN users u1 ON t.from_user_id = u1.user_id
+        LEFT JOIN users u2 ON t.to_user_id = u2.user_id
+    """ + (" WHERE " + " AND ".join(clauses) if clauses else "") + """
+        ORDER BY t.created_at DESC, t.transaction_id DESC
+    """
+
+def get_transactions_page(before=None, limit=50, user_id=None, tx_type=None, start=None, end=None):
+    """
+    One page of transactions, newest first, as
+    (transaction_id, from, to, amount, type, description, created_at).
+
+    before is the (created_at, transaction_id) of the last row of the previous page.
+    """
+    clauses, params = _transaction_filters(user_id, tx_type, start, end)
+    if before is not None:
+        clauses.append("(t.created_at, t.transaction_id) < (%s, %s)")
+        params += [before[0], before[1]]
+    return select_query(_transactions_query(clauses) + " LIMIT %s", tuple(params) + (limit,))
+
+# Rows per CSV export part. download_button holds a whole part in memory, so this bounds the export.
+EXPORT_PART_ROWS = 50000
+
+def _iter_transaction_rows(query, params, chunk_size):
+    """Yield the rows of an explorer query in chunks from a server-side named cursor"""
     conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT username, currency, role
+    # Named cursors only live inside a transaction
+    conn.autocommit = False
+    cur = conn.cursor(name="transaction_export")
+    cur.itersize = chunk_size
+    try:
+        cur.execute(query, tuple(params))
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cur.close()
+        conn.rollback()
+        conn.close()
+
+def iter_transactions_csv(user_id=None, tx_type=None, start=None, end=None, chunk_size=2000):
+    """
+    Yield the matching transactions as CSV text, one chunk of rows at a time.
+
+    Rows come from a server-side named cursor, so only chunk_size rows are
+    held in memory however long the history is.
+    """
+    clauses, params = _transaction_filters(user_id, tx_type, start, end)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(TRANSACTION_COLUMNS)
+    for rows in _iter_transaction_rows(_transactions_query(clauses), params, chunk_size):
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def export_transactions_csv(before=None, max_rows=EXPORT_PART_ROWS, user_id=None, tx_type=None, start=None, end=None, chunk_size=2000):
+    """
+    One part of the CSV export as (UTF-8 bytes with BOM, next_before).
+
+    A part holds at most max_rows rows, newest first, starting after the
+    (created_at, transaction_id) key `before` like get_transactions_page.
+    next_before is where the following part starts, or None after the last part.
+    """
+    clauses, params = _transaction_filters(user_id, tx_type, start, end)
+    if before is not None:
+        clauses.append("(t.created_at, t.transaction_id) < (%s, %s)")
+        params += [before[0], before[1]]
+    # One extra row tells whether another part follows
+    query = _transactions_query(clauses) + " LIMIT %s"
+    params.append(max_rows + 1)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(TRANSACTION_COLUMNS)
+    fetched, last = 0, None
+    for rows in _iter_transaction_rows(query, params, chunk_size):
+        part = rows[:max(max_rows - fetched, 0)]
+        fetched += len(rows)
+        if part:
+            writer.writerows(part)
+            last = part[-1]
+    next_before = (last[6], last[0]) if fetched > max_rows else None
+    return buffer.getvalue().encode("utf-8-sig"), next_before
+
+# ---------------------------------------------------------------------------
+# Economy statistics (economy_daily is kept up to date by a trigger on transactions)
+# ---------------------------------------------------------------------------
+
+ECONOMY_DAILY_QUERY = """
+    WITH daily AS (
+        SELECT day,
+               SUM(tx_count)::bigint AS tx_count,
+               SUM(volume)::bigint AS volume,
+               SUM(issued - burned) AS net_issued,
+               COALESCE(SUM(volume) FILTER (WHERE type = 'quest'), 0)::bigint AS quest_payouts,
+               COALESCE(SUM(volume) FILTER (WHERE type = 'shop'), 0)::bigint AS shop_spend,
+               COALESCE(SUM(volume) FILTER (WHERE type = 'salary'), 0)::bigint AS salaries
+        FROM economy_daily
+        GROUP BY day
+    ),
+    series AS (
+        SELECT day, tx_count, volume, quest_payouts, shop_spend, salaries,
+               (SUM(net_issued) OVER (ORDER BY day))::bigint AS money_supply
+        FROM daily
+    )
+    SELECT day, tx_count, volume, quest_payouts, shop_spend, salaries, money_supply
+    FROM series
+    WHERE day > (now() AT TIME ZONE 'Asia/Seoul')::date - %s
+    ORDER BY day
+"""
+
+def get_economy_daily(days=30, cache_ttl=60):
+    """
+    Daily (day, tx_count, volume, quest_payouts, shop_spend, salaries, money_supply)
+    for the last `days` days, read from the rollup in one query.
+    """
+    return select_query(ECONOMY_DAILY_QUERY, (days,), cache_ttl=cache_ttl)
+
+def get_economy_totals(cache_ttl=60):
+    """
+    Class-wide totals in one query: users by role with their balances, and
+    all-time transaction, post and comment counts.
+
+    Returns (role rows of (role, users, total, max, avg), transaction count, post count, comment count).
+    The role rows end with a (None, ...) row for everyone.
+    """
+    rows = select_query("""
+        SELECT role, COUNT(*), COALESCE(SUM(currency), 0), COALESCE(MAX(currency), 0), COALESCE(AVG(currency), 0),
+               (SELECT COALESCE(SUM(tx_count), 0)::bigint FROM economy_daily),
+               (SELECT COUNT(*) FROM blog_posts),
+               (SELECT COUNT(*) FROM blog_comments)
         FROM users
-        ORDER BY currency DESC
-    """)
-    return cur.fetchall() 
\ No newline at end of file
+        GROUP BY ROLLUP (role)
+        ORDER BY role NULLS LAST
+    """, cache_ttl=cache_ttl)
+    if not rows:
+        return [], 0, 0, 0
+    return [row[:5] for row in rows], rows[0][5], rows[0][6], rows[0][7]
+
+def rebuild_economy_rollups():
+    """Recompute economy_daily from the full transaction history (repair only; the trigger keeps it current)"""
+    conn = get_conn()
+    conn.autocommit = False
+    cur = conn.cursor()
+    try:
+        cur.execute("LOCK TABLE transactions IN SHARE MODE")
+        cur.execute("DELETE FROM economy_daily")
+        cur.execute("""
+            INSERT INTO economy_daily (day, type, tx_count, volume, issued, burned)
+            SELECT (t.created_at AT TIME ZONE 'Asia/Seoul')::date, t.type, COUNT(*), SUM(t.amount),
+                   COALESCE(SUM(t.amount) FILTER (WHERE l.ledgered AND t.from_user_id IS NULL AND t.to_user_id IS NOT NULL), 0),
+                   COALESCE(SUM(t.amount) FILTER (WHERE l.ledgered AND t.to_user_id IS NULL AND t.from_user_id IS NOT NULL), 0)
+            FROM transactions t
+            CROSS JOIN LATERAL (
+                SELECT EXISTS (SELECT 1 FROM ledger_entries e WHERE e.transaction_id = t.transaction_id) AS ledgered
+            ) l
+            GROUP BY 1, 2
+        """)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
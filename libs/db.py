@@ -2,49 +2,917 @@
 import streamlit as st
 import psycopg2
 import psycopg2.errors
+import psycopg2.extensions
+import re
+import sys
+import threading
 import time
+import os
+import weakref
+from collections import OrderedDict, deque
+
+def _connect(dsn=None):
+    """
+    풀에 넣을 새 psycopg2 연결을 생성합니다.
+    dsn 을 주면 그 주소로(읽기 전용 복제본 등), 없으면 st.secrets 의 기본 서버로 연결합니다.
+    """
+    if dsn:
+        server = {"dsn": dsn}
+    else:
+        server = {
+            "user": st.secrets["user"],
+            "password": st.secrets["password"],
+            "host": st.secrets["host"],
+            "port": st.secrets["port"],
+            "dbname": st.secrets["dbname"],
+        }
+    conn = psycopg2.connect(
+        **server,
+        # Give up on an unreachable server quickly; the circuit breaker handles retries
+        connect_timeout=int(st.secrets.get("connect_timeout", 3)),
+        # Connection timeout parameters
+        keepalives=1,
+        keepalives_idle=30,
+        keepalives_interval=10,
+        keepalives_count=5
+    )
+    conn.autocommit = True
+    return conn
+
+class PoolTimeout(Exception):
+    """풀에서 제한 시간 안에 연결을 빌리지 못했을 때 발생합니다."""
+
+class ConnectionPool:
+    """
+    프로세스 전체에서 공유하는 스레드 안전 연결 풀입니다.
+
+    - 오래 쉬었던 연결은 빌려주기 전에 SELECT 1 로 확인(pre-ping)합니다.
+    - max_lifetime 보다 오래된 연결이나 끊어진 연결은 폐기하고 새로 만듭니다.
+    - max_size 만큼 연결이 모두 사용 중이면 wait_timeout 초까지 기다립니다.
+    """
+
+    def __init__(self, connect, max_size=10, max_lifetime=1800, pre_ping_after=30, wait_timeout=10):
+        self._connect = connect
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.pre_ping_after = pre_ping_after
+        self.wait_timeout = wait_timeout
+
+        self._cond = threading.Condition(threading.RLock())
+        self._idle = []     # (conn, last_used) - 가장 최근에 반납된 연결이 마지막
+        self._born = {}     # id(conn) -> (created_at, generation)
+        self._size = 0
+        self._generation = 0
+        self.stats = {
+            "hits": 0,           # 유휴 연결 재사용
+            "misses": 0,         # 새 연결 생성
+            "waits": 0,          # 풀이 가득 차서 기다린 횟수
+            "wait_time": 0.0,    # 기다린 총 시간(초)
+            "timeouts": 0,       # 기다리다 실패한 횟수
+            "recycled": 0,       # 수명 초과/끊김으로 폐기한 연결
+            "ping_failures": 0,  # pre-ping 실패
+        }
+
+    def _discard(self, conn):
+        # Must be called with the lock held
+        self._size -= 1
+        self._born.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _expired(self, conn):
+        created_at, generation = self._born.get(id(conn), (0, -1))
+        return (
+            conn.closed
+            or generation != self._generation
+            or time.time() - created_at > self.max_lifetime
+        )
+
+    @staticmethod
+    def _ping(conn):
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            return True
+        except (psycopg2.InterfaceError, psycopg2.OperationalError):
+            return False
+
+    def acquire(self):
+        """
+        풀에서 연결을 빌립니다.
+
+        Returns:
+            psycopg2 연결 (사용 후 release()로 반납해야 함)
+        """
+        start = time.monotonic()
+        waited = False
+        while True:
+            entry = None
+            with self._cond:
+                while self._idle and entry is None:
+                    conn, last_used = self._idle.pop()
+                    if self._expired(conn):
+                        self._discard(conn)
+                        self.stats["recycled"] += 1
+                    else:
+                        entry = (conn, last_used)
+
+                if entry is None:
+                    if self._size < self.max_size:
+                        self._size += 1
+                    else:
+                        remaining = self.wait_timeout - (time.monotonic() - start)
+                        if remaining <= 0:
+                            self.stats["timeouts"] += 1
+                            raise PoolTimeout(f"{self.wait_timeout}초 안에 사용 가능한 연결이 없습니다.")
+                        if not waited:
+                            self.stats["waits"] += 1
+                            waited = True
+                        self._cond.wait(remaining)
+                        continue
+
+                if waited:
+                    self.stats["wait_time"] += time.monotonic() - start
+                    waited = False
+
+            # Connect and ping outside the lock so other threads are not blocked
+            if entry is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._born[id(conn)] = (time.time(), self._generation)
+                    self.stats["misses"] += 1
+                return conn
+
+            conn, last_used = entry
+            if time.time() - last_used > self.pre_ping_after and not self._ping(conn):
+                with self._cond:
+                    self.stats["ping_failures"] += 1
+                    self._discard(conn)
+                continue
+
+            with self._cond:
+                self.stats["hits"] += 1
+            return conn
+
+    def release(self, conn):
+        """
+        빌린 연결을 풀에 반납합니다. 진행 중인 트랜잭션은 롤백됩니다.
+        """
+        reusable = not conn.closed
+        if reusable:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                conn.autocommit = True
+            except Exception:
+                reusable = False
+
+        with self._cond:
+            if reusable and not self._expired(conn):
+                self._idle.append((conn, time.time()))
+            else:
+                self._discard(conn)
+                if not reusable:
+                    self.stats["recycled"] += 1
+            self._cond.notify()
+
+    def reset(self):
+        """
+        유휴 연결을 모두 닫습니다. 사용 중인 연결은 반납될 때 폐기됩니다.
+        """
+        with self._cond:
+            self._generation += 1
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+            self._cond.notify_all()
+
+    def status(self):
+        """
+        풀 상태와 통계를 반환합니다.
+        """
+        with self._cond:
+            idle = len(self._idle)
+            checkouts = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "size": self._size,
+                "idle": idle,
+                "in_use": self._size - idle,
+                "max_size": self.max_size,
+                "hit_rate": self.stats["hits"] / checkouts if checkouts else 0.0,
+            }
+
+class PooledCursor(psycopg2.extensions.cursor):
+    """
+    커서가 살아 있는 동안 빌린 연결이 풀에 반납되지 않도록 소유 객체를 붙잡아 둡니다.
+    쓰기 쿼리를 실행하면 해당 테이블을 읽는 캐시 항목을 무효화합니다.
+    """
+    _owner = None
+    _stats = None
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = super().execute(query, vars)
+            failed = False
+        finally:
+            text = _query_text(self, query)
+            (self._stats or get_query_stats()).record(text, time.perf_counter() - start, self.rowcount, failed)
+        self._track_writes(text)
+        return result
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = super().executemany(query, vars_list)
+            failed = False
+        finally:
+            text = _query_text(self, query)
+            (self._stats or get_query_stats()).record(text, time.perf_counter() - start, self.rowcount, failed)
+        self._track_writes(text)
+        return result
+
+    def _track_writes(self, text):
+        tables = _written_tables(text)
+        if tables:
+            invalidate_tables(tables)
+            # Inside an open transaction other sessions still see the old rows,
+            # so invalidate once more when it commits
+            if self._owner is not None and self.connection.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                self._owner._pending_tables.update(tables)
+            else:
+                _note_write(self.connection)
+        elif self._owner is not None and _COMMIT_RE.match(text):
+            self._owner._flush_pending_tables()
+
+class PooledConnection:
+    """
+    풀에서 빌린 psycopg2 연결을 감싸는 객체입니다.
+
+    close()를 호출하거나 객체가 사라지면(페이지 스크립트 종료 등)
+    실제 연결을 닫지 않고 풀에 반납합니다.
+    """
+
+    def __init__(self, pool, conn):
+        object.__setattr__(self, "_conn", conn)
+        finalizer = weakref.finalize(self, pool.release, conn)
+        finalizer.atexit = False
+        object.__setattr__(self, "_finalizer", finalizer)
+        object.__setattr__(self, "_pending_tables", set())
+        # Resolved once per checkout instead of on every statement
+        object.__setattr__(self, "_stats", get_query_stats())
+
+    def cursor(self, *args, **kwargs):
+        if not self._finalizer.alive:
+            raise psycopg2.InterfaceError("connection already returned to pool")
+        kwargs.setdefault("cursor_factory", PooledCursor)
+        cur = self._conn.cursor(*args, **kwargs)
+        if isinstance(cur, PooledCursor):
+            cur._owner = self
+            cur._stats = self._stats
+        return cur
+
+    def commit(self):
+        self._conn.commit()
+        self._flush_pending_tables()
+
+    def _flush_pending_tables(self):
+        if self._pending_tables:
+            invalidate_tables(self._pending_tables)
+            self._pending_tables.clear()
+            _note_write(self._conn)
+
+    def close(self):
+        self._finalizer()
+
+    @property
+    def closed(self):
+        return self._conn.closed if self._finalizer.alive else 1
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+def _new_pool(dsn=None, breaker_name="primary"):
+    from libs.db_utils import get_circuit_breaker
+    breaker = get_circuit_breaker(breaker_name)
+    return ConnectionPool(
+        lambda: breaker.call(_connect, dsn),
+        max_size=int(st.secrets.get("pool_max_size", 10)),
+        max_lifetime=int(st.secrets.get("pool_max_lifetime", 1800)),
+        pre_ping_after=int(st.secrets.get("pool_pre_ping_after", 30)),
+        wait_timeout=float(st.secrets.get("pool_wait_timeout", 10)),
+    )
+
+@st.cache_resource
+def get_pool():
+    """
+    프로세스 전체에서 공유하는 연결 풀을 반환합니다.
+    st.secrets 의 pool_* 값으로 크기와 수명을 조정할 수 있습니다.
+    새 연결은 회로 차단기를 거쳐 만들어지므로, 차단기가 열려 있으면 즉시 실패합니다.
+    """
+    return _new_pool()
 
-# Remove cache to prevent connection from being reused
 def get_conn():
     """
-    데이터베이스 연결을 가져오거나 새로 생성합니다.
-    항상 새로운 연결을 반환하여 "connection already closed" 오류를 방지합니다.
+    연결 풀에서 데이터베이스 연결을 빌려옵니다.
+    close()를 호출하면 연결이 닫히지 않고 풀에 반납됩니다.
     """
     try:
-        # Always create a brand new connection
-        conn = psycopg2.connect(
-            user=st.secrets["user"],
-            password=st.secrets["password"],
-            host=st.secrets["host"],
-            port=st.secrets["port"],
-            dbname=st.secrets["dbname"],
-            # Connection timeout parameters
-            keepalives=1,
-            keepalives_idle=30,
-            keepalives_interval=10,
-            keepalives_count=5
-        )
-        conn.autocommit = True
-        return conn
+        ensure_schema()
+        pool = get_pool()
+        return PooledConnection(pool, pool.acquire())
     except Exception as e:
         st.error(f"데이터베이스 연결 오류: {str(e)}")
         raise e
 
-def db_operation(operation_func, error_msg="데이터베이스 작업 중 오류가 발생했습니다"):
+def try_get_conn():
+    """
+    연결 풀에서 연결을 빌려오되, 실패해도 예외 대신 오류 메시지를 반환합니다.
+
+    Returns:
+        (연결 또는 None, 오류 메시지 또는 None)
+    """
+    try:
+        ensure_schema()
+        pool = get_pool()
+        return PooledConnection(pool, pool.acquire()), None
+    except Exception as e:
+        return None, str(e)
+
+def pool_stats():
+    """
+    연결 풀의 hit/miss/wait 통계를 반환합니다.
+    """
+    return get_pool().status()
+
+# ---------------------------------------------------------------------------
+# Read replica routing
+# ---------------------------------------------------------------------------
+
+def _parse_lsn(text):
+    # pg_lsn text form is two hex halves, e.g. "16/B374D848"
+    high, low = text.split("/")
+    return (int(high, 16) << 32) | int(low, 16)
+
+class ReplicaRouter:
+    """
+    읽기 쿼리를 읽기 전용 복제본으로 보내는 라우터입니다.
+
+    쓰기를 한 세션은 복제본이 그 쓰기의 WAL 위치(LSN)까지 재생하기 전까지
+    기본 서버에서 읽습니다(read-your-writes). 복제본에 연결할 수 없으면
+    기본 서버로 대신 읽습니다.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._lock = threading.Lock()
+        self.replayed_lsn = 0      # 복제본에서 마지막으로 확인한 재생 위치
+        self.last_write_lsn = 0    # 이 프로세스에서 마지막으로 커밋된 쓰기의 위치
+        self.stats = {
+            "replica_reads": 0,
+            "lag_fallbacks": 0,    # 복제 지연 때문에 기본 서버로 읽은 횟수
+            "error_fallbacks": 0,  # 복제본 연결 실패로 기본 서버로 읽은 횟수
+            "lag_checks": 0,
+        }
+
+    def note_write(self, lsn):
+        with self._lock:
+            self.last_write_lsn = max(self.last_write_lsn, lsn)
+
+    def _refresh_replayed(self, conn):
+        cur = conn.cursor()
+        cur.execute("SELECT pg_last_wal_replay_lsn()::text")
+        replayed = cur.fetchone()[0]
+        cur.close()
+        with self._lock:
+            self.stats["lag_checks"] += 1
+            # NULL means the server is not a standby, so its LSNs say nothing
+            # about our writes and the caller keeps reading from the primary
+            if replayed is not None:
+                self.replayed_lsn = max(self.replayed_lsn, _parse_lsn(replayed))
+
+    def acquire(self, min_lsn=0):
+        """
+        min_lsn 까지 재생한 복제본 연결을 빌려옵니다. 그럴 수 없으면 None 을 반환합니다.
+        """
+        try:
+            conn = self.pool.acquire()
+        except Exception:
+            with self._lock:
+                self.stats["error_fallbacks"] += 1
+            return None
+
+        try:
+            if min_lsn > self.replayed_lsn:
+                self._refresh_replayed(conn)
+        except Exception:
+            self.pool.release(conn)
+            with self._lock:
+                self.stats["error_fallbacks"] += 1
+            return None
+
+        with self._lock:
+            if min_lsn > self.replayed_lsn:
+                self.stats["lag_fallbacks"] += 1
+                caught_up = False
+            else:
+                self.stats["replica_reads"] += 1
+                caught_up = True
+        if not caught_up:
+            self.pool.release(conn)
+            return None
+        return PooledConnection(self.pool, conn)
+
+    def status(self):
+        with self._lock:
+            return {
+                **self.stats,
+                "replayed_lsn": self.replayed_lsn,
+                "last_write_lsn": self.last_write_lsn,
+                "pool": self.pool.status(),
+            }
+
+@st.cache_resource
+def get_replica_router():
+    """
+    st.secrets 에 replica_dsn 이 있으면 복제본 라우터를, 없으면 None 을 반환합니다.
+    """
+    dsn = st.secrets.get("replica_dsn")
+    if not dsn:
+        return None
+    return ReplicaRouter(_new_pool(dsn, "replica"))
+
+def _session_write_lsn():
+    try:
+        return st.session_state.get("db_write_lsn", 0)
+    except Exception:
+        # No script run context (background thread)
+        return 0
+
+def _note_write(conn):
+    """
+    커밋된 쓰기의 WAL 위치를 세션과 라우터에 기록합니다. 복제본이 없으면 아무것도 하지 않습니다.
+    """
+    router = get_replica_router()
+    if router is None or conn.closed:
+        return
+    try:
+        cur = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+        cur.execute("SELECT pg_current_wal_lsn()::text")
+        lsn = _parse_lsn(cur.fetchone()[0])
+        cur.close()
+        if not conn.autocommit:
+            # Do not leave the caller inside a transaction opened by this probe
+            conn.rollback()
+    except psycopg2.Error:
+        return
+    router.note_write(lsn)
+    try:
+        st.session_state["db_write_lsn"] = max(lsn, st.session_state.get("db_write_lsn", 0))
+    except Exception:
+        pass
+
+def get_read_conn(cached=False):
+    """
+    읽기용 연결을 빌려옵니다. 복제본이 설정되어 있고 충분히 따라와 있으면 복제본,
+    아니면 기본 서버 연결을 반환합니다.
+
+    Args:
+        cached: 결과를 프로세스 캐시에 넣을 읽기면 True.
+                이 프로세스의 모든 쓰기가 반영된 복제본에서만 읽습니다.
+    """
+    router = get_replica_router()
+    if router is not None:
+        ensure_schema()
+        session_lsn = _session_write_lsn()
+        min_lsn = max(session_lsn, router.last_write_lsn) if cached else session_lsn
+        conn = router.acquire(min_lsn)
+        if conn is not None:
+            if session_lsn and session_lsn <= router.replayed_lsn:
+                # The replica has caught up with this session; stop checking
+                try:
+                    del st.session_state["db_write_lsn"]
+                except Exception:
+                    pass
+            return conn
+    return get_conn()
+
+# ---------------------------------------------------------------------------
+# Query result cache
+# ---------------------------------------------------------------------------
+
+_READ_TABLE_RE = re.compile(r'\b(?:FROM|JOIN)\s+(?:ONLY\s+)?([A-Za-z_][\w.]*)', re.IGNORECASE)
+_WRITE_TABLE_RE = re.compile(
+    r'\b(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM|TRUNCATE(?:\s+TABLE)?|ALTER\s+TABLE|DROP\s+TABLE(?:\s+IF\s+EXISTS)?)'
+    r'\s+(?:ONLY\s+)?(?!SET\b)([A-Za-z_][\w.]*)',
+    re.IGNORECASE
+)
+# Row-locking clauses (SELECT ... FOR UPDATE OF t) are reads, not writes to a table named "of"
+_LOCKING_CLAUSE_RE = re.compile(r'\bFOR\s+(?:NO\s+KEY\s+)?UPDATE\b', re.IGNORECASE)
+_COMMIT_RE = re.compile(r'\s*(?:COMMIT|END)\b', re.IGNORECASE)
+
+def _query_text(cur, query):
+    if isinstance(query, str):
+        return query
+    if isinstance(query, bytes):
+        return query.decode("utf-8", "replace")
+    try:
+        return query.as_string(cur)
+    except Exception:
+        return str(query)
+
+def _table_name(name):
+    name = name.lower()
+    return name[len("public."):] if name.startswith("public.") else name
+
+def _read_tables(query):
+    return {_table_name(t) for t in _READ_TABLE_RE.findall(query)}
+
+# Tables that triggers write when the key table is written
+TRIGGER_WRITES = {
+    "transactions": {"economy_daily"},
+}
+
+def _written_tables(query):
+    tables = {_table_name(t) for t in _WRITE_TABLE_RE.findall(_LOCKING_CLAUSE_RE.sub(" ", query))}
+    for table in list(tables):
+        tables |= TRIGGER_WRITES.get(table, set())
+    return tables
+
+def _estimate_size(value):
+    # Shallow estimate of a fetchall()/fetchone() result
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+class QueryCache:
+    """
+    (쿼리, 파라미터) 를 키로 하는 SELECT 결과 캐시입니다.
+
+    - 항목마다 TTL 을 가지며, 만료된 항목은 조회 시 버립니다.
+    - 전체 크기가 max_bytes 를 넘으면 가장 오래 사용하지 않은 항목부터 제거합니다(LRU).
+    - 각 항목은 쿼리가 읽는 테이블로 태그되어, 해당 테이블에 쓰기가 일어나면 무효화됩니다.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, expires_at, tables, size)
+        self._by_table = {}            # table -> set(key)
+        self._versions = {}            # table -> 무효화 횟수
+        self._bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def _remove(self, key):
+        # Must be called with the lock held
+        value, expires_at, tables, size = self._entries.pop(key)
+        self._bytes -= size
+        for table in tables:
+            keys = self._by_table.get(table)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+    def get(self, key):
+        """
+        Returns:
+            (bool, 결과): 캐시 적중 여부와 저장된 결과
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return False, None
+            if entry[1] < time.monotonic():
+                self._remove(key)
+                self.stats["misses"] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return True, entry[0]
+
+    def versions(self, tables):
+        """
+        쿼리 실행 전에 호출해 두면, 실행 도중 무효화된 결과를 put() 이 버릴 수 있습니다.
+        """
+        with self._lock:
+            return {table: self._versions.get(table, 0) for table in tables}
+
+    def put(self, key, value, ttl, tables, versions=None):
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if versions and any(self._versions.get(t, 0) != v for t, v in versions.items()):
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + ttl, tables, size)
+            self._bytes += size
+            for table in tables:
+                self._by_table.setdefault(table, set()).add(key)
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def invalidate(self, tables):
+        with self._lock:
+            for table in tables:
+                table = _table_name(table)
+                self._versions[table] = self._versions.get(table, 0) + 1
+                for key in list(self._by_table.get(table, ())):
+                    self._remove(key)
+                    self.stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            self._bytes = 0
+
+    def status(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+            }
+
+@st.cache_resource
+def get_query_cache():
+    """
+    프로세스 전체에서 공유하는 쿼리 결과 캐시를 반환합니다.
+    """
+    return QueryCache(max_bytes=int(st.secrets.get("query_cache_max_bytes", 32 * 1024 * 1024)))
+
+def invalidate_tables(tables):
+    """
+    주어진 테이블을 읽는 캐시 항목을 모두 무효화합니다.
+    """
+    get_query_cache().invalidate(tables)
+
+def _cache_key(query, params, fetch_all):
+    if isinstance(params, list):
+        params = tuple(params)
+    elif isinstance(params, dict):
+        params = tuple(sorted(params.items()))
+    key = (query, params, fetch_all)
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+# ---------------------------------------------------------------------------
+# Request coalescing
+# ---------------------------------------------------------------------------
+
+class _Flight:
+    __slots__ = ("done", "versions", "result", "failed")
+
+    def __init__(self, versions):
+        self.done = threading.Event()
+        self.versions = versions
+        self.result = None
+        self.failed = True
+
+class SingleFlight:
+    """
+    같은 (쿼리, 파라미터)를 동시에 요청한 호출들이 한 번의 실행 결과를 나눠 갖게 합니다.
+
+    실행이 시작된 뒤 관련 테이블에 쓰기가 일어났다면(캐시 테이블 버전이 다르면)
+    그 실행에 합류하지 않고 새로 실행하므로, 쓰기 이후의 읽기가 이전 결과를 받지 않습니다.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.stats = {
+            "executions": 0,  # 실제로 실행한 쿼리 수
+            "shared": 0,      # 다른 호출의 결과를 받아 아낀 실행 수
+            "retried": 0,     # 먼저 실행한 호출이 실패해 직접 다시 실행한 수
+        }
+
+    def do(self, key, versions, func):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None or flight.versions != versions
+            if leader:
+                flight = _Flight(versions)
+                self._flights[key] = flight
+                self.stats["executions"] += 1
+
+        if not leader:
+            flight.done.wait()
+            with self._lock:
+                self.stats["shared" if not flight.failed else "retried"] += 1
+            if not flight.failed:
+                return flight.result
+            # The leader's error was reported in its own session; try ourselves
+            return func()
+
+        try:
+            flight.result = func()
+            flight.failed = False
+            return flight.result
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.done.set()
+
+    def status(self):
+        with self._lock:
+            requests = self.stats["executions"] + self.stats["shared"]
+            return {
+                **self.stats,
+                "in_flight": len(self._flights),
+                "saved_rate": self.stats["shared"] / requests if requests else 0.0,
+            }
+
+@st.cache_resource
+def get_singleflight():
+    """
+    프로세스 전체에서 공유하는 요청 병합(singleflight) 객체를 반환합니다.
+    """
+    return SingleFlight()
+
+# ---------------------------------------------------------------------------
+# Query instrumentation
+# ---------------------------------------------------------------------------
+
+_DB_MODULE_FILE = os.path.abspath(__file__)
+_WHITESPACE_RE = re.compile(r'\s+')
+
+def _normalize_statement(text, limit=200):
+    text = _WHITESPACE_RE.sub(" ", text).strip()
+    return text if len(text) <= limit else text[:limit] + "…"
+
+def _call_site():
+    """
+    쿼리를 실행한 페이지, 함수, 그리고 이번 실행(rerun)을 구분하는 키를 찾습니다.
+    """
+    frame = sys._getframe(2)
+    function = None
+    page = None
+    run_key = None
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if function is None and os.path.abspath(filename) != _DB_MODULE_FILE:
+            function = f"{os.path.basename(filename)}:{frame.f_code.co_name}"
+        base = os.path.basename(filename)
+        if base == "app.py" or os.path.basename(os.path.dirname(filename)) == "pages":
+            page = base
+            # Streamlit executes the page with a fresh globals dict on every rerun
+            run_key = id(frame.f_globals)
+        frame = frame.f_back
+    return page or "(background)", function or "(unknown)", run_key
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+class QueryStats:
+    """
+    실행된 쿼리의 지연 시간과 반환 행 수를 고정 크기 링 버퍼에 기록합니다.
+
+    호출 스택을 훑는 비용이 대부분의 쿼리보다 크므로, 쿼리를 실행한 페이지와 함수는
+    slow_threshold(초) 이상 걸린 쿼리에만 기록합니다. detail 을 켜면 모든 쿼리에 기록하고
+    페이지 실행(rerun)마다 쿼리 수와 총 시간도 따로 집계합니다.
+    """
+
+    def __init__(self, capacity=5000, max_runs=500, slow_threshold=0.1, detail=False):
+        self.slow_threshold = slow_threshold
+        self.detail = detail
+        self._lock = threading.Lock()
+        self._records = deque(maxlen=capacity)  # (statement, elapsed, rows, page, function, failed)
+        self._runs = OrderedDict()               # run_key -> [page, queries, elapsed]
+        self.max_runs = max_runs
+
+    def record(self, text, elapsed, rows, failed=False):
+        if self.detail or elapsed >= self.slow_threshold:
+            page, function, run_key = _call_site()
+        else:
+            page = function = run_key = None
+        statement = _normalize_statement(text)
+        with self._lock:
+            self._records.append((statement, elapsed, rows, page, function, failed))
+            if run_key is not None:
+                run = self._runs.get(run_key)
+                if run is None or run[0] != page:
+                    run = self._runs[run_key] = [page, 0, 0.0]
+                    while len(self._runs) > self.max_runs:
+                        self._runs.popitem(last=False)
+                run[1] += 1
+                run[2] += elapsed
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._runs.clear()
+
+    def summary(self, top_n=10):
+        """
+        Returns:
+            dict: 전체 백분위수, 느린 쿼리/자주 실행된 쿼리 상위 N개, 페이지별 실행당 쿼리 수
+        """
+        with self._lock:
+            records = list(self._records)
+            runs = list(self._runs.values())
+
+        latencies = sorted(r[1] for r in records)
+        by_statement = {}
+        for statement, elapsed, rows, page, function, failed in records:
+            entry = by_statement.setdefault(statement, {
+                "statement": statement, "count": 0, "total": 0.0, "max": 0.0,
+                "rows": 0, "errors": 0, "latencies": [], "callers": set(),
+            })
+            entry["count"] += 1
+            entry["total"] += elapsed
+            entry["max"] = max(entry["max"], elapsed)
+            entry["rows"] += max(rows, 0)
+            entry["errors"] += failed
+            entry["latencies"].append(elapsed)
+            if page is not None:
+                entry["callers"].add(f"{page} / {function}")
+
+        statements = []
+        for entry in by_statement.values():
+            entry_latencies = sorted(entry.pop("latencies"))
+            entry["avg"] = entry["total"] / entry["count"]
+            entry["p95"] = _percentile(entry_latencies, 0.95)
+            entry["callers"] = ", ".join(sorted(entry["callers"]))
+            statements.append(entry)
+
+        pages = {}
+        for page, queries, elapsed in runs:
+            entry = pages.setdefault(page, {"page": page, "runs": 0, "queries": 0, "elapsed": 0.0})
+            entry["runs"] += 1
+            entry["queries"] += queries
+            entry["elapsed"] += elapsed
+        for entry in pages.values():
+            entry["queries_per_run"] = entry["queries"] / entry["runs"]
+            entry["ms_per_run"] = entry["elapsed"] / entry["runs"] * 1000
+
+        return {
+            "count": len(records),
+            "p50": _percentile(latencies, 0.50),
+            "p95": _percentile(latencies, 0.95),
+            "p99": _percentile(latencies, 0.99),
+            "slowest": sorted(statements, key=lambda e: e["p95"], reverse=True)[:top_n],
+            "most_frequent": sorted(statements, key=lambda e: e["count"], reverse=True)[:top_n],
+            "pages": sorted(pages.values(), key=lambda e: e["queries_per_run"], reverse=True),
+        }
+
+@st.cache_resource
+def get_query_stats():
+    """
+    프로세스 전체에서 공유하는 쿼리 계측 버퍼를 반환합니다.
+    """
+    return QueryStats(
+        capacity=int(st.secrets.get("query_stats_capacity", 5000)),
+        slow_threshold=float(st.secrets.get("slow_query_ms", 100)) / 1000,
+        detail=bool(st.secrets.get("query_stats_detail", False)),
+    )
+
+def db_operation(operation_func, error_msg="데이터베이스 작업 중 오류가 발생했습니다", read_only=False, cached=False):
     """
     데이터베이스 작업을 안전하게 수행하는 헬퍼 함수입니다.
     
     Args:
         operation_func: 실행할 함수 (conn 인자를 받아야 함)
         error_msg: 오류 발생 시 표시할 메시지
+        read_only: True면 복제본으로 보낼 수 있는 읽기 작업입니다
+        cached: 결과가 프로세스 캐시에 들어가는 읽기인지 여부 (get_read_conn 참고)
     
     Returns:
         작업 결과
     """
     conn = None
     try:
-        # Get a fresh connection
-        conn = get_conn()
+        # Borrow a pooled connection (reads may go to the replica)
+        conn = get_read_conn(cached) if read_only else get_conn()
         # Execute the operation
         return operation_func(conn)
     except Exception as e:
@@ -56,14 +924,14 @@ def db_operation(operation_func, error_msg="데이터베이스 작업 중 오류
                 pass
         raise e
     finally:
-        # Always close the connection
+        # Always return the connection to the pool
         if conn:
             try:
                 conn.close()
             except:
                 pass
 
-def select_query(query, params=None, fetch_all=True):
+def select_query(query, params=None, fetch_all=True, cache_ttl=None):
     """
     SELECT 쿼리를 실행하고 결과를 반환합니다.
     
@@ -71,10 +939,24 @@ def select_query(query, params=None, fetch_all=True):
         query: SQL 쿼리
         params: 쿼리 파라미터
         fetch_all: True면 fetchall(), False면 fetchone() 호출
+        cache_ttl: 지정하면 결과를 그 시간(초) 동안 캐시합니다.
+                   쿼리가 읽는 테이블에 쓰기가 일어나면 즉시 무효화됩니다.
+    
+    같은 쿼리와 파라미터를 동시에 요청하면 한 번만 실행하고 결과를 나눠 갖습니다.
     
     Returns:
         쿼리 결과
     """
+    key = _cache_key(query, params, fetch_all)
+    cache = get_query_cache()
+    if key is not None:
+        if cache_ttl:
+            found, result = cache.get(key)
+            if found:
+                return list(result) if fetch_all else result
+        tables = _read_tables(query)
+        versions = cache.versions(tables)
+
     def execute(conn):
         cur = conn.cursor()
         cur.execute(query, params)
@@ -82,7 +964,20 @@ def select_query(query, params=None, fetch_all=True):
         cur.close()
         return result
     
-    return db_operation(execute, f"쿼리 실행 오류: {query}")
+    def run():
+        result = db_operation(execute, f"쿼리 실행 오류: {query}", read_only=True, cached=bool(cache_ttl))
+        if cache_ttl:
+            cache.put(key, result, cache_ttl, tables, versions)
+        return result
+    
+    if key is None:
+        return db_operation(execute, f"쿼리 실행 오류: {query}", read_only=True)
+    
+    # Identical concurrent reads share one execution. Sessions waiting on their
+    # own writes to reach the replica only share with each other.
+    flight_key = (key, bool(cache_ttl), _session_write_lsn() if get_replica_router() is not None else 0)
+    result = get_singleflight().do(flight_key, tuple(sorted(versions.items())), run)
+    return list(result) if fetch_all else result
 
 def execute_query(query, params=None):
     """
@@ -104,23 +999,560 @@ def execute_query(query, params=None):
     
     return db_operation(execute, f"쿼리 실행 오류: {query}")
 
+# ---------------------------------------------------------------------------
+# Schema migrations
+# ---------------------------------------------------------------------------
+
+# Arbitrary key for pg_advisory_xact_lock so only one process migrates at a time
+SCHEMA_LOCK_ID = 5090001
+
+# (version, description, statements) - append new steps at the end, never edit
+# an applied one. Every statement must be idempotent so that databases created
+# by the old init_tables() upgrade cleanly.
+MIGRATIONS = [
+    (1, "initial schema", [
+        # Users 테이블 생성 (with roles, currency, and password)
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id SERIAL PRIMARY KEY,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL CHECK (role IN ('teacher', 'student', '제작자', '일반학생')),
+            currency INTEGER DEFAULT 0,
+            job_id INTEGER,
+            bio TEXT DEFAULT '',
+            avatar_url TEXT DEFAULT '',
+            created_at TIMESTAMPTZ DEFAULT now()
+        );
+        """,
+        # Jobs 테이블 생성
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            salary INTEGER NOT NULL,
+            description TEXT,
+            created_by INTEGER REFERENCES users(user_id),
+            created_at TIMESTAMPTZ DEFAULT now()
+        );
+        """,
+        # Quests/Missions 테이블 생성
+        """
+        CREATE TABLE IF NOT EXISTS quests (
+            quest_id SERIAL PRIMARY KEY,
+            title TEXT NOT NULL,
+            description TEXT,
+            reward INTEGER NOT NULL,
+            created_by INTEGER REFERENCES users(user_id),
+            is_daily BOOLEAN DEFAULT false,
+            created_at TIMESTAMPTZ DEFAULT now()
+        );
+        """,
+        # Quest Completions 테이블 생성
+        """
+        CREATE TABLE IF NOT EXISTS quest_completions (
+            completion_id SERIAL PRIMARY KEY,
+            quest_id INTEGER REFERENCES quests(quest_id),
+            user_id INTEGER REFERENCES users(user_id),
+            completed_at TIMESTAMPTZ DEFAULT now(),
+            verified_by INTEGER REFERENCES users(user_id),
+            verified_at TIMESTAMPTZ
+        );
+        """,
+        # Transactions 테이블 생성
+        """
+        CREATE TABLE IF NOT EXISTS transactions (
+            transaction_id SERIAL PRIMARY KEY,
+            from_user_id INTEGER REFERENCES users(user_id),
+            to_user_id INTEGER REFERENCES users(user_id),
+            amount INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            description TEXT,
+            created_by INTEGER REFERENCES users(user_id),
+            created_at TIMESTAMPTZ DEFAULT now()
+        );
+        """,
+        # Shop Items Table (for profile items)
+        """
+        CREATE TABLE IF NOT EXISTS shop_items (
+            item_id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            description TEXT NOT NULL,
+            type TEXT NOT NULL CHECK (type IN ('avatar', 'badge', 'background', 'font', 'color')),
+            price INTEGER NOT NULL,
+            image_url TEXT,
+            created_at TIMESTAMPTZ DEFAULT now()
+        );
+        """,
+        # User Items Table (inventory of purchased items)
+        """
+        CREATE TABLE IF NOT EXISTS user_items (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(user_id),
+            item_id INTEGER REFERENCES shop_items(item_id),
+            is_equipped BOOLEAN DEFAULT false,
+            is_active BOOLEAN DEFAULT true,
+            purchased_at TIMESTAMPTZ DEFAULT now()
+        );
+        """,
+        # Blog Posts Table
+        """
+        CREATE TABLE IF NOT EXISTS blog_posts (
+            post_id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(user_id),
+            title TEXT NOT NULL,
+            content TEXT NOT NULL,
+            image_urls TEXT,
+            created_at TIMESTAMPTZ DEFAULT now(),
+            updated_at TIMESTAMPTZ DEFAULT now()
+        );
+        """,
+        # Blog Comments Table
+        """
+        CREATE TABLE IF NOT EXISTS blog_comments (
+            comment_id SERIAL PRIMARY KEY,
+            post_id INTEGER REFERENCES blog_posts(post_id),
+            user_id INTEGER REFERENCES users(user_id),
+            content TEXT NOT NULL,
+            created_at TIMESTAMPTZ DEFAULT now()
+        );
+        """,
+        # Kicked Users Table
+        """
+        CREATE TABLE IF NOT EXISTS kicked_users (
+            username TEXT PRIMARY KEY,
+            reason TEXT NOT NULL,
+            kicked_at TIMESTAMPTZ DEFAULT now()
+        );
+        """,
+        # Refunds Table
+        """
+        CREATE TABLE IF NOT EXISTS refunds (
+            refund_id SERIAL PRIMARY KEY,
+            user_item_id INTEGER REFERENCES user_items(id),
+            user_id INTEGER REFERENCES users(user_id),
+            item_id INTEGER REFERENCES shop_items(item_id),
+            amount INTEGER NOT NULL,
+            reason TEXT,
+            processed_by INTEGER REFERENCES users(user_id),
+            created_at TIMESTAMPTZ DEFAULT now()
+        );
+        """,
+        # Notices Table
+        """
+        CREATE TABLE IF NOT EXISTS notices (
+            notice_id SERIAL PRIMARY KEY,
+            title TEXT NOT NULL,
+            content TEXT NOT NULL,
+            heading_level INTEGER NOT NULL CHECK (heading_level BETWEEN 1 AND 6),
+            is_active BOOLEAN DEFAULT true,
+            created_by INTEGER REFERENCES users(user_id),
+            created_at TIMESTAMPTZ DEFAULT now(),
+            updated_at TIMESTAMPTZ DEFAULT now()
+        );
+        """,
+        # Suggestions Table
+        """
+        CREATE TABLE IF NOT EXISTS suggestions (
+            id SERIAL PRIMARY KEY,
+            content TEXT NOT NULL,
+            username TEXT NOT NULL,
+            user_id INTEGER REFERENCES users(user_id),
+            timestamp TIMESTAMPTZ DEFAULT now(),
+            status TEXT DEFAULT 'pending'
+        );
+        """,
+        # Stocks Table
+        """
+        CREATE TABLE IF NOT EXISTS stocks (
+            stock_id SERIAL PRIMARY KEY,
+            symbol TEXT UNIQUE NOT NULL,
+            name TEXT NOT NULL,
+            current_price DECIMAL(10, 2) NOT NULL,
+            last_updated TIMESTAMPTZ DEFAULT now(),
+            created_by INTEGER REFERENCES users(user_id),
+            created_at TIMESTAMPTZ DEFAULT now()
+        );
+        """,
+        # Stock Portfolios Table
+        """
+        CREATE TABLE IF NOT EXISTS stock_portfolios (
+            portfolio_id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(user_id),
+            stock_id INTEGER REFERENCES stocks(stock_id),
+            quantity INTEGER NOT NULL,
+            avg_purchase_price DECIMAL(10, 2) NOT NULL,
+            created_at TIMESTAMPTZ DEFAULT now(),
+            updated_at TIMESTAMPTZ DEFAULT now(),
+            UNIQUE(user_id, stock_id)
+        );
+        """,
+        # Stock Transactions Table
+        """
+        CREATE TABLE IF NOT EXISTS stock_transactions (
+            transaction_id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(user_id),
+            stock_id INTEGER REFERENCES stocks(stock_id),
+            quantity INTEGER NOT NULL,
+            price DECIMAL(10, 2) NOT NULL,
+            type TEXT NOT NULL CHECK (type IN ('buy', 'sell')),
+            created_at TIMESTAMPTZ DEFAULT now()
+        );
+        """,
+    ]),
+    (2, "user_items.is_active for refunds", [
+        "ALTER TABLE user_items ADD COLUMN IF NOT EXISTS is_active BOOLEAN DEFAULT true",
+    ]),
+    (3, "users.bio and users.avatar_url for profiles", [
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS bio TEXT DEFAULT ''",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS avatar_url TEXT DEFAULT ''",
+    ]),
+    (4, "secondary indexes for hot queries", [
+        # Profile history (from OR to, newest first) and the admin explorer
+        "CREATE INDEX IF NOT EXISTS transactions_from_user_idx ON transactions (from_user_id, created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS transactions_to_user_idx ON transactions (to_user_id, created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS transactions_created_at_idx ON transactions (created_at DESC)",
+        # Comments per post
+        "CREATE INDEX IF NOT EXISTS blog_comments_post_idx ON blog_comments (post_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS blog_posts_created_at_idx ON blog_posts (created_at DESC)",
+        # Inventory and equipped items
+        "CREATE INDEX IF NOT EXISTS user_items_user_idx ON user_items (user_id, purchased_at DESC)",
+        "CREATE INDEX IF NOT EXISTS user_items_equipped_idx ON user_items (user_id) WHERE is_equipped",
+        # Quest NOT IN anti-join and the pending verification list
+        "CREATE INDEX IF NOT EXISTS quest_completions_user_quest_idx ON quest_completions (user_id, quest_id)",
+        "CREATE INDEX IF NOT EXISTS quest_completions_pending_idx ON quest_completions (completed_at) WHERE verified_at IS NULL",
+        # Active notices on every home page render
+        "CREATE INDEX IF NOT EXISTS notices_active_idx ON notices (created_at DESC) WHERE is_active",
+        # Payroll join and rankings
+        "CREATE INDEX IF NOT EXISTS users_job_idx ON users (job_id) WHERE job_id IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS users_currency_idx ON users (currency DESC)",
+        "CREATE INDEX IF NOT EXISTS stock_transactions_user_idx ON stock_transactions (user_id, created_at DESC)",
+    ]),
+    (5, "salary_runs for idempotent payroll", [
+        # One row per pay period; the unique key makes a second run a no-op
+        """
+        CREATE TABLE IF NOT EXISTS salary_runs (
+            run_id SERIAL PRIMARY KEY,
+            pay_period TEXT UNIQUE NOT NULL,
+            paid_users INTEGER NOT NULL DEFAULT 0,
+            total_amount INTEGER NOT NULL DEFAULT 0,
+            created_by INTEGER REFERENCES users(user_id),
+            created_at TIMESTAMPTZ DEFAULT now()
+        )
+        """,
+    ]),
+    (6, "double-entry currency ledger with balance snapshots", [
+        # Two legs per transaction that sum to zero; user_id NULL is the class treasury
+        """
+        CREATE TABLE IF NOT EXISTS ledger_entries (
+            entry_id BIGSERIAL PRIMARY KEY,
+            transaction_id INTEGER NOT NULL REFERENCES transactions(transaction_id),
+            user_id INTEGER REFERENCES users(user_id),
+            amount INTEGER NOT NULL,
+            created_at TIMESTAMPTZ DEFAULT now()
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ledger_entries_user_idx ON ledger_entries (user_id, entry_id)",
+        "CREATE INDEX IF NOT EXISTS ledger_entries_transaction_idx ON ledger_entries (transaction_id)",
+        # Entries are facts; corrections are new entries
+        """
+        CREATE OR REPLACE FUNCTION ledger_entries_append_only() RETURNS trigger AS $$
+        BEGIN
+            RAISE EXCEPTION 'ledger_entries is append-only';
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS ledger_entries_append_only ON ledger_entries",
+        """
+        CREATE TRIGGER ledger_entries_append_only
+        BEFORE UPDATE OR DELETE ON ledger_entries
+        FOR EACH ROW EXECUTE FUNCTION ledger_entries_append_only()
+        """,
+        # A checkpoint covers every entry up to last_entry_id
+        """
+        CREATE TABLE IF NOT EXISTS ledger_checkpoints (
+            checkpoint_id SERIAL PRIMARY KEY,
+            last_entry_id BIGINT NOT NULL,
+            entries_checked INTEGER NOT NULL DEFAULT 0,
+            created_by INTEGER REFERENCES users(user_id),
+            created_at TIMESTAMPTZ DEFAULT now()
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ledger_checkpoints_created_at_idx ON ledger_checkpoints (created_at)",
+        """
+        CREATE TABLE IF NOT EXISTS balance_snapshots (
+            checkpoint_id INTEGER REFERENCES ledger_checkpoints(checkpoint_id) ON DELETE CASCADE,
+            user_id INTEGER REFERENCES users(user_id) ON DELETE CASCADE,
+            balance INTEGER NOT NULL,
+            PRIMARY KEY (checkpoint_id, user_id)
+        )
+        """,
+        # Existing balances have no history yet; open the ledger with them
+        """
+        WITH opening AS (
+            INSERT INTO transactions (from_user_id, to_user_id, amount, type, description)
+            SELECT NULL, user_id, currency, 'opening', '원장 시작 잔액'
+            FROM users
+            WHERE COALESCE(currency, 0) <> 0
+              AND NOT EXISTS (SELECT 1 FROM ledger_entries)
+            RETURNING transaction_id, to_user_id, amount, created_at
+        )
+        INSERT INTO ledger_entries (transaction_id, user_id, amount, created_at)
+        SELECT transaction_id, to_user_id, amount, created_at FROM opening
+        UNION ALL
+        SELECT transaction_id, NULL, -amount, created_at FROM opening
+        """,
+    ]),
+    (7, "one completion per user and quest; keyset index for the verification queue", [
+        # Old complete_quest inserted a second, verified row next to the pending
+        # request; keep the verified one (else the oldest) before adding the key
+        """
+        DELETE FROM quest_completions qc
+        USING quest_completions keep
+        WHERE keep.quest_id = qc.quest_id
+          AND keep.user_id = qc.user_id
+          AND keep.completion_id <> qc.completion_id
+          AND (keep.verified_at IS NOT NULL, -keep.completion_id) > (qc.verified_at IS NOT NULL, -qc.completion_id)
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS quest_completions_user_quest_key ON quest_completions (user_id, quest_id)",
+        "DROP INDEX IF EXISTS quest_completions_user_quest_idx",
+        "CREATE INDEX IF NOT EXISTS quest_completions_queue_idx ON quest_completions (completed_at, completion_id) WHERE verified_at IS NULL",
+        "DROP INDEX IF EXISTS quest_completions_pending_idx",
+    ]),
+    (8, "keyset indexes for the transaction explorer", [
+        # (created_at, transaction_id) is the explorer's page key, with and without a type filter
+        "CREATE INDEX IF NOT EXISTS transactions_keyset_idx ON transactions (created_at DESC, transaction_id DESC)",
+        "DROP INDEX IF EXISTS transactions_created_at_idx",
+        "CREATE INDEX IF NOT EXISTS transactions_type_keyset_idx ON transactions (type, created_at DESC, transaction_id DESC)",
+    ]),
+    (9, "daily economy rollups maintained by a statement trigger", [
+        # Hold off writers so no transaction falls between the backfill and the trigger
+        "LOCK TABLE transactions IN SHARE MODE",
+        # Shop purchases used to be recorded as plain transfers to the treasury
+        """
+        UPDATE transactions SET type = 'shop'
+        WHERE type = 'transfer' AND to_user_id IS NULL AND description LIKE '상점에서 %'
+        """,
+        # issued/burned: money entering/leaving user balances; only ledger-backed
+        # transactions count, since older history is already in the opening balances
+        """
+        CREATE TABLE IF NOT EXISTS economy_daily (
+            day DATE NOT NULL,
+            type TEXT NOT NULL,
+            tx_count INTEGER NOT NULL DEFAULT 0,
+            volume BIGINT NOT NULL DEFAULT 0,
+            issued BIGINT NOT NULL DEFAULT 0,
+            burned BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, type)
+        )
+        """,
+        """
+        CREATE OR REPLACE FUNCTION economy_daily_rollup() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO economy_daily AS d (day, type, tx_count, volume, issued, burned)
+            SELECT (created_at AT TIME ZONE 'Asia/Seoul')::date, type, COUNT(*), SUM(amount),
+                   COALESCE(SUM(amount) FILTER (WHERE from_user_id IS NULL AND to_user_id IS NOT NULL), 0),
+                   COALESCE(SUM(amount) FILTER (WHERE to_user_id IS NULL AND from_user_id IS NOT NULL), 0)
+            FROM new_rows
+            GROUP BY 1, 2
+            ON CONFLICT (day, type) DO UPDATE
+            SET tx_count = d.tx_count + EXCLUDED.tx_count,
+                volume = d.volume + EXCLUDED.volume,
+                issued = d.issued + EXCLUDED.issued,
+                burned = d.burned + EXCLUDED.burned;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS transactions_economy_daily ON transactions",
+        """
+        CREATE TRIGGER transactions_economy_daily
+        AFTER INSERT ON transactions
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION economy_daily_rollup()
+        """,
+        """
+        INSERT INTO economy_daily (day, type, tx_count, volume, issued, burned)
+        SELECT (t.created_at AT TIME ZONE 'Asia/Seoul')::date, t.type, COUNT(*), SUM(t.amount),
+               COALESCE(SUM(t.amount) FILTER (WHERE l.ledgered AND t.from_user_id IS NULL AND t.to_user_id IS NOT NULL), 0),
+               COALESCE(SUM(t.amount) FILTER (WHERE l.ledgered AND t.to_user_id IS NULL AND t.from_user_id IS NOT NULL), 0)
+        FROM transactions t
+        CROSS JOIN LATERAL (
+            SELECT EXISTS (SELECT 1 FROM ledger_entries e WHERE e.transaction_id = t.transaction_id) AS ledgered
+        ) l
+        WHERE NOT EXISTS (SELECT 1 FROM economy_daily)
+        GROUP BY 1, 2
+        """,
+    ]),
+    (10, "savings accounts with lazily compounded interest", [
+        # balance is as of touched_at; interest since then is computed on read
+        """
+        CREATE TABLE IF NOT EXISTS savings_accounts (
+            user_id INTEGER PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+            balance NUMERIC(20, 6) NOT NULL DEFAULT 0 CHECK (balance >= 0),
+            annual_rate NUMERIC(6, 4) NOT NULL,
+            touched_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            created_at TIMESTAMPTZ DEFAULT now()
+        )
+        """,
+    ]),
+    (11, "per-stock parameters for the simulated market", [
+        # Annualized drift and volatility, and the loading on the shared market shock
+        "ALTER TABLE stocks ADD COLUMN IF NOT EXISTS drift NUMERIC(6, 4) NOT NULL DEFAULT 0.05",
+        "ALTER TABLE stocks ADD COLUMN IF NOT EXISTS volatility NUMERIC(6, 4) NOT NULL DEFAULT 0.30 CHECK (volatility >= 0)",
+        "ALTER TABLE stocks ADD COLUMN IF NOT EXISTS market_correlation NUMERIC(4, 3) NOT NULL DEFAULT 0.5 CHECK (market_correlation BETWEEN 0 AND 1)",
+    ]),
+    (12, "stock price time series", [
+        # The primary key doubles as the (stock, time range) index for charts
+        """
+        CREATE TABLE IF NOT EXISTS stock_prices (
+            stock_id INTEGER NOT NULL REFERENCES stocks(stock_id) ON DELETE CASCADE,
+            recorded_at TIMESTAMPTZ NOT NULL,
+            price DECIMAL(10, 2) NOT NULL,
+            PRIMARY KEY (stock_id, recorded_at)
+        )
+        """,
+        """
+        INSERT INTO stock_prices (stock_id, recorded_at, price)
+        SELECT stock_id, COALESCE(last_updated, now()), current_price
+        FROM stocks
+        WHERE current_price > 0
+        ON CONFLICT DO NOTHING
+        """,
+    ]),
+    (13, "limit and stop orders settled on each price tick", [
+        """
+        CREATE TABLE IF NOT EXISTS stock_orders (
+            order_id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+            stock_id INTEGER NOT NULL REFERENCES stocks(stock_id) ON DELETE CASCADE,
+            side TEXT NOT NULL CHECK (side IN ('buy', 'sell')),
+            order_type TEXT NOT NULL CHECK (order_type IN ('limit', 'stop')),
+            quantity INTEGER NOT NULL CHECK (quantity > 0),
+            trigger_price DECIMAL(10, 2) NOT NULL CHECK (trigger_price > 0),
+            status TEXT NOT NULL DEFAULT 'open' CHECK (status IN ('open', 'filled', 'cancelled')),
+            fill_price DECIMAL(10, 2),
+            created_at TIMESTAMPTZ DEFAULT now(),
+            closed_at TIMESTAMPTZ
+        )
+        """,
+        # Settlement only ever looks at open orders
+        "CREATE INDEX IF NOT EXISTS stock_orders_open_idx ON stock_orders (stock_id, order_id) WHERE status = 'open'",
+        "CREATE INDEX IF NOT EXISTS stock_orders_user_idx ON stock_orders (user_id, order_id DESC)",
+        # buy_stock/sell_stock have always written total_amount
+        "ALTER TABLE stock_transactions ADD COLUMN IF NOT EXISTS total_amount DECIMAL(12, 2)",
+        "ALTER TABLE stock_transactions ADD COLUMN IF NOT EXISTS order_id INTEGER REFERENCES stock_orders(order_id) ON DELETE SET NULL",
+    ]),
+]
+
+LATEST_SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def apply_migrations(conn):
+    """
+    주어진 psycopg2 연결에 적용되지 않은 마이그레이션을 순서대로 하나의 트랜잭션에서 적용합니다.
+    
+    Returns:
+        (int, list): (적용 후 스키마 버전, 이번에 적용한 버전 목록)
+    """
+    conn.autocommit = False
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (SCHEMA_LOCK_ID,))
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMPTZ DEFAULT now()
+            );
+        """)
+        cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+        current = cur.fetchone()[0]
+
+        applied = []
+        for version, description, statements in MIGRATIONS:
+            if version <= current:
+                continue
+            for statement in statements:
+                cur.execute(statement)
+            cur.execute(
+                "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                (version, description)
+            )
+            applied.append(version)
+            current = version
+
+        conn.commit()
+        cur.close()
+        return current, applied
+    except Exception:
+        conn.rollback()
+        raise
+
+def migrate():
+    """
+    연결 풀의 데이터베이스에 적용되지 않은 마이그레이션을 적용합니다.
+    
+    Returns:
+        (int, list): (적용 후 스키마 버전, 이번에 적용한 버전 목록)
+    """
+    # Borrow directly from the pool: get_conn() itself waits on ensure_schema()
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        current, applied = apply_migrations(conn)
+    finally:
+        pool.release(conn)
+
+    if applied:
+        get_query_cache().clear()
+    return current, applied
+
+@st.cache_resource(show_spinner=False)
+def ensure_schema():
+    """
+    프로세스당 한 번만 스키마 버전을 확인하고 필요한 마이그레이션을 적용합니다.
+    
+    Returns:
+        int: 현재 스키마 버전
+    """
+    version, _ = migrate()
+    return version
+
+def schema_status():
+    """
+    스키마 버전 상태를 반환합니다.
+    
+    Returns:
+        (int, list): (현재 버전, 적용 대기 중인 (version, description) 목록)
+    """
+    row = select_query("""
+        SELECT COALESCE(MAX(version), 0) FROM schema_version
+    """, fetch_all=False)
+    current = row[0] if row else 0
+    pending = [(version, description) for version, description, _ in MIGRATIONS if version > current]
+    return current, pending
+
 def init_tables(force_recreate=False):
     """
     데이터베이스 테이블을 초기화합니다.
     
     Args:
         force_recreate (bool): True인 경우 기존 테이블을 모두 삭제하고 새로 생성합니다.
-                              False인 경우 존재하지 않는 테이블만 생성합니다.
+                              False인 경우 적용되지 않은 마이그레이션만 적용합니다.
     """
     try:
-        # Always use a fresh connection
-        conn = get_conn()
-        cur = conn.cursor()
-
         # 기존 테이블 삭제 (force_recreate가 True인 경우에만)
         if force_recreate:
             st.info("기존 테이블을 삭제하고 새로 생성합니다...")
-            cur.execute("""
+            execute_query("""
+                DROP TABLE IF EXISTS stock_orders CASCADE;
+                DROP TABLE IF EXISTS stock_prices CASCADE;
+                DROP TABLE IF EXISTS savings_accounts CASCADE;
+                DROP TABLE IF EXISTS economy_daily CASCADE;
+                DROP TABLE IF EXISTS balance_snapshots CASCADE;
+                DROP TABLE IF EXISTS ledger_checkpoints CASCADE;
+                DROP TABLE IF EXISTS ledger_entries CASCADE;
+                DROP TABLE IF EXISTS salary_runs CASCADE;
                 DROP TABLE IF EXISTS refunds CASCADE;
                 DROP TABLE IF EXISTS user_items CASCADE;
                 DROP TABLE IF EXISTS shop_items CASCADE;
@@ -137,233 +1569,15 @@ def init_tables(force_recreate=False):
                 DROP TABLE IF EXISTS kicked_users CASCADE;
                 DROP TABLE IF EXISTS users CASCADE;
                 DROP TABLE IF EXISTS suggestions CASCADE;
+                DROP TABLE IF EXISTS schema_version CASCADE;
             """)
         else:
             st.info("누락된 테이블만 생성합니다...")
 
-        # Users 테이블 생성 (with roles, currency, and password)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                user_id SERIAL PRIMARY KEY,
-                username TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL,
-                role TEXT NOT NULL CHECK (role IN ('teacher', 'student', '제작자', '일반학생')),
-                currency INTEGER DEFAULT 0,
-                job_id INTEGER,
-                bio TEXT DEFAULT '',
-                avatar_url TEXT DEFAULT '',
-                created_at TIMESTAMPTZ DEFAULT now()
-            );
-        """)
-
-        # Jobs 테이블 생성
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS jobs (
-                job_id SERIAL PRIMARY KEY,
-                name TEXT NOT NULL,
-                salary INTEGER NOT NULL,
-                description TEXT,
-                created_by INTEGER REFERENCES users(user_id),
-                created_at TIMESTAMPTZ DEFAULT now()
-            );
-        """)
-
-        # Quests/Missions 테이블 생성
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS quests (
-                quest_id SERIAL PRIMARY KEY,
-                title TEXT NOT NULL,
-                description TEXT,
-                reward INTEGER NOT NULL,
-                created_by INTEGER REFERENCES users(user_id),
-                is_daily BOOLEAN DEFAULT false,
-                created_at TIMESTAMPTZ DEFAULT now()
-            );
-        """)
-
-        # Quest Completions 테이블 생성
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS quest_completions (
-                completion_id SERIAL PRIMARY KEY,
-                quest_id INTEGER REFERENCES quests(quest_id),
-                user_id INTEGER REFERENCES users(user_id),
-                completed_at TIMESTAMPTZ DEFAULT now(),
-                verified_by INTEGER REFERENCES users(user_id),
-                verified_at TIMESTAMPTZ
-            );
-        """)
-
-        # Transactions 테이블 생성
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS transactions (
-                transaction_id SERIAL PRIMARY KEY,
-                from_user_id INTEGER REFERENCES users(user_id),
-                to_user_id INTEGER REFERENCES users(user_id),
-                amount INTEGER NOT NULL,
-                type TEXT NOT NULL,
-                description TEXT,
-                created_by INTEGER REFERENCES users(user_id),
-                created_at TIMESTAMPTZ DEFAULT now()
-            );
-        """)
-
-        # Shop Items Table (for profile items)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS shop_items (
-                item_id SERIAL PRIMARY KEY,
-                name TEXT NOT NULL,
-                description TEXT NOT NULL,
-                type TEXT NOT NULL CHECK (type IN ('avatar', 'badge', 'background', 'font', 'color')),
-                price INTEGER NOT NULL,
-                image_url TEXT,
-                created_at TIMESTAMPTZ DEFAULT now()
-            );
-        """)
-
-        # User Items Table (inventory of purchased items)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS user_items (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(user_id),
-                item_id INTEGER REFERENCES shop_items(item_id),
-                is_equipped BOOLEAN DEFAULT false,
-                is_active BOOLEAN DEFAULT true,
-                purchased_at TIMESTAMPTZ DEFAULT now()
-            );
-        """)
-
-        # Blog Posts Table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS blog_posts (
-                post_id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(user_id),
-                title TEXT NOT NULL,
-                content TEXT NOT NULL,
-                image_urls TEXT,
-                created_at TIMESTAMPTZ DEFAULT now(),
-                updated_at TIMESTAMPTZ DEFAULT now()
-            );
-        """)
-
-        # Blog Comments Table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS blog_comments (
-                comment_id SERIAL PRIMARY KEY,
-                post_id INTEGER REFERENCES blog_posts(post_id),
-                user_id INTEGER REFERENCES users(user_id),
-                content TEXT NOT NULL,
-                created_at TIMESTAMPTZ DEFAULT now()
-            );
-        """)
-
-        # Kicked Users Table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS kicked_users (
-                username TEXT PRIMARY KEY,
-                reason TEXT NOT NULL,
-                kicked_at TIMESTAMPTZ DEFAULT now()
-            );
-        """)
-
-        # Refunds Table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS refunds (
-                refund_id SERIAL PRIMARY KEY,
-                user_item_id INTEGER REFERENCES user_items(id),
-                user_id INTEGER REFERENCES users(user_id),
-                item_id INTEGER REFERENCES shop_items(item_id),
-                amount INTEGER NOT NULL,
-                reason TEXT,
-                processed_by INTEGER REFERENCES users(user_id),
-                created_at TIMESTAMPTZ DEFAULT now()
-            );
-        """)
-        
-        # Notices Table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS notices (
-                notice_id SERIAL PRIMARY KEY,
-                title TEXT NOT NULL,
-                content TEXT NOT NULL,
-                heading_level INTEGER NOT NULL CHECK (heading_level BETWEEN 1 AND 6),
-                is_active BOOLEAN DEFAULT true,
-                created_by INTEGER REFERENCES users(user_id),
-                created_at TIMESTAMPTZ DEFAULT now(),
-                updated_at TIMESTAMPTZ DEFAULT now()
-            );
-        """)
-        
-        # Suggestions Table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS suggestions (
-                id SERIAL PRIMARY KEY,
-                content TEXT NOT NULL,
-                username TEXT NOT NULL,
-                user_id INTEGER REFERENCES users(user_id),
-                timestamp TIMESTAMPTZ DEFAULT now(),
-                status TEXT DEFAULT 'pending'
-            );
-        """)
-        
-        # Stocks Table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS stocks (
-                stock_id SERIAL PRIMARY KEY,
-                symbol TEXT UNIQUE NOT NULL,
-                name TEXT NOT NULL,
-                current_price DECIMAL(10, 2) NOT NULL,
-                last_updated TIMESTAMPTZ DEFAULT now(),
-                created_by INTEGER REFERENCES users(user_id),
-                created_at TIMESTAMPTZ DEFAULT now()
-            );
-        """)
-        
-        # Stock Portfolios Table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS stock_portfolios (
-                portfolio_id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(user_id),
-                stock_id INTEGER REFERENCES stocks(stock_id),
-                quantity INTEGER NOT NULL,
-                avg_purchase_price DECIMAL(10, 2) NOT NULL,
-                created_at TIMESTAMPTZ DEFAULT now(),
-                updated_at TIMESTAMPTZ DEFAULT now(),
-                UNIQUE(user_id, stock_id)
-            );
-        """)
-        
-        # Stock Transactions Table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS stock_transactions (
-                transaction_id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(user_id),
-                stock_id INTEGER REFERENCES stocks(stock_id),
-                quantity INTEGER NOT NULL,
-                price DECIMAL(10, 2) NOT NULL,
-                type TEXT NOT NULL CHECK (type IN ('buy', 'sell')),
-                created_at TIMESTAMPTZ DEFAULT now()
-            );
-        """)
-
-        conn.commit()
+        version, applied = migrate()
+        if applied:
+            st.info(f"마이그레이션 적용: {', '.join(str(v) for v in applied)} (현재 버전 {version})")
         st.success("데이터베이스 테이블이 성공적으로 생성되었습니다!")
     except Exception as e:
         st.error(f"데이터베이스 초기화 오류: {str(e)}")
-        if conn:
-            try:
-                conn.rollback()
-            except:
-                pass
         raise e
-    finally:
-        # Always close the connection
-        if 'cur' in locals() and cur:
-            try:
-                cur.close()
-            except:
-                pass
-        if 'conn' in locals() and conn:
-            try:
-                conn.close()
-            except:
-                pass
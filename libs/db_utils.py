@@ -2,8 +2,140 @@ import streamlit as st
 import psycopg2
 import psycopg2.errors
 import functools
+import random
+import threading
 import time
-from libs.db import get_conn
+from libs.db import get_conn, get_pool
+
+class DatabaseUnavailable(Exception):
+    """회로 차단기가 열려 있어 데이터베이스 호출을 즉시 거부할 때 발생합니다."""
+
+    def __init__(self, retry_in):
+        self.retry_in = retry_in
+        super().__init__(f"데이터베이스를 사용할 수 없습니다. {retry_in:.0f}초 후에 다시 시도합니다.")
+
+class CircuitBreaker:
+    """
+    데이터베이스 연결 실패가 이어지면 호출을 잠시 차단하는 회로 차단기입니다.
+
+    - closed: 정상. 연속 실패가 failure_threshold 에 도달하면 open 으로 바뀝니다.
+    - open: 모든 연결 시도를 즉시 DatabaseUnavailable 로 거부합니다.
+      차단 시간은 열릴 때마다 base_delay 부터 두 배씩 늘어나며(max_delay 까지) 지터가 더해집니다.
+    - half_open: 차단 시간이 지나면 단 하나의 시도만 통과시켜 보고,
+      성공하면 closed, 실패하면 더 긴 시간 동안 다시 open 합니다.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=3, base_delay=1.0, max_delay=60.0):
+        self.failure_threshold = failure_threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._trips = 0
+        self._open_until = 0.0
+        self._probe_in_flight = False
+        self.stats = {"rejected": 0, "failures": 0, "trips": 0}
+
+    def _backoff(self):
+        # Exponential backoff with equal jitter so sessions do not reconnect in lockstep
+        delay = min(self.max_delay, self.base_delay * (2 ** self._trips))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def allow(self):
+        """
+        호출을 허용할지 결정합니다. 허용하지 않으면 DatabaseUnavailable 을 발생시킵니다.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._state == self.OPEN:
+                if now < self._open_until:
+                    self.stats["rejected"] += 1
+                    raise DatabaseUnavailable(self._open_until - now)
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    self.stats["rejected"] += 1
+                    raise DatabaseUnavailable(self.base_delay)
+                self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trips = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.stats["failures"] += 1
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._open_until = time.monotonic() + self._backoff()
+                self._state = self.OPEN
+                self._trips += 1
+                self._probe_in_flight = False
+                self.stats["trips"] += 1
+
+    def call(self, func, *args, **kwargs):
+        """
+        차단기를 거쳐 func 를 호출합니다. 연결 계열 오류만 실패로 집계합니다.
+        """
+        self.allow()
+        try:
+            result = func(*args, **kwargs)
+        except (psycopg2.InterfaceError, psycopg2.OperationalError):
+            self.record_failure()
+            raise
+        except BaseException:
+            # Not a connectivity verdict; let the next caller probe again
+            with self._lock:
+                self._probe_in_flight = False
+            raise
+        self.record_success()
+        return result
+
+    def is_open(self):
+        with self._lock:
+            return self._state == self.OPEN and time.monotonic() < self._open_until
+
+    def retry_in(self):
+        with self._lock:
+            return max(0.0, self._open_until - time.monotonic()) if self._state == self.OPEN else 0.0
+
+    def reset(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trips = 0
+            self._open_until = 0.0
+            self._probe_in_flight = False
+
+    def status(self):
+        with self._lock:
+            return {
+                **self.stats,
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "retry_in": max(0.0, self._open_until - time.monotonic()) if self._state == self.OPEN else 0.0,
+            }
+
+@st.cache_resource
+def get_circuit_breaker(name="primary"):
+    """
+    프로세스 전체에서 공유하는 데이터베이스 회로 차단기를 반환합니다.
+    서버마다(name: "primary", "replica") 별도의 차단기를 둡니다.
+    """
+    return CircuitBreaker(
+        failure_threshold=int(st.secrets.get("breaker_failure_threshold", 3)),
+        base_delay=float(st.secrets.get("breaker_base_delay", 1.0)),
+        max_delay=float(st.secrets.get("breaker_max_delay", 60.0)),
+    )
 
 def test_connection(conn=None):
     """
@@ -65,13 +197,31 @@ def recover_connection():
     except Exception as e:
         return False, None, f"연결 복구 중 오류 발생: {str(e)}"
 
-def with_connection_retry(max_retries=3, retry_delay=1):
+def is_connection_error(error, conn=None):
+    """
+    연결 자체가 끊어진 오류인지 판별합니다.
+    
+    InterfaceError, SQLSTATE 가 없는 OperationalError, 또는 연결이 닫힌 경우만
+    해당합니다. 서버가 SQLSTATE 와 함께 돌려준 오류(문장 타임아웃, 교착 상태,
+    직렬화 실패 등)는 연결이 살아 있으므로 해당하지 않습니다.
+    """
+    if isinstance(error, psycopg2.InterfaceError):
+        return True
+    if conn is not None and conn.closed:
+        return True
+    return isinstance(error, psycopg2.OperationalError) and error.pgcode is None
+
+def with_connection_retry(max_retries=3, budget=5.0):
     """
     데이터베이스 함수에 자동 재시도 기능을 추가하는 데코레이터입니다.
     
+    재시도는 스크립트 스레드에서 잠들지 않고 풀의 다른 연결로 즉시 이루어집니다.
+    대기(백오프)는 회로 차단기가 열려 있는 시간으로 대신하며, 차단기가 열리면
+    남은 재시도 없이 DatabaseUnavailable 로 바로 실패합니다.
+    
     Args:
         max_retries (int): 최대 재시도 횟수
-        retry_delay (float): 재시도 사이의 대기 시간(초)
+        budget (float): 모든 시도에 쓸 수 있는 총 시간(초)
     
     Returns:
         Decorated function
@@ -81,42 +231,44 @@ def with_connection_retry(max_retries=3, retry_delay=1):
         def wrapper(*args, **kwargs):
             retries = 0
             last_error = None
+            deadline = time.monotonic() + budget
             
             while retries <= max_retries:
+                conn = None
                 try:
-                    # Get a fresh connection for the function
+                    # Borrow a pooled connection (fails fast while the breaker is open)
                     conn = get_conn()
                     
-                    # Test if connection is valid
-                    success, message = test_connection(conn)
-                    if not success:
-                        # Try to recover connection
-                        success, conn, message = recover_connection()
-                        if not success:
-                            raise Exception(f"데이터베이스 연결 실패: {message}")
-                    
                     # Call the function with the connection
                     return func(conn, *args, **kwargs)
                 
+                except DatabaseUnavailable:
+                    raise
+                
                 except (psycopg2.InterfaceError, psycopg2.OperationalError) as e:
+                    # Timeouts, deadlocks and serialization failures are OperationalErrors
+                    # too, but the connection is healthy; they are not retried here
+                    if not is_connection_error(e, conn):
+                        raise
                     last_error = e
                     retries += 1
+                    # The broken connection is discarded on return; drop its idle
+                    # siblings too so the retry gets a newly connected one
+                    get_pool().reset()
                     
-                    if retries <= max_retries:
-                        # Wait before retrying
-                        time.sleep(retry_delay)
-                        # Try to recover connection
-                        success, conn, message = recover_connection()
-                    else:
-                        # Max retries reached
+                    if time.monotonic() >= deadline:
                         break
                 
                 except Exception as e:
                     # Other exceptions are not retried
                     raise e
+                
+                finally:
+                    if conn:
+                        conn.close()
             
             # If we get here, all retries failed
-            raise Exception(f"데이터베이스 연결 재시도 실패 ({max_retries}회): {str(last_error)}")
+            raise Exception(f"데이터베이스 연결 재시도 실패 ({retries}회): {str(last_error)}")
         
         return wrapper
     return decorator
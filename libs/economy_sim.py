@@ -0,0 +1,115 @@
+# libs/economy_sim.py
+# Monte-Carlo what-if simulator for the class economy, vectorized with NumPy.
+# Every run and every student is simulated at once; only the weeks are a loop.
+from dataclasses import dataclass
+import numpy as np
+from libs.db import select_query
+
+# How far back the live completion and purchase rates are measured
+HISTORY_WEEKS = 8
+
+SETTINGS_QUERY = """
+    SELECT
+        (SELECT json_agg(json_build_array(COALESCE(u.currency, 0), COALESCE(j.salary, 0)))
+         FROM users u
+         LEFT JOIN jobs j ON u.job_id = j.job_id
+         WHERE u.role IN ('student', '일반학생')),
+        (SELECT json_agg(reward) FROM quests),
+        (SELECT json_agg(price) FROM shop_items),
+        (SELECT COUNT(*) FROM quest_completions
+         WHERE verified_at > now() - %(weeks)s * interval '1 week'),
+        (SELECT COALESCE(SUM(tx_count), 0) FROM economy_daily
+         WHERE type = 'shop' AND day > (now() AT TIME ZONE 'Asia/Seoul')::date - %(weeks)s * 7)
+"""
+
+@dataclass
+class EconomySettings:
+    """Starting point of a simulation, normally loaded from the live tables"""
+    balances: np.ndarray        # current balance per student
+    salaries: np.ndarray        # monthly salary per student (0 without a job)
+    quest_rewards: np.ndarray   # reward of every quest
+    item_prices: np.ndarray     # price of every shop item
+    quest_rate: float           # verified completions per student per week
+    purchase_rate: float        # purchases per student per week
+
+@dataclass
+class SimulationResult:
+    """Per-week outcomes; percentile arrays have one row per entry of PERCENTILES"""
+    weeks: np.ndarray
+    money_supply: np.ndarray    # (len(PERCENTILES), weeks + 1)
+    median_balance: np.ndarray  # (len(PERCENTILES), weeks + 1)
+    affordability: np.ndarray   # (weeks + 1,) mean share of students who can afford the median item
+    runs: int
+
+PERCENTILES = (5, 50, 95)
+
+def load_settings(cache_ttl=60):
+    """Read balances, salaries, rewards, prices and recent activity rates in one query"""
+    students, rewards, prices, completions, purchases = select_query(
+        SETTINGS_QUERY, {"weeks": HISTORY_WEEKS}, fetch_all=False, cache_ttl=cache_ttl
+    )
+    students = np.array(students or [], dtype=np.int64).reshape(-1, 2)
+    student_count = max(len(students), 1)
+    return EconomySettings(
+        balances=students[:, 0].astype(np.float64),
+        salaries=students[:, 1].astype(np.float64),
+        quest_rewards=np.array(rewards or [], dtype=np.float64),
+        item_prices=np.array(prices or [], dtype=np.float64),
+        quest_rate=completions / student_count / HISTORY_WEEKS,
+        purchase_rate=float(purchases) / student_count / HISTORY_WEEKS,
+    )
+
+def simulate(settings, weeks=12, runs=2000, salary_scale=1.0, reward_scale=1.0, price_scale=1.0,
+             quest_rate=None, purchase_rate=None, seed=None):
+    """
+    Project the class economy `weeks` ahead over `runs` Monte-Carlo runs.
+
+    Each week every student completes a Poisson number of quests and may try
+    to buy one random shop item, which only goes through if they can afford it.
+    Salaries are paid at each month boundary. The scales and rates override
+    the live settings so teachers can try changes before making them.
+    """
+    rng = np.random.default_rng(seed)
+    quest_rate = settings.quest_rate if quest_rate is None else quest_rate
+    purchase_rate = settings.purchase_rate if purchase_rate is None else purchase_rate
+    salaries = settings.salaries * salary_scale
+    rewards = settings.quest_rewards * reward_scale
+    prices = settings.item_prices * price_scale
+    median_price = np.median(prices) if prices.size else np.inf
+    buy_probability = 1.0 - np.exp(-purchase_rate)
+
+    balances = np.tile(settings.balances, (runs, 1))
+    shape = balances.shape
+    supply = np.empty((runs, weeks + 1))
+    median_balance = np.empty((runs, weeks + 1))
+    affordability = np.empty(weeks + 1)
+
+    def record(week):
+        supply[:, week] = balances.sum(axis=1)
+        median_balance[:, week] = np.median(balances, axis=1) if shape[1] else 0.0
+        affordability[week] = (balances >= median_price).mean() if shape[1] else 0.0
+
+    record(0)
+    for week in range(1, weeks + 1):
+        # Payroll runs once per calendar month (52 weeks / 12 months)
+        if (week * 12) // 52 != ((week - 1) * 12) // 52:
+            balances += salaries
+
+        if rewards.size and quest_rate > 0:
+            completions = rng.poisson(quest_rate, shape)
+            balances += completions * rewards[rng.integers(rewards.size, size=shape)]
+
+        if prices.size and purchase_rate > 0:
+            price = prices[rng.integers(prices.size, size=shape)]
+            buys = (rng.random(shape) < buy_probability) & (balances >= price)
+            balances -= price * buys
+
+        record(week)
+
+    return SimulationResult(
+        weeks=np.arange(weeks + 1),
+        money_supply=np.percentile(supply, PERCENTILES, axis=0),
+        median_balance=np.percentile(median_balance, PERCENTILES, axis=0),
+        affordability=affordability,
+        runs=runs,
+    )
@@ -0,0 +1,94 @@
+# libs/leaderboard.py
+# Class leaderboard: ranked once per balance change, then served from memory.
+import threading
+import time
+from bisect import bisect_left
+import streamlit as st
+from libs.db import select_query, get_query_cache
+
+LEADERBOARD_QUERY = """
+    SELECT user_id, username, role, COALESCE(currency, 0) AS currency,
+           RANK() OVER (ORDER BY COALESCE(currency, 0) DESC) AS rank,
+           PERCENT_RANK() OVER (ORDER BY COALESCE(currency, 0) DESC) AS percent_rank
+    FROM users
+    ORDER BY rank, username
+"""
+
+class Leaderboard:
+    """
+    One ranked snapshot of every user's balance.
+
+    rows are (user_id, username, role, currency, rank, percent_rank) in rank
+    order. Ties share a rank (1, 2, 2, 4). percent_rank is 0 for the top and
+    1 for the bottom.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        # Negated so the descending balances are ascending for bisect
+        self._keys = [-row[3] for row in rows]
+        self._index = {row[0]: i for i, row in enumerate(rows)}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def rank_of_balance(self, balance):
+        """Rank a balance would have, in O(log n)"""
+        return bisect_left(self._keys, -balance) + 1
+
+    def user_rank(self, user_id):
+        """(rank, percent_rank, currency) for a user, or None if they are not on the board"""
+        i = self._index.get(user_id)
+        if i is None:
+            return None
+        _, _, _, currency, _, percent_rank = self.rows[i]
+        return self.rank_of_balance(currency), percent_rank, currency
+
+    def top(self, k):
+        return self.rows[:k]
+
+    def page(self, number, size):
+        """Rows of a 1-based page"""
+        start = (number - 1) * size
+        return self.rows[start:start + size]
+
+class LeaderboardService:
+    """
+    Keeps the last Leaderboard and rebuilds it only after users has been
+    written in this process (the query cache's table version moves) or
+    after max_age seconds, which picks up writes made by other processes.
+    """
+
+    def __init__(self, max_age=30):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._board = None
+        self._version = None
+        self._built_at = 0.0
+        self.stats = {"hits": 0, "rebuilds": 0}
+
+    def get(self):
+        version = get_query_cache().versions(["users"])["users"]
+        with self._lock:
+            if self._board is not None and version == self._version and time.monotonic() - self._built_at < self.max_age:
+                self.stats["hits"] += 1
+                return self._board
+
+        # Identical concurrent rebuilds are coalesced by select_query
+        board = Leaderboard(select_query(LEADERBOARD_QUERY))
+        with self._lock:
+            self._board = board
+            # The version read before the query, so a write during it triggers another rebuild
+            self._version = version
+            self._built_at = time.monotonic()
+            self.stats["rebuilds"] += 1
+        return board
+
+@st.cache_resource
+def get_leaderboard_service():
+    """Process-wide leaderboard service"""
+    return LeaderboardService(max_age=int(st.secrets.get("leaderboard_max_age", 30)))
+
+def get_leaderboard():
+    """Current class leaderboard"""
+    return get_leaderboard_service().get()
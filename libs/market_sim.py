@@ -0,0 +1,32 @@
+# libs/market_sim.py
+# Offline stock market: correlated geometric Brownian motion, vectorized with NumPy.
+# All stocks and all steps of a tick are generated at once.
+import numpy as np
+
+TRADING_DAYS_PER_YEAR = 252
+MINUTES_PER_TRADING_DAY = 390
+
+# One simulated step is one trading minute
+MINUTE = 1.0 / (TRADING_DAYS_PER_YEAR * MINUTES_PER_TRADING_DAY)
+
+def simulate_paths(prices, drift, volatility, correlation, steps=MINUTES_PER_TRADING_DAY, dt=MINUTE, rng=None):
+    """
+    Price paths of shape (steps + 1, stocks), starting with the given prices.
+
+    drift and volatility are annualized, one per stock. Shocks follow a
+    one-factor model: correlation is each stock's loading on a shared market
+    shock, so two stocks move together with correlation
+    correlation[i] * correlation[j]. Uses the exact GBM step, so prices stay
+    positive for any dt.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    prices, drift, volatility, correlation = (
+        np.asarray(values, dtype=np.float64) for values in (prices, drift, volatility, correlation)
+    )
+    market = rng.standard_normal((steps, 1))
+    own = rng.standard_normal((steps, prices.size))
+    shocks = correlation * market + np.sqrt(1.0 - correlation ** 2) * own
+
+    log_returns = (drift - 0.5 * volatility ** 2) * dt + volatility * np.sqrt(dt) * shocks
+    log_paths = np.vstack([np.zeros((1, prices.size)), np.cumsum(log_returns, axis=0)])
+    return prices * np.exp(log_paths)
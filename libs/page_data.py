@@ -0,0 +1,160 @@
+# libs/page_data.py
+# Page loaders: everything a page renders, fetched in a single statement.
+from dataclasses import dataclass, field
+from datetime import datetime
+from libs.db import select_query
+
+def _ts(value):
+    # json_build_array turns timestamps into ISO strings
+    return datetime.fromisoformat(value) if value else None
+
+def _rows(value):
+    return value if value else []
+
+@dataclass
+class ProfilePageData:
+    """Everything pages/프로필.py renders for one user"""
+    username: str
+    role: str
+    currency: int
+    bio: str
+    avatar_url: str
+    job_id: int = None
+    equipped_items: dict = field(default_factory=dict)  # item type -> image_url
+    job: tuple = None                                   # (name, salary, description)
+    transactions: list = field(default_factory=list)    # (amount, type, description, created_at, direction, other_user)
+    quests: list = field(default_factory=list)          # (title, reward, completed_at, verified_at, verifier)
+    purchases: list = field(default_factory=list)       # (name, price, purchased_at)
+
+@dataclass
+class ShopPageData:
+    """Everything pages/샵.py renders for one user"""
+    balance: int
+    items: list = field(default_factory=list)           # (item_id, name, description, type, price, image_url)
+    inventory: list = field(default_factory=list)       # (item_id, name, description, type, image_url, is_equipped)
+
+    @property
+    def purchased_item_ids(self):
+        return {row[0] for row in self.inventory}
+
+PROFILE_PAGE_QUERY = """
+    WITH me AS (
+        SELECT user_id, username, role, currency, bio, avatar_url, job_id
+        FROM users
+        WHERE user_id = %(user_id)s
+    ),
+    equipped AS (
+        SELECT json_agg(json_build_array(i.type, i.image_url)) AS rows
+        FROM user_items ui
+        JOIN shop_items i ON ui.item_id = i.item_id
+        WHERE ui.user_id = %(user_id)s AND ui.is_equipped = TRUE
+    ),
+    job AS (
+        SELECT json_build_array(j.name, j.salary, j.description) AS row
+        FROM jobs j
+        JOIN me ON j.job_id = me.job_id
+    ),
+    recent_transactions AS (
+        SELECT t.amount, t.type, t.description, t.created_at,
+               CASE
+                   WHEN t.from_user_id = %(user_id)s THEN '출금'
+                   ELSE '입금'
+               END AS direction,
+               CASE
+                   WHEN t.from_user_id = %(user_id)s THEN u.username
+                   ELSE u2.username
+               END AS other_user
+        FROM transactions t
+        LEFT JOIN users u ON t.to_user_id = u.user_id
+        LEFT JOIN users u2 ON t.from_user_id = u2.user_id
+        WHERE t.from_user_id = %(user_id)s OR t.to_user_id = %(user_id)s
+        ORDER BY t.created_at DESC
+        LIMIT 10
+    ),
+    transactions_json AS (
+        SELECT json_agg(json_build_array(amount, type, description, created_at, direction, other_user)
+                        ORDER BY created_at DESC) AS rows
+        FROM recent_transactions
+    ),
+    quests_json AS (
+        SELECT json_agg(json_build_array(q.title, q.reward, qc.completed_at, qc.verified_at, u.username)
+                        ORDER BY qc.completed_at DESC) AS rows
+        FROM quest_completions qc
+        JOIN quests q ON qc.quest_id = q.quest_id
+        LEFT JOIN users u ON qc.verified_by = u.user_id
+        WHERE qc.user_id = %(user_id)s
+    ),
+    purchases_json AS (
+        SELECT json_agg(json_build_array(i.name, i.price, ui.purchased_at)
+                        ORDER BY ui.purchased_at DESC) AS rows
+        FROM user_items ui
+        JOIN shop_items i ON ui.item_id = i.item_id
+        WHERE ui.user_id = %(user_id)s
+    )
+    SELECT me.username, me.role, me.currency, me.bio, me.avatar_url, me.job_id,
+           equipped.rows, (SELECT row FROM job), transactions_json.rows,
+           quests_json.rows, purchases_json.rows
+    FROM me
+    CROSS JOIN equipped
+    CROSS JOIN transactions_json
+    CROSS JOIN quests_json
+    CROSS JOIN purchases_json
+"""
+
+SHOP_PAGE_QUERY = """
+    WITH catalog AS (
+        SELECT json_agg(json_build_array(item_id, name, description, type, price, image_url)
+                        ORDER BY type, price) AS rows
+        FROM shop_items
+    ),
+    inventory AS (
+        SELECT json_agg(json_build_array(i.item_id, i.name, i.description, i.type, i.image_url, ui.is_equipped)
+                        ORDER BY ui.purchased_at DESC) AS rows
+        FROM user_items ui
+        JOIN shop_items i ON ui.item_id = i.item_id
+        WHERE ui.user_id = %(user_id)s
+    )
+    SELECT COALESCE((SELECT currency FROM users WHERE user_id = %(user_id)s), 0),
+           catalog.rows, inventory.rows
+    FROM catalog
+    CROSS JOIN inventory
+"""
+
+def load_profile_page(user_id, cache_ttl=None):
+    """Load the profile page bundle in one round trip (None if the user does not exist)"""
+    row = select_query(PROFILE_PAGE_QUERY, {"user_id": user_id}, fetch_all=False, cache_ttl=cache_ttl)
+    if not row:
+        return None
+
+    username, role, currency, bio, avatar_url, job_id, equipped, job, transactions, quests, purchases = row
+    return ProfilePageData(
+        username=username,
+        role=role,
+        currency=currency or 0,
+        bio=bio or "",
+        avatar_url=avatar_url or "",
+        job_id=job_id,
+        equipped_items={item_type: url for item_type, url in _rows(equipped)},
+        job=tuple(job) if job else None,
+        transactions=[
+            (amount, t_type, description, _ts(created_at), direction, other_user)
+            for amount, t_type, description, created_at, direction, other_user in _rows(transactions)
+        ],
+        quests=[
+            (title, reward, _ts(completed_at), _ts(verified_at), verifier)
+            for title, reward, completed_at, verified_at, verifier in _rows(quests)
+        ],
+        purchases=[
+            (name, price, _ts(purchased_at))
+            for name, price, purchased_at in _rows(purchases)
+        ],
+    )
+
+def load_shop_page(user_id, cache_ttl=None):
+    """Load the shop page bundle (balance, catalog, inventory) in one round trip"""
+    balance, items, inventory = select_query(SHOP_PAGE_QUERY, {"user_id": user_id}, fetch_all=False, cache_ttl=cache_ttl)
+    return ShopPageData(
+        balance=balance,
+        items=[tuple(row) for row in _rows(items)],
+        inventory=[tuple(row) for row in _rows(inventory)],
+    )
@@ -0,0 +1,128 @@
+# libs/portfolio.py
+# Class-wide portfolio valuation: every holding priced in one NumPy pass.
+import threading
+import time
+import numpy as np
+import streamlit as st
+from libs.db import select_query, get_query_cache
+
+# Tables whose writes change a valuation; price ticks bump "stocks" in every process
+VALUATION_TABLES = ["stocks", "stock_portfolios", "users"]
+
+# Users, prices and holdings from one snapshot
+VALUATION_QUERY = """
+    SELECT
+        (SELECT json_agg(json_build_array(user_id, username, role, COALESCE(currency, 0)) ORDER BY user_id)
+         FROM users),
+        (SELECT json_agg(json_build_array(stock_id, symbol, current_price::float8))
+         FROM stocks),
+        (SELECT json_agg(json_build_array(user_id, stock_id, quantity, avg_purchase_price::float8))
+         FROM stock_portfolios
+         WHERE quantity > 0)
+"""
+
+class Valuation:
+    """
+    Cash, holdings value, unrealized P&L and net worth of every user at one set of prices.
+
+    rows are (user_id, username, role, cash, market_value, unrealized_pnl,
+    net_worth, rank) ordered by net worth. Ties share a rank (1, 2, 2, 4).
+    """
+
+    def __init__(self, users, stocks, holdings):
+        users, stocks, holdings = users or [], stocks or [], holdings or []
+        user_ids = np.array([row[0] for row in users], dtype=np.int64)
+        cash = np.array([row[3] for row in users], dtype=np.float64)
+        prices = np.array([row[2] for row in stocks], dtype=np.float64)
+        self._symbols = {row[0]: row[1] for row in stocks}
+        stock_index = {row[0]: i for i, row in enumerate(stocks)}
+        user_index = {user_id: i for i, user_id in enumerate(user_ids.tolist())}
+
+        # Holdings of deleted users or stocks have no row to land in
+        holdings = [row for row in holdings if row[0] in user_index and row[1] in stock_index]
+        holder = np.array([user_index[row[0]] for row in holdings], dtype=np.int64)
+        stock = np.array([stock_index[row[1]] for row in holdings], dtype=np.int64)
+        quantity = np.array([row[2] for row in holdings], dtype=np.float64)
+        cost = quantity * np.array([row[3] for row in holdings], dtype=np.float64)
+        value = quantity * prices[stock] if holdings else np.zeros(0)
+
+        market_value = np.bincount(holder, weights=value, minlength=len(users))
+        unrealized_pnl = market_value - np.bincount(holder, weights=cost, minlength=len(users))
+        net_worth = cash + market_value
+
+        # Rank = 1 + number of users with a strictly higher net worth
+        ascending = np.sort(net_worth)
+        ranks = len(net_worth) - np.searchsorted(ascending, net_worth, side="right") + 1
+        order = np.lexsort((user_ids, -net_worth))
+
+        self.rows = [
+            (int(user_ids[i]), users[i][1], users[i][2], float(cash[i]), float(market_value[i]),
+             float(unrealized_pnl[i]), float(net_worth[i]), int(ranks[i]))
+            for i in order
+        ]
+        self._index = {row[0]: i for i, row in enumerate(self.rows)}
+        self._holdings = {}
+        for (user_id, stock_id, qty, avg), holding_value in zip(holdings, value.tolist()):
+            self._holdings.setdefault(user_id, []).append(
+                (self._symbols[stock_id], qty, avg, holding_value, holding_value - qty * avg)
+            )
+
+    def __len__(self):
+        return len(self.rows)
+
+    def user(self, user_id):
+        """The user's row, or None if they are not in the snapshot"""
+        i = self._index.get(user_id)
+        return None if i is None else self.rows[i]
+
+    def holdings(self, user_id):
+        """(symbol, quantity, avg_purchase_price, market_value, unrealized_pnl) per stock the user holds"""
+        return self._holdings.get(user_id, [])
+
+    def top(self, k):
+        return self.rows[:k]
+
+    def page(self, number, size):
+        """Rows of a 1-based page"""
+        start = (number - 1) * size
+        return self.rows[start:start + size]
+
+class ValuationService:
+    """
+    Keeps the last Valuation and rebuilds it after a price tick, trade or
+    balance change in this process (a VALUATION_TABLES version moves), or
+    after max_age seconds.
+    """
+
+    def __init__(self, max_age=30):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._valuation = None
+        self._versions = None
+        self._built_at = 0.0
+        self.stats = {"hits": 0, "rebuilds": 0}
+
+    def get(self):
+        versions = get_query_cache().versions(VALUATION_TABLES)
+        with self._lock:
+            if self._valuation is not None and versions == self._versions and time.monotonic() - self._built_at < self.max_age:
+                self.stats["hits"] += 1
+                return self._valuation
+
+        valuation = Valuation(*select_query(VALUATION_QUERY, fetch_all=False))
+        with self._lock:
+            self._valuation = valuation
+            # The versions read before the query, so a write during it triggers another rebuild
+            self._versions = versions
+            self._built_at = time.monotonic()
+            self.stats["rebuilds"] += 1
+        return valuation
+
+@st.cache_resource
+def get_valuation_service():
+    """Process-wide valuation service"""
+    return ValuationService(max_age=int(st.secrets.get("leaderboard_max_age", 30)))
+
+def get_valuation():
+    """Current class-wide valuation"""
+    return get_valuation_service().get()
@@ -0,0 +1,106 @@
+# libs/price_ticker.py
+# Background stock price ticker, so no page run ever waits on a price fetch.
+import threading
+import time
+import streamlit as st
+from libs.db import get_conn, get_query_cache, select_query
+from libs.stocks import get_price_provider, price_tick_interval, update_stock_prices
+
+# Arbitrary key for pg_try_advisory_xact_lock so one process ticks at a time
+PRICE_TICKER_LOCK_ID = 5090002
+
+class PriceTicker:
+    """
+    Refreshes stock prices on a daemon thread every `interval` seconds.
+
+    Every process runs one, but each tick happens under a transaction-level
+    advisory lock. It only runs if the last tick is at least `interval` old,
+    so the database gets one tick per interval however many processes there
+    are, and leadership moves on by itself when a process dies. After each
+    cycle the ticker checks whether the prices moved, whoever wrote them. If
+    they did, it drops this process's cached stock reads and bumps `version`.
+    """
+
+    def __init__(self, interval=60, provider=None):
+        self.interval = interval
+        self.provider = provider
+        self.version = 0
+        self.last_error = None
+        self.last_change_at = None
+        self.stats = {"ticks": 0, "skipped": 0, "errors": 0}
+        self._seen = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._force = False
+        self._thread = threading.Thread(target=self._run, name="price-ticker", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def request_tick(self):
+        """Tick as soon as possible, even if the last tick is recent; does not wait for it"""
+        self._force = True
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            try:
+                self._tick()
+                self._publish()
+                self.last_error = None
+            except Exception as e:
+                self.stats["errors"] += 1
+                self.last_error = str(e)
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def _tick(self):
+        force, self._force = self._force, False
+        conn = get_conn()
+        conn.autocommit = False
+        cur = conn.cursor()
+        try:
+            # Slack so a timer that fires slightly early does not skip a whole interval
+            cur.execute("""
+                SELECT pg_try_advisory_xact_lock(%s),
+                       COALESCE(clock_timestamp() - MAX(last_updated) >= %s * interval '1 second', true)
+                FROM stocks
+            """, (PRICE_TICKER_LOCK_ID, self.interval * 0.9))
+            locked, due = cur.fetchone()
+            if locked and (due or force):
+                # Committed on its own connection while the lock is still held
+                update_stock_prices(self.provider or get_price_provider())
+                self.stats["ticks"] += 1
+            else:
+                self.stats["skipped"] += 1
+            conn.commit()
+        finally:
+            cur.close()
+            conn.close()
+
+    def _publish(self):
+        latest = select_query("SELECT MAX(last_updated) FROM stocks", fetch_all=False)[0]
+        if latest != self._seen:
+            # Writes from other processes never reach this process's query cache
+            get_query_cache().invalidate(["stocks", "stock_prices"])
+            with self._lock:
+                self._seen = latest
+                self.version += 1
+                self.last_change_at = time.time()
+
+    def status(self):
+        with self._lock:
+            return {
+                **self.stats,
+                "version": self.version,
+                "interval": self.interval,
+                "prices_as_of": self._seen,
+                "last_error": self.last_error,
+                "alive": self._thread.is_alive(),
+            }
+
+@st.cache_resource
+def get_price_ticker():
+    """Start this process's price ticker on first use"""
+    return PriceTicker(interval=price_tick_interval()).start()
@@ -0,0 +1,265 @@
+# libs/query_plans.py
+# EXPLAIN-based regression check for the secondary indexes in libs.db.MIGRATIONS.
+#
+# Run against a throwaway local database, never the class database:
+#     python -m libs.query_plans "postgresql://postgres@localhost/samdasu_plans"
+# It migrates the schema, loads a synthetic class-sized-many-times-over dataset
+# and fails if any hot query falls back to a sequential scan.
+import sys
+import psycopg2
+from libs.db import apply_migrations
+from libs.page_data import PROFILE_PAGE_QUERY, SHOP_PAGE_QUERY
+from libs.stocks import PRICE_BARS_QUERY
+
+# Plan nodes that count as index access for a relation
+INDEX_NODE_TYPES = {"Index Scan", "Index Only Scan", "Bitmap Heap Scan"}
+
+# (name, query, params, tables that must be read through an index)
+HOT_QUERIES = [
+    ("프로필 페이지 로더", PROFILE_PAGE_QUERY, {"user_id": 1500},
+     ["transactions", "user_items", "quest_completions"]),
+    ("상점 페이지 로더", SHOP_PAGE_QUERY, {"user_id": 1500},
+     ["user_items"]),
+    ("거래 내역 탐색 (다음 페이지)", """
+        SELECT t.transaction_id,
+               COALESCE(u1.username, '시스템') as from_user,
+               COALESCE(u2.username, '시스템') as to_user,
+               t.amount, t.type, t.description, t.created_at
+        FROM transactions t
+        LEFT JOIN users u1 ON t.from_user_id = u1.user_id
+        LEFT JOIN users u2 ON t.to_user_id = u2.user_id
+        WHERE (t.created_at, t.transaction_id) < (now() - interval '300 days', 150000)
+        ORDER BY t.created_at DESC, t.transaction_id DESC
+        LIMIT 50
+    """, None, ["transactions"]),
+    ("거래 내역 탐색 (유형 필터)", """
+        SELECT t.transaction_id,
+               COALESCE(u1.username, '시스템') as from_user,
+               COALESCE(u2.username, '시스템') as to_user,
+               t.amount, t.type, t.description, t.created_at
+        FROM transactions t
+        LEFT JOIN users u1 ON t.from_user_id = u1.user_id
+        LEFT JOIN users u2 ON t.to_user_id = u2.user_id
+        WHERE t.type = %(type)s
+        ORDER BY t.created_at DESC, t.transaction_id DESC
+        LIMIT 50
+    """, {"type": "refund"}, ["transactions"]),
+    ("블로그 댓글", """
+        SELECT c.comment_id, c.content, u.username, c.created_at
+        FROM blog_comments c
+        JOIN users u ON c.user_id = u.user_id
+        WHERE c.post_id = %(post_id)s
+        ORDER BY c.created_at
+    """, {"post_id": 250}, ["blog_comments"]),
+    ("가능한 퀘스트 (NOT IN)", """
+        SELECT quest_id, title, description, reward
+        FROM quests
+        WHERE quest_id NOT IN (
+            SELECT quest_id FROM quest_completions WHERE user_id = %(user_id)s
+        )
+    """, {"user_id": 1500}, ["quest_completions"]),
+    ("퀘스트 인증 대기열", """
+        SELECT qc.completion_id, qc.completed_at, q.title, q.reward, u.username
+        FROM quest_completions qc
+        JOIN quests q ON qc.quest_id = q.quest_id
+        JOIN users u ON qc.user_id = u.user_id
+        WHERE qc.verified_at IS NULL
+        ORDER BY qc.completed_at, qc.completion_id
+        LIMIT 20
+    """, None, ["quest_completions"]),
+    ("주가 차트 (주봉)", PRICE_BARS_QUERY, {"unit": "week", "symbol": "SYN25", "days": 90},
+     ["stock_prices"]),
+    ("활성 공지", """
+        SELECT title, content, heading_level
+        FROM notices
+        WHERE is_active = true
+        ORDER BY created_at DESC
+    """, None, ["notices"]),
+]
+
+SEED_STATEMENTS = [
+    """
+    INSERT INTO jobs (name, salary, description)
+    SELECT 'job ' || g, 100 + g * 10, 'synthetic'
+    FROM generate_series(1, 20) g
+    """,
+    """
+    INSERT INTO users (username, password, role, currency, job_id)
+    SELECT 'user' || g, 'x',
+           CASE WHEN g %% 30 = 0 THEN 'teacher' ELSE 'student' END,
+           (random() * 10000)::int,
+           CASE WHEN g %% 3 = 0 THEN (SELECT min(job_id) FROM jobs) + g %% 20 END
+    FROM generate_series(1, %(users)s) g
+    """,
+    """
+    INSERT INTO quests (title, description, reward)
+    SELECT 'quest ' || g, 'synthetic', 10 + g %% 50
+    FROM generate_series(1, %(quests)s) g
+    """,
+    """
+    WITH u AS (SELECT min(user_id) AS lo, max(user_id) AS hi FROM users),
+         q AS (SELECT min(quest_id) AS lo, max(quest_id) AS hi FROM quests),
+         c AS (
+             SELECT q.lo + (random() * (q.hi - q.lo))::int AS quest_id,
+                    u.lo + (random() * (u.hi - u.lo))::int AS user_id,
+                    now() - random() * interval '365 days' AS completed_at,
+                    random() < 0.99 AS verified
+             FROM generate_series(1, %(quest_completions)s), u, q
+         )
+    INSERT INTO quest_completions (quest_id, user_id, completed_at, verified_at)
+    SELECT quest_id, user_id, completed_at, CASE WHEN verified THEN completed_at END
+    FROM c
+    ON CONFLICT (user_id, quest_id) DO NOTHING
+    """,
+    """
+    WITH u AS (SELECT min(user_id) AS lo, max(user_id) AS hi FROM users)
+    INSERT INTO transactions (from_user_id, to_user_id, amount, type, description, created_at)
+    SELECT CASE WHEN random() < 0.5 THEN u.lo + (random() * (u.hi - u.lo))::int END,
+           u.lo + (random() * (u.hi - u.lo))::int,
+           1 + (random() * 500)::int,
+           (ARRAY['transfer', 'salary', 'quest', 'refund'])[1 + (random() * 3)::int],
+           'synthetic',
+           now() - random() * interval '730 days'
+    FROM generate_series(1, %(transactions)s), u
+    """,
+    """
+    INSERT INTO shop_items (name, description, type, price, image_url)
+    SELECT 'item ' || g, 'synthetic',
+           (ARRAY['avatar', 'badge', 'background', 'font', 'color'])[1 + g %% 5],
+           100 + g * 10, ''
+    FROM generate_series(1, 50) g
+    """,
+    """
+    WITH u AS (SELECT min(user_id) AS lo, max(user_id) AS hi FROM users),
+         i AS (SELECT min(item_id) AS lo, max(item_id) AS hi FROM shop_items)
+    INSERT INTO user_items (user_id, item_id, is_equipped, purchased_at)
+    SELECT u.lo + (random() * (u.hi - u.lo))::int,
+           i.lo + (random() * (i.hi - i.lo))::int,
+           random() < 0.1,
+           now() - random() * interval '365 days'
+    FROM generate_series(1, %(user_items)s), u, i
+    """,
+    """
+    WITH u AS (SELECT min(user_id) AS lo, max(user_id) AS hi FROM users)
+    INSERT INTO blog_posts (user_id, title, content, created_at)
+    SELECT u.lo + (random() * (u.hi - u.lo))::int, 'post ' || g, 'synthetic',
+           now() - random() * interval '365 days'
+    FROM generate_series(1, %(blog_posts)s) g, u
+    """,
+    """
+    WITH u AS (SELECT min(user_id) AS lo, max(user_id) AS hi FROM users),
+         p AS (SELECT min(post_id) AS lo, max(post_id) AS hi FROM blog_posts)
+    INSERT INTO blog_comments (post_id, user_id, content, created_at)
+    SELECT p.lo + (random() * (p.hi - p.lo))::int,
+           u.lo + (random() * (u.hi - u.lo))::int,
+           'synthetic', now() - random() * interval '365 days'
+    FROM generate_series(1, %(blog_comments)s), u, p
+    """,
+    """
+    INSERT INTO stocks (symbol, name, current_price)
+    SELECT 'SYN' || g, 'synthetic', 100
+    FROM generate_series(1, 50) g
+    """,
+    """
+    INSERT INTO stock_prices (stock_id, recorded_at, price)
+    SELECT s.stock_id, now() - g * interval '1 minute' * 525600 / %(stock_prices)s * 50, 50 + random() * 100
+    FROM stocks s
+    CROSS JOIN generate_series(1, %(stock_prices)s / 50) g
+    """,
+    """
+    INSERT INTO notices (title, content, heading_level, is_active, created_at)
+    SELECT 'notice ' || g, 'synthetic', 1 + g %% 6, g %% 50 = 0,
+           now() - random() * interval '730 days'
+    FROM generate_series(1, %(notices)s) g
+    """,
+]
+
+DEFAULT_SIZES = {
+    "users": 3000,
+    "quests": 200,
+    "quest_completions": 100000,
+    "transactions": 300000,
+    "user_items": 60000,
+    "blog_posts": 5000,
+    "blog_comments": 100000,
+    "notices": 2000,
+    "stock_prices": 200000,
+}
+
+def seed_synthetic_data(conn, sizes=None):
+    """Load a synthetic dataset into an empty database and refresh planner statistics"""
+    sizes = {**DEFAULT_SIZES, **(sizes or {})}
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM users")
+    if cur.fetchone()[0]:
+        raise ValueError("Refusing to seed a database that already has users")
+
+    for statement in SEED_STATEMENTS:
+        cur.execute(statement, sizes)
+    conn.commit()
+
+    # ANALYZE cannot run inside a transaction block
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    cur.execute("ANALYZE")
+    conn.autocommit = autocommit
+    cur.close()
+
+def _plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _plan_nodes(child)
+
+def explain(conn, query, params=None):
+    """Return (node type, relation name) for every node of the query plan"""
+    cur = conn.cursor()
+    cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+    plan = cur.fetchone()[0][0]["Plan"]
+    cur.close()
+    return [(node["Node Type"], node.get("Relation Name")) for node in _plan_nodes(plan)]
+
+def check_query_plans(conn, queries=HOT_QUERIES):
+    """
+    EXPLAIN every hot query and report whether the required tables are read through an index.
+
+    Returns a list of (name, ok, problems, nodes).
+    """
+    results = []
+    for name, query, params, tables in queries:
+        nodes = explain(conn, query, params)
+        problems = []
+        for table in tables:
+            if any(node_type == "Seq Scan" and relation == table for node_type, relation in nodes):
+                problems.append(f"{table}: Seq Scan")
+            elif not any(node_type in INDEX_NODE_TYPES and relation == table for node_type, relation in nodes):
+                problems.append(f"{table}: no index scan")
+        results.append((name, not problems, problems, nodes))
+    return results
+
+def main(argv):
+    if len(argv) != 2:
+        print("usage: python -m libs.query_plans <dsn of a throwaway database>")
+        return 2
+
+    conn = psycopg2.connect(argv[1])
+    try:
+        apply_migrations(conn)
+        seed_synthetic_data(conn)
+        conn.autocommit = True
+        results = check_query_plans(conn)
+    finally:
+        conn.close()
+
+    failed = 0
+    for name, ok, problems, nodes in results:
+        print(f"{'PASS' if ok else 'FAIL'}  {name}")
+        if not ok:
+            failed += 1
+            for problem in problems:
+                print(f"      {problem}")
+            for node_type, relation in nodes:
+                print(f"        {node_type}{f' on {relation}' if relation else ''}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
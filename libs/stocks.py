@@ -1,166 +1,633 @@
 import streamlit as st
-import yfinance as yf
-from datetime import datetime, timedelta
-from libs.db import get_conn
-from libs.currency import get_user_currency
+import math
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from libs.db import get_conn, select_query
+from libs.currency import LEDGER_CTES, LEDGER_ENTRY_CTES
+from libs.market_sim import simulate_paths
 
-def update_stock_prices():
-    """Update stock prices in the database"""
+# ---------------------------------------------------------------------------
+# Price providers: fetch(current) takes {symbol: last known price or None} and
+# returns {symbol: new price} for every symbol it could price.
+# ---------------------------------------------------------------------------
+
+class PriceProvider:
+    """Source of stock prices for update_stock_prices"""
+    name = None
+
+    def fetch(self, current):
+        raise NotImplementedError
+
+    def history(self, symbol, start, end):
+        """Daily (timestamp, price) closes in [start, end); simulated markets have no past"""
+        return []
+
+class YahooPriceProvider(PriceProvider):
+    """
+    Live prices from Yahoo Finance.
+
+    All symbols are fetched with one bulk download. Symbols missing from it are
+    retried one by one on a thread pool instead of sequentially.
+    """
+    name = "yahoo"
+
+    def __init__(self, max_workers=8):
+        self.max_workers = max_workers
+
+    def fetch(self, current):
+        # Only this provider needs the network client
+        import yfinance as yf
+
+        symbols = list(current)
+        if not symbols:
+            return {}
+        prices = {}
+        data = yf.download(symbols, period="5d", progress=False, threads=self.max_workers)
+        if not data.empty:
+            closes = data["Close"]
+            if not hasattr(closes, "columns"):
+                closes = closes.to_frame(symbols[0])
+            last = closes.ffill().iloc[-1]
+            prices = {symbol: float(last[symbol]) for symbol in symbols
+                      if symbol in last and not math.isnan(last[symbol])}
+
+        def fetch_one(symbol):
+            try:
+                return symbol, yf.Ticker(symbol).fast_info["lastPrice"]
+            except Exception:
+                return symbol, None
+
+        missing = [symbol for symbol in symbols if symbol not in prices]
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing))) as pool:
+                for symbol, price in pool.map(fetch_one, missing):
+                    if price:
+                        prices[symbol] = float(price)
+        return prices
+
+    def history(self, symbol, start, end):
+        import yfinance as yf
+
+        closes = yf.Ticker(symbol).history(start=start, end=end, interval="1d")["Close"].dropna()
+        return [(timestamp.to_pydatetime(), float(price)) for timestamp, price in closes.items()]
+
+class SimulatedPriceProvider(PriceProvider):
+    """
+    Offline random walk for classrooms without network access and for tests.
+
+    Each call moves every known price by a log-normal step of the given
+    volatility. Symbols without a last price cannot be priced.
+    """
+    name = "simulated"
+
+    def __init__(self, volatility=0.02, seed=None):
+        self.volatility = volatility
+        self._random = random.Random(seed)
+
+    def fetch(self, current):
+        return {
+            symbol: max(round(float(price) * math.exp(self._random.gauss(0, self.volatility)), 2), 0.01)
+            for symbol, price in current.items()
+            if price
+        }
+
+class MarketPriceProvider(PriceProvider):
+    """
+    Offline simulated market (libs.market_sim).
+
+    Each call advances every stock together by `steps` one-minute GBM steps.
+    get_price_provider sets steps to the ticker interval in minutes, so one
+    wall-clock minute is one simulated trading minute. It uses the drift,
+    volatility and market_correlation that teachers set per stock. Stocks
+    without a price yet are listed at LISTING_PRICE.
+    """
+    name = "market"
+
+    LISTING_PRICE = 100.0
+
+    def __init__(self, steps=1, seed=None):
+        self.steps = steps
+        self._rng = np.random.default_rng(seed)
+
+    def fetch(self, current):
+        prices = {symbol: self.LISTING_PRICE for symbol, price in current.items() if not price or price <= 0}
+        parameters = {row[1]: row[4:] for row in get_market_parameters()}
+        symbols = [symbol for symbol in current if symbol not in prices and symbol in parameters]
+        if symbols:
+            drift, volatility, correlation = zip(*(parameters[symbol] for symbol in symbols))
+            paths = simulate_paths(
+                [float(current[symbol]) for symbol in symbols], drift, volatility, correlation,
+                steps=self.steps, rng=self._rng
+            )
+            closes = np.maximum(np.round(paths[-1], 2), 0.01)
+            prices.update(zip(symbols, closes.tolist()))
+        return prices
+
+PRICE_PROVIDERS = {provider.name: provider for provider in (YahooPriceProvider, SimulatedPriceProvider, MarketPriceProvider)}
+
+def price_tick_interval():
+    """Seconds between background price ticks (price_tick_interval secret)"""
+    return int(st.secrets.get("price_tick_interval", 60))
+
+@st.cache_resource
+def get_price_provider():
+    """Process-wide price provider chosen by the price_provider secret (default: the simulated market)"""
+    name = st.secrets.get("price_provider", "market")
+    if name == MarketPriceProvider.name:
+        # Simulated time advances at the speed of the ticker
+        return MarketPriceProvider(steps=max(1, round(price_tick_interval() / 60)))
+    return PRICE_PROVIDERS[name]()
+
+def get_market_parameters():
+    """(stock_id, symbol, name, current_price, drift, volatility, market_correlation) for every stock"""
+    return select_query("""
+        SELECT stock_id, symbol, name, current_price,
+               drift::float8, volatility::float8, market_correlation::float8
+        FROM stocks
+        ORDER BY symbol
+    """)
+
+def set_market_parameters(rows):
+    """Save teacher-set (stock_id, drift, volatility, market_correlation) rows in one statement"""
+    rows = list(rows)
+    if not rows:
+        return
+    stock_ids, drifts, volatilities, correlations = (list(column) for column in zip(*rows))
     conn = get_conn()
     cur = conn.cursor()
-    
-    # Get all stocks
-    cur.execute("SELECT stock_id, symbol FROM stocks")
-    stocks = cur.fetchall()
-    
-    for stock_id, symbol in stocks:
+    try:
+        cur.execute("""
+            UPDATE stocks s
+            SET drift = v.drift, volatility = v.volatility, market_correlation = v.market_correlation
+            FROM unnest(%(stock_ids)s::int[], %(drifts)s::numeric[], %(volatilities)s::numeric[],
+                        %(correlations)s::numeric[]) AS v(stock_id, drift, volatility, market_correlation)
+            WHERE s.stock_id = v.stock_id
+        """, {
+            "stock_ids": stock_ids,
+            "drifts": drifts,
+            "volatilities": volatilities,
+            "correlations": correlations,
+        })
+    finally:
+        cur.close()
+        conn.close()
+
+# Sets the new prices and appends them to the time series in one statement
+UPDATE_PRICES_QUERY = """
+    WITH updated AS (
+        UPDATE stocks s
+        SET current_price = v.price, last_updated = now()
+        FROM unnest(%(stock_ids)s::int[], %(prices)s::numeric[]) AS v(stock_id, price)
+        WHERE s.stock_id = v.stock_id
+        RETURNING s.stock_id, s.current_price, s.last_updated
+    )
+    INSERT INTO stock_prices (stock_id, recorded_at, price)
+    SELECT stock_id, last_updated, current_price FROM updated
+    ON CONFLICT DO NOTHING
+"""
+
+def update_stock_prices(provider=None):
+    """
+    Refresh every stock's price with one provider call and one statement,
+    which also records the new prices in stock_prices. Orders triggered by
+    the new prices are settled in the same transaction.
+
+    Returns {symbol: new price}; symbols the provider could not price keep their old price.
+    """
+    provider = provider or get_price_provider()
+    stocks = select_query("SELECT stock_id, symbol, current_price FROM stocks")
+    if not stocks:
+        return {}
+    prices = provider.fetch({symbol: price for _, symbol, price in stocks})
+    updates = [(stock_id, prices[symbol]) for stock_id, symbol, _ in stocks if symbol in prices]
+    if updates:
+        conn = get_conn()
+        conn.autocommit = False
+        cur = conn.cursor()
         try:
-            stock = yf.Ticker(symbol)
-            current_price = stock.info.get('currentPrice', 0)
-            
-            if current_price:
-                cur.execute("""
-                    UPDATE stocks 
-                    SET current_price = %s, last_updated = now()
-                    WHERE stock_id = %s
-                """, (current_price, stock_id))
-        
-        except Exception as e:
-            st.error(f"Error updating {symbol}: {str(e)}")
-    
-    conn.commit()
+            cur.execute(UPDATE_PRICES_QUERY, {
+                "stock_ids": [stock_id for stock_id, _ in updates],
+                "prices": [price for _, price in updates],
+            })
+            settle_orders(cur)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+            conn.close()
+    return {symbol: prices[symbol] for _, symbol, _ in stocks if symbol in prices}
+
+# ---------------------------------------------------------------------------
+# Limit and stop orders, settled set-based at the tick price. A tick runs the
+# same three statements however many orders trigger.
+# ---------------------------------------------------------------------------
+
+ORDER_SIDES = ("buy", "sell")
+ORDER_TYPES = ("limit", "stop")
+
+# Limit orders fill at the trigger price or better, stop orders once the price crosses it
+ORDER_TRIGGERED_SQL = """
+    CASE o.order_type
+        WHEN 'limit' THEN (o.side = 'buy' AND s.current_price <= o.trigger_price)
+                       OR (o.side = 'sell' AND s.current_price >= o.trigger_price)
+        ELSE (o.side = 'buy' AND s.current_price >= o.trigger_price)
+          OR (o.side = 'sell' AND s.current_price <= o.trigger_price)
+    END
+"""
+
+# Sells fill oldest first while the holding lasts; proceeds go through the ledger
+SETTLE_SELL_ORDERS_QUERY = """
+    WITH candidates AS (
+        SELECT o.order_id, o.user_id, o.stock_id, o.quantity, s.current_price AS price
+        FROM stock_orders o
+        JOIN stocks s ON s.stock_id = o.stock_id
+        WHERE o.status = 'open' AND o.side = 'sell' AND """ + ORDER_TRIGGERED_SQL + """
+        FOR UPDATE OF o
+    ),
+    fills AS (
+        SELECT c.order_id, c.user_id, c.stock_id, c.quantity, c.price
+        FROM (
+            SELECT *, SUM(quantity) OVER (PARTITION BY user_id, stock_id ORDER BY order_id) AS shares_needed
+            FROM candidates
+        ) c
+        JOIN stock_portfolios p ON p.user_id = c.user_id AND p.stock_id = c.stock_id
+        WHERE c.shares_needed <= p.quantity
+    ),
+    shares_out AS (
+        UPDATE stock_portfolios p
+        SET quantity = p.quantity - f.quantity, updated_at = now()
+        FROM (SELECT user_id, stock_id, SUM(quantity) AS quantity FROM fills GROUP BY user_id, stock_id) f
+        WHERE p.user_id = f.user_id AND p.stock_id = f.stock_id AND p.quantity >= f.quantity
+        RETURNING p.user_id, p.stock_id
+    ),
+    settled AS (
+        SELECT f.* FROM fills f JOIN shares_out USING (user_id, stock_id)
+    ),
+    closed AS (
+        UPDATE stock_orders o
+        SET status = 'filled', fill_price = settled.price, closed_at = now()
+        FROM settled
+        WHERE o.order_id = settled.order_id
+    ),
+    trades AS (
+        INSERT INTO stock_transactions (user_id, stock_id, type, quantity, price, total_amount, order_id)
+        SELECT user_id, stock_id, 'sell', quantity, price, price * quantity, order_id FROM settled
+    ),
+    tx AS (
+        INSERT INTO transactions (from_user_id, to_user_id, amount, type, description, created_by)
+        SELECT NULL, user_id, ROUND(price * quantity)::int, 'stock',
+               '주식 주문 #' || order_id || ' 매도 (' || quantity || '주)', user_id
+        FROM settled
+        RETURNING transaction_id, from_user_id, to_user_id, amount, created_at
+    ),
+""" + LEDGER_CTES + """
+    SELECT COUNT(*) FROM settled
+"""
+
+# Buys fill oldest first while the cash lasts. The debit is a guarded UPDATE
+# like TRANSFER_QUERY, so a concurrent spend leaves the orders open instead of overdrawing.
+SETTLE_BUY_ORDERS_QUERY = """
+    WITH candidates AS (
+        SELECT o.order_id, o.user_id, o.stock_id, o.quantity, s.current_price AS price,
+               ROUND(s.current_price * o.quantity)::int AS amount
+        FROM stock_orders o
+        JOIN stocks s ON s.stock_id = o.stock_id
+        WHERE o.status = 'open' AND o.side = 'buy' AND """ + ORDER_TRIGGERED_SQL + """
+        FOR UPDATE OF o
+    ),
+    fills AS (
+        SELECT c.order_id, c.user_id, c.stock_id, c.quantity, c.price, c.amount
+        FROM (
+            SELECT *, SUM(amount) OVER (PARTITION BY user_id ORDER BY order_id) AS cash_needed
+            FROM candidates
+        ) c
+        JOIN users u ON u.user_id = c.user_id
+        WHERE c.cash_needed <= COALESCE(u.currency, 0)
+    ),
+    debit AS (
+        UPDATE users u
+        SET currency = u.currency - f.amount
+        FROM (SELECT user_id, SUM(amount) AS amount FROM fills GROUP BY user_id) f
+        WHERE u.user_id = f.user_id AND u.currency >= f.amount
+        RETURNING u.user_id
+    ),
+    settled AS (
+        SELECT f.* FROM fills f JOIN debit USING (user_id)
+    ),
+    shares_in AS (
+        INSERT INTO stock_portfolios AS p (user_id, stock_id, quantity, avg_purchase_price)
+        SELECT user_id, stock_id, SUM(quantity), SUM(price * quantity) / SUM(quantity)
+        FROM settled
+        GROUP BY user_id, stock_id
+        ON CONFLICT (user_id, stock_id) DO UPDATE
+        SET avg_purchase_price = (p.quantity * p.avg_purchase_price + EXCLUDED.quantity * EXCLUDED.avg_purchase_price)
+                                 / (p.quantity + EXCLUDED.quantity),
+            quantity = p.quantity + EXCLUDED.quantity,
+            updated_at = now()
+    ),
+    closed AS (
+        UPDATE stock_orders o
+        SET status = 'filled', fill_price = settled.price, closed_at = now()
+        FROM settled
+        WHERE o.order_id = settled.order_id
+    ),
+    trades AS (
+        INSERT INTO stock_transactions (user_id, stock_id, type, quantity, price, total_amount, order_id)
+        SELECT user_id, stock_id, 'buy', quantity, price, price * quantity, order_id FROM settled
+    ),
+    tx AS (
+        INSERT INTO transactions (from_user_id, to_user_id, amount, type, description, created_by)
+        SELECT user_id, NULL, amount, 'stock',
+               '주식 주문 #' || order_id || ' 매수 (' || quantity || '주)', user_id
+        FROM settled
+        RETURNING transaction_id, from_user_id, to_user_id, amount, created_at
+    ),
+""" + LEDGER_ENTRY_CTES + """
+    SELECT COUNT(*) FROM settled
+"""
+
+def settle_orders(cur):
+    """
+    Fill every open order triggered by the current prices, on the caller's cursor.
+
+    Sells settle before buys, each in one statement, so a row is never
+    changed twice by one statement. The buy statement sees the sell
+    credits, so this tick's sell proceeds can pay for this tick's buys.
+    Orders that cannot be covered stay open. Returns (sold, bought).
+    """
+    cur.execute(SETTLE_SELL_ORDERS_QUERY)
+    sold = cur.fetchone()[0]
+    cur.execute(SETTLE_BUY_ORDERS_QUERY)
+    bought = cur.fetchone()[0]
+    if sold:
+        cur.execute("DELETE FROM stock_portfolios WHERE quantity = 0")
+    return sold, bought
 
-def add_stock(symbol, name):
-    """Add a new stock to track"""
+def place_order(user_id, stock_id, side, order_type, quantity, trigger_price):
+    """
+    Queue a limit or stop order, settled by the next tick whose price triggers it.
+
+    Cash and shares are checked at settlement, not here. Returns the order id.
+    """
+    if side not in ORDER_SIDES or order_type not in ORDER_TYPES:
+        raise ValueError("Unknown order side or type")
+    if int(quantity) <= 0 or float(trigger_price) <= 0:
+        raise ValueError("Quantity and price must be positive")
     conn = get_conn()
     cur = conn.cursor()
-    
     try:
-        stock = yf.Ticker(symbol)
-        current_price = stock.info.get('currentPrice', 0)
-        
-        if not current_price:
-            raise ValueError("Could not get current price for stock")
-        
         cur.execute("""
-            INSERT INTO stocks (symbol, name, current_price)
-            VALUES (%s, %s, %s)
-            RETURNING stock_id
-        """, (symbol, name, current_price))
-        
-        stock_id = cur.fetchone()[0]
-        conn.commit()
-        return stock_id
-    
-    except Exception as e:
-        conn.rollback()
-        raise e
+            INSERT INTO stock_orders (user_id, stock_id, side, order_type, quantity, trigger_price)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            RETURNING order_id
+        """, (user_id, stock_id, side, order_type, int(quantity), trigger_price))
+        return cur.fetchone()[0]
+    finally:
+        cur.close()
+        conn.close()
 
-def buy_stock(user_id, stock_id, quantity):
-    """Buy stocks for a user"""
+def cancel_order(user_id, order_id):
+    """Cancel one of the user's open orders; False if it was already filled or cancelled"""
     conn = get_conn()
     cur = conn.cursor()
-    
     try:
-        # Get current stock price
-        cur.execute("SELECT current_price FROM stocks WHERE stock_id = %s", (stock_id,))
-        current_price = cur.fetchone()[0]
-        total_cost = current_price * quantity
-        
-        # Check if user has enough currency
-        user_balance = get_user_currency(user_id)
-        if user_balance < total_cost:
-            raise ValueError("Insufficient balance")
-        
-        # Get or create portfolio entry
+        # Waits for a settling tick to commit, then sees the order's final status
         cur.execute("""
-            SELECT portfolio_id, quantity, average_price 
-            FROM stock_portfolios 
-            WHERE user_id = %s AND stock_id = %s
-        """, (user_id, stock_id))
-        portfolio = cur.fetchone()
-        
-        if portfolio:
-            portfolio_id, current_quantity, current_avg_price = portfolio
-            new_quantity = current_quantity + quantity
-            new_avg_price = ((current_quantity * current_avg_price) + (quantity * current_price)) / new_quantity
-            
-            cur.execute("""
-                UPDATE stock_portfolios 
-                SET quantity = %s, average_price = %s, updated_at = now()
-                WHERE portfolio_id = %s
-            """, (new_quantity, new_avg_price, portfolio_id))
-        else:
-            cur.execute("""
-                INSERT INTO stock_portfolios (user_id, stock_id, quantity, average_price)
-                VALUES (%s, %s, %s, %s)
-            """, (user_id, stock_id, quantity, current_price))
-        
-        # Record transaction
+            UPDATE stock_orders
+            SET status = 'cancelled', closed_at = now()
+            WHERE order_id = %s AND user_id = %s AND status = 'open'
+        """, (order_id, user_id))
+        return cur.rowcount == 1
+    finally:
+        cur.close()
+        conn.close()
+
+def get_user_orders(user_id, limit=50):
+    """
+    The user's most recent orders as
+    (order_id, symbol, side, order_type, quantity, trigger_price, status, fill_price, created_at).
+    """
+    return select_query("""
+        SELECT o.order_id, s.symbol, o.side, o.order_type, o.quantity, o.trigger_price,
+               o.status, o.fill_price, o.created_at
+        FROM stock_orders o
+        JOIN stocks s ON o.stock_id = s.stock_id
+        WHERE o.user_id = %s
+        ORDER BY o.order_id DESC
+        LIMIT %s
+    """, (user_id, limit))
+
+# Ranges of the last `days` with no tick for longer than max_gap, per stock:
+# before the first tick, between two ticks and after the last one
+MISSING_RANGES_QUERY = """
+    WITH window_start AS (
+        SELECT now() - %(days)s * interval '1 day' AS t
+    ),
+    ticks AS (
+        SELECT s.stock_id, s.symbol, p.recorded_at
+        FROM stocks s
+        CROSS JOIN window_start w
+        LEFT JOIN stock_prices p ON p.stock_id = s.stock_id AND p.recorded_at >= w.t
+    ),
+    edges AS (
+        SELECT stock_id, symbol,
+               LAG(recorded_at) OVER (PARTITION BY stock_id ORDER BY recorded_at) AS gap_start,
+               recorded_at AS gap_end
+        FROM ticks
+        WHERE recorded_at IS NOT NULL
+        UNION ALL
+        SELECT stock_id, symbol, MAX(recorded_at), now()
+        FROM ticks
+        GROUP BY stock_id, symbol
+    )
+    SELECT stock_id, symbol, COALESCE(gap_start, (SELECT t FROM window_start)), gap_end
+    FROM edges
+    WHERE gap_end - COALESCE(gap_start, (SELECT t FROM window_start)) > %(max_gap)s
+    ORDER BY stock_id, 3
+"""
+
+def backfill_stock_prices(days=365, max_gap=timedelta(days=3), provider=None, max_workers=8):
+    """
+    Fill holes in the last `days` of stock_prices from the provider's daily history.
+
+    Only ranges with no tick for longer than max_gap are requested, so running
+    it again only fetches what is still missing. The requests run on a thread
+    pool and all rows are written with one INSERT. Returns the number of rows added.
+    """
+    provider = provider or get_price_provider()
+    ranges = select_query(MISSING_RANGES_QUERY, {"days": days, "max_gap": max_gap})
+    if not ranges:
+        return 0
+
+    def fetch_range(missing):
+        stock_id, symbol, start, end = missing
+        try:
+            return [(stock_id, recorded_at, price) for recorded_at, price in provider.history(symbol, start, end)]
+        except Exception:
+            return []
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(ranges))) as pool:
+        rows = [row for fetched in pool.map(fetch_range, ranges) for row in fetched]
+    if not rows:
+        return 0
+
+    conn = get_conn()
+    cur = conn.cursor()
+    try:
         cur.execute("""
-            INSERT INTO stock_transactions (user_id, stock_id, type, quantity, price, total_amount)
-            VALUES (%s, %s, 'buy', %s, %s, %s)
-        """, (user_id, stock_id, quantity, current_price, total_cost))
-        
-        # Deduct from user's balance
-        cur.execute("UPDATE users SET currency = currency - %s WHERE user_id = %s", (total_cost, user_id))
+            INSERT INTO stock_prices (stock_id, recorded_at, price)
+            SELECT * FROM unnest(%(stock_ids)s::int[], %(recorded_at)s::timestamptz[], %(prices)s::numeric[])
+            ON CONFLICT DO NOTHING
+        """, {
+            "stock_ids": [row[0] for row in rows],
+            "recorded_at": [row[1] for row in rows],
+            "prices": [row[2] for row in rows],
+        })
+        return cur.rowcount
+    finally:
+        cur.close()
+        conn.close()
+
+def add_stock(symbol, name, current_price=None, provider=None):
+    """Add a new stock to track, priced by the provider unless current_price is given"""
+    if current_price is None:
+        current_price = (provider or get_price_provider()).fetch({symbol: None}).get(symbol)
+    if not current_price:
+        raise ValueError("Could not get current price for stock")
+
+    conn = get_conn()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute("""
+            WITH listed AS (
+                INSERT INTO stocks (symbol, name, current_price)
+                VALUES (%s, %s, %s)
+                RETURNING stock_id, current_price, last_updated
+            ),
+            first_tick AS (
+                INSERT INTO stock_prices (stock_id, recorded_at, price)
+                SELECT stock_id, last_updated, current_price FROM listed
+            )
+            SELECT stock_id FROM listed
+        """, (symbol, name, current_price))
         
+        stock_id = cur.fetchone()[0]
         conn.commit()
-        return True
+        return stock_id
     
     except Exception as e:
         conn.rollback()
         raise e
 
-def sell_stock(user_id, stock_id, quantity):
-    """Sell stocks for a user"""
+# Market orders at the current price. The debit (buy) or the share decrement (sell)
+# is guarded like the settlement queries, so concurrent trades cannot overdraw.
+BUY_STOCK_QUERY = """
+    WITH quote AS (
+        SELECT stock_id, current_price AS price, ROUND(current_price * %(quantity)s)::int AS amount
+        FROM stocks
+        WHERE stock_id = %(stock_id)s
+    ),
+    debit AS (
+        UPDATE users u
+        SET currency = u.currency - q.amount
+        FROM quote q
+        WHERE u.user_id = %(user_id)s AND u.currency >= q.amount
+        RETURNING u.user_id, q.stock_id, q.price, q.amount
+    ),
+    shares_in AS (
+        INSERT INTO stock_portfolios AS p (user_id, stock_id, quantity, avg_purchase_price)
+        SELECT user_id, stock_id, %(quantity)s, price FROM debit
+        ON CONFLICT (user_id, stock_id) DO UPDATE
+        SET avg_purchase_price = (p.quantity * p.avg_purchase_price + EXCLUDED.quantity * EXCLUDED.avg_purchase_price)
+                                 / (p.quantity + EXCLUDED.quantity),
+            quantity = p.quantity + EXCLUDED.quantity,
+            updated_at = now()
+    ),
+    trades AS (
+        INSERT INTO stock_transactions (user_id, stock_id, type, quantity, price, total_amount)
+        SELECT user_id, stock_id, 'buy', %(quantity)s, price, price * %(quantity)s FROM debit
+    ),
+    tx AS (
+        INSERT INTO transactions (from_user_id, to_user_id, amount, type, description, created_by)
+        SELECT user_id, NULL, amount, 'stock', '주식 매수 (' || %(quantity)s || '주)', user_id FROM debit
+        RETURNING transaction_id, from_user_id, to_user_id, amount, created_at
+    ),
+""" + LEDGER_ENTRY_CTES + """
+    SELECT (SELECT price FROM quote), (SELECT amount FROM debit)
+"""
+
+SELL_STOCK_QUERY = """
+    WITH quote AS (
+        SELECT stock_id, current_price AS price, ROUND(current_price * %(quantity)s)::int AS amount
+        FROM stocks
+        WHERE stock_id = %(stock_id)s
+    ),
+    shares_out AS (
+        UPDATE stock_portfolios p
+        SET quantity = p.quantity - %(quantity)s, updated_at = now()
+        FROM quote q
+        WHERE p.user_id = %(user_id)s AND p.stock_id = q.stock_id AND p.quantity >= %(quantity)s
+        RETURNING p.user_id, p.stock_id, q.price, q.amount
+    ),
+    trades AS (
+        INSERT INTO stock_transactions (user_id, stock_id, type, quantity, price, total_amount)
+        SELECT user_id, stock_id, 'sell', %(quantity)s, price, price * %(quantity)s FROM shares_out
+    ),
+    tx AS (
+        INSERT INTO transactions (from_user_id, to_user_id, amount, type, description, created_by)
+        SELECT NULL, user_id, amount, 'stock', '주식 매도 (' || %(quantity)s || '주)', user_id FROM shares_out
+        RETURNING transaction_id, from_user_id, to_user_id, amount, created_at
+    ),
+""" + LEDGER_CTES + """
+    SELECT (SELECT price FROM quote), (SELECT amount FROM shares_out)
+"""
+
+def _trade(query, user_id, stock_id, quantity):
+    """Run a market order in its own transaction; returns (price, amount), amount None if it was refused"""
+    quantity = int(quantity)
+    if quantity <= 0:
+        raise ValueError("Quantity must be positive")
     conn = get_conn()
+    conn.autocommit = False
     cur = conn.cursor()
-    
     try:
-        # Get current stock price
-        cur.execute("SELECT current_price FROM stocks WHERE stock_id = %s", (stock_id,))
-        current_price = cur.fetchone()[0]
-        total_value = current_price * quantity
-        
-        # Check if user has enough stocks
-        cur.execute("""
-            SELECT portfolio_id, quantity 
-            FROM stock_portfolios 
-            WHERE user_id = %s AND stock_id = %s
-        """, (user_id, stock_id))
-        portfolio = cur.fetchone()
-        
-        if not portfolio or portfolio[1] < quantity:
-            raise ValueError("Insufficient stocks")
-        
-        portfolio_id, current_quantity = portfolio
-        new_quantity = current_quantity - quantity
-        
-        if new_quantity == 0:
-            cur.execute("DELETE FROM stock_portfolios WHERE portfolio_id = %s", (portfolio_id,))
-        else:
+        cur.execute(query, {"user_id": user_id, "stock_id": stock_id, "quantity": quantity})
+        price, amount = cur.fetchone()
+        if amount is not None and query is SELL_STOCK_QUERY:
             cur.execute("""
-                UPDATE stock_portfolios 
-                SET quantity = %s, updated_at = now()
-                WHERE portfolio_id = %s
-            """, (new_quantity, portfolio_id))
-        
-        # Record transaction
-        cur.execute("""
-            INSERT INTO stock_transactions (user_id, stock_id, type, quantity, price, total_amount)
-            VALUES (%s, %s, 'sell', %s, %s, %s)
-        """, (user_id, stock_id, quantity, current_price, total_value))
-        
-        # Add to user's balance
-        cur.execute("UPDATE users SET currency = currency + %s WHERE user_id = %s", (total_value, user_id))
-        
+                DELETE FROM stock_portfolios
+                WHERE user_id = %s AND stock_id = %s AND quantity = 0
+            """, (user_id, stock_id))
         conn.commit()
-        return True
-    
-    except Exception as e:
+    except Exception:
         conn.rollback()
-        raise e
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    if price is None:
+        raise LookupError("Unknown stock")
+    return price, amount
+
+def buy_stock(user_id, stock_id, quantity):
+    """Buy stocks for a user at the current price"""
+    _, amount = _trade(BUY_STOCK_QUERY, user_id, stock_id, quantity)
+    if amount is None:
+        raise ValueError("Insufficient balance")
+    return True
+
+def sell_stock(user_id, stock_id, quantity):
+    """Sell stocks for a user at the current price"""
+    _, amount = _trade(SELL_STOCK_QUERY, user_id, stock_id, quantity)
+    if amount is None:
+        raise ValueError("Insufficient stocks")
+    return True
 
 def get_user_portfolio(user_id):
     """Get user's stock portfolio"""
@@ -168,9 +635,9 @@ def get_user_portfolio(user_id):
     cur = conn.cursor()
     
     cur.execute("""
-        SELECT s.symbol, s.name, s.current_price, sp.quantity, sp.average_price,
+        SELECT s.symbol, s.name, s.current_price, sp.quantity, sp.avg_purchase_price,
                (s.current_price * sp.quantity) as current_value,
-               ((s.current_price - sp.average_price) * sp.quantity) as profit_loss
+               ((s.current_price - sp.avg_purchase_price) * sp.quantity) as profit_loss
         FROM stock_portfolios sp
         JOIN stocks s ON sp.stock_id = s.stock_id
         WHERE sp.user_id = %s
@@ -178,23 +645,41 @@ def get_user_portfolio(user_id):
     
     return cur.fetchall()
 
-def get_stock_history(symbol, days=30):
-    """Get historical stock data"""
-    stock = yf.Ticker(symbol)
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=days)
-    hist = stock.history(start=start_date, end=end_date)
-    return hist
+# Bar sizes for get_stock_history and the date_trunc unit behind each
+BAR_INTERVALS = {"1d": "day", "1w": "week", "1m": "month"}
+
+PRICE_BARS_QUERY = """
+    SELECT date_trunc(%(unit)s, p.recorded_at AT TIME ZONE 'Asia/Seoul') AS bar,
+           (array_agg(p.price ORDER BY p.recorded_at))[1]::float8,
+           MAX(p.price)::float8,
+           MIN(p.price)::float8,
+           (array_agg(p.price ORDER BY p.recorded_at DESC))[1]::float8,
+           COUNT(*)
+    FROM stock_prices p
+    WHERE p.stock_id = (SELECT stock_id FROM stocks WHERE symbol = %(symbol)s)
+      AND p.recorded_at >= now() - %(days)s * interval '1 day'
+    GROUP BY 1
+    ORDER BY 1
+"""
+
+def get_stock_history(symbol, days=30, interval="1d", cache_ttl=60):
+    """
+    OHLC bars for a stock from the stored ticks, as a DataFrame indexed by bar start.
+
+    Reads are an index range scan on stock_prices and are cached until the
+    next price update or cache_ttl. interval is one of BAR_INTERVALS.
+    """
+    rows = select_query(
+        PRICE_BARS_QUERY,
+        {"unit": BAR_INTERVALS[interval], "symbol": symbol, "days": days},
+        cache_ttl=cache_ttl
+    )
+    return pd.DataFrame(rows, columns=["Date", "Open", "High", "Low", "Close", "Ticks"]).set_index("Date")
 
 def get_all_stocks():
-    """Get all tracked stocks"""
-    conn = get_conn()
-    cur = conn.cursor()
-    
-    cur.execute("""
+    """Get all tracked stocks (cached until a price update touches the stocks table)"""
+    return select_query("""
         SELECT stock_id, symbol, name, current_price, last_updated
         FROM stocks
         ORDER BY symbol
-    """)
-    
-    return cur.fetchall() 
\ No newline at end of file
+    """, cache_ttl=60)
@@ -1,5 +1,6 @@
 import streamlit as st
-import psycopg2
+from libs.db import get_pool, try_get_conn
+from libs.db_utils import get_circuit_breaker
 import time
 import traceback
 import sys
@@ -19,19 +20,13 @@ st.info("""
 # Show fix button
 if st.button("연결 오류 수정", key="fix_conn_btn"):
     with st.spinner("문제를 진단하고 수정하는 중..."):
-        # Step 1: Test connection
+        # Step 1: Close the circuit breaker, drop pooled connections and test a new one
         try:
-            conn = psycopg2.connect(
-                user=st.secrets["user"],
-                password=st.secrets["password"],
-                host=st.secrets["host"],
-                port=st.secrets["port"],
-                dbname=st.secrets["dbname"],
-                keepalives=1,
-                keepalives_idle=30,
-                keepalives_interval=10,
-                keepalives_count=5
-            )
+            get_circuit_breaker().reset()
+            get_pool().reset()
+            conn, error = try_get_conn()
+            if not conn:
+                raise Exception(error)
             
             # Test the connection
             cur = conn.cursor()
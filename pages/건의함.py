@@ -51,31 +51,7 @@ try:
         suggestions = cur.fetchall()
     except Exception as e:
         st.error(f"건의사항을 불러오는 중 오류가 발생했습니다: {str(e)}")
-        # Check if suggestions table exists
-        cur.execute("""
-            SELECT EXISTS (
-                SELECT 1 FROM information_schema.tables WHERE table_name = 'suggestions'
-            )
-        """)
-        table_exists = cur.fetchone()[0]
-        
-        if not table_exists:
-            # Create suggestions table if it doesn't exist
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS suggestions (
-                    id SERIAL PRIMARY KEY,
-                    content TEXT NOT NULL,
-                    username TEXT NOT NULL,
-                    user_id INTEGER REFERENCES users(user_id),
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    status TEXT DEFAULT 'pending'
-                )
-            """)
-            conn.commit()
-            st.info("건의함 테이블이 생성되었습니다. 건의사항을 작성해주세요.")
-            suggestions = []
-        else:
-            suggestions = []
+        suggestions = []
     
     # Close cursor but don't close connection as it's cached
     cur.close()
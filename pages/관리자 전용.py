@@ -1,12 +1,26 @@
 import streamlit as st
-from libs.db import get_conn
+from libs.db import get_conn, select_query
+from libs.currency import (
+    current_pay_period, process_monthly_salaries, get_salary_runs, post_transaction,
+    verify_ledger, reconcile_balances, get_balance_as_of, get_last_checkpoint,
+    TRANSACTION_TYPES, TRANSACTION_COLUMNS, get_transactions_page, export_transactions_csv, EXPORT_PART_ROWS,
+    get_economy_daily, get_economy_totals, rebuild_economy_rollups, get_savings_overview
+)
+from libs.economy_sim import HISTORY_WEEKS, PERCENTILES, load_settings, simulate
+from libs.stocks import (
+    get_price_provider, add_stock, get_market_parameters, set_market_parameters,
+    BAR_INTERVALS, get_stock_history, backfill_stock_prices
+)
+from libs.price_ticker import get_price_ticker
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
 import base64
 from io import BytesIO
 from PIL import Image
 
+TRANSACTION_PAGE_SIZE = 50
+
 st.title("🔧 관리자 페이지")
 
 # Check if user is logged in and has admin privileges
@@ -28,7 +42,7 @@ try:
     cur = conn.cursor()
     
     # Admin dashboard tabs
-    tabs = st.tabs(["사용자 관리", "화폐 시스템", "상점 관리", "블로그 관리", "통계", "환불 관리", "공지 관리"])
+    tabs = st.tabs(["사용자 관리", "화폐 시스템", "상점 관리", "블로그 관리", "통계", "환불 관리", "공지 관리", "주식 관리"])
     
     #-----------------------------------------------------------
     # 1. USER MANAGEMENT TAB
@@ -38,11 +52,7 @@ try:
         
         # Get all users
         cur.execute("""
-            SELECT user_id, username, role, currency, 
-                   CASE WHEN EXISTS (SELECT 1 FROM information_schema.columns 
-                                  WHERE table_name = 'users' AND column_name = 'bio')
-                        THEN bio ELSE '' END as bio,
-                   created_at 
+            SELECT user_id, username, role, currency, bio, created_at 
             FROM users
             ORDER BY role, username
         """)
@@ -102,32 +112,11 @@ try:
                     
                     if st.button("적용"):
                         try:
-                            # Update user currency
-                            cur.execute(
-                                "UPDATE users SET currency = currency + %s WHERE user_id = %s",
-                                (amount, user_list[selected_user2])
-                            )
-                            
-                            # Record transaction
-                            transaction_type = "transfer"
+                            # Credit from or debit to the treasury through the ledger
                             if amount > 0:
-                                cur.execute(
-                                    """
-                                    INSERT INTO transactions 
-                                    (from_user_id, to_user_id, amount, type, description, created_by)
-                                    VALUES (NULL, %s, %s, %s, %s, %s)
-                                    """,
-                                    (user_list[selected_user2], amount, transaction_type, f"관리자: {reason}", user_id)
-                                )
+                                post_transaction(cur, None, user_list[selected_user2], amount, "transfer", f"관리자: {reason}", user_id)
                             else:
-                                cur.execute(
-                                    """
-                                    INSERT INTO transactions 
-                                    (from_user_id, to_user_id, amount, type, description, created_by)
-                                    VALUES (%s, NULL, %s, %s, %s, %s)
-                                    """,
-                                    (user_list[selected_user2], abs(amount), transaction_type, f"관리자: {reason}", user_id)
-                                )
+                                post_transaction(cur, user_list[selected_user2], None, abs(amount), "transfer", f"관리자: {reason}", user_id)
                             
                             conn.commit()
                             st.success(f"{selected_user2}의 잔고가 {amount:+,}원 변경되었습니다!")
@@ -170,407 +159,479 @@ try:
         # Transaction history
         st.subheader("📝 거래 내역")
         
-        # Check if transactions table exists
-        cur.execute("""
-            SELECT EXISTS (
-                SELECT 1 FROM information_schema.tables 
-                WHERE table_name = 'transactions'
-            )
-        """)
+        # Filters are applied in SQL; pages are keyed on (created_at, transaction_id)
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            tx_users = {"모두 보기": None}
+            tx_users.update({row[1]: row[0] for row in users})
+            selected_tx_user = st.selectbox("사용자", list(tx_users.keys()), key="transaction_user_filter")
+        with col2:
+            selected_type = st.selectbox("거래 유형 필터링", ["모두 보기"] + TRANSACTION_TYPES, key="transaction_type_filter")
+        with col3:
+            date_range = st.date_input("기간", value=(), key="transaction_date_filter")
         
-        if cur.fetchone()[0]:
-            # Get transactions
-            cur.execute("""
-                SELECT t.transaction_id, 
-                       COALESCE(u1.username, '시스템') as from_user, 
-                       COALESCE(u2.username, '시스템') as to_user, 
-                       t.amount, t.type, t.description, t.created_at
-                FROM transactions t
-                LEFT JOIN users u1 ON t.from_user_id = u1.user_id
-                LEFT JOIN users u2 ON t.to_user_id = u2.user_id
-                ORDER BY t.created_at DESC
-                LIMIT 100
-            """)
-            
-            transactions = cur.fetchall()
-            transactions_df = pd.DataFrame(
-                transactions, 
-                columns=["ID", "보낸 사람", "받은 사람", "금액", "유형", "설명", "시간"]
+        tx_filters = {
+            "user_id": tx_users[selected_tx_user],
+            "tx_type": None if selected_type == "모두 보기" else selected_type,
+            "start": datetime.combine(date_range[0], datetime.min.time()).astimezone() if len(date_range) > 0 else None,
+            "end": datetime.combine(date_range[-1] + timedelta(days=1), datetime.min.time()).astimezone() if len(date_range) > 0 else None,
+        }
+        
+        # Restart paging whenever the filters change
+        filter_key = repr(sorted(tx_filters.items()))
+        if st.session_state.get("transaction_filter_key") != filter_key:
+            st.session_state.transaction_filter_key = filter_key
+            st.session_state.transaction_pages = [None]
+        page_start = st.session_state.transaction_pages[-1]
+        
+        transactions = get_transactions_page(before=page_start, limit=TRANSACTION_PAGE_SIZE, **tx_filters)
+        st.dataframe(pd.DataFrame(transactions, columns=TRANSACTION_COLUMNS), hide_index=True)
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            if len(st.session_state.transaction_pages) > 1 and st.button("◀ 최근 거래", key="transactions_prev"):
+                st.session_state.transaction_pages.pop()
+                st.rerun()
+        with col2:
+            st.write(f"페이지 {len(st.session_state.transaction_pages)}")
+        with col3:
+            if len(transactions) == TRANSACTION_PAGE_SIZE and st.button("이전 거래 ▶", key="transactions_next"):
+                last = transactions[-1]
+                st.session_state.transaction_pages.append((last[6], last[0]))
+                st.rerun()
+        
+        # Exports are cut into parts of EXPORT_PART_ROWS rows, newest first, so the
+        # file download_button keeps in memory stays bounded however long the history is
+        if st.session_state.get("transaction_export_key") != filter_key:
+            st.session_state.transaction_export_key = filter_key
+            st.session_state.transaction_export_parts = [None]
+            st.session_state.transaction_export_next = None
+        export_part = len(st.session_state.transaction_export_parts)
+        if st.button(f"CSV 내보내기 준비 ({export_part}번째 파일)", key="transactions_export"):
+            data, next_before = export_transactions_csv(before=st.session_state.transaction_export_parts[-1], **tx_filters)
+            st.session_state.transaction_export_next = next_before
+            st.download_button(
+                "CSV 다운로드", data,
+                file_name=f"transactions_{export_part}.csv" if export_part > 1 or next_before else "transactions.csv",
+                mime="text/csv"
             )
-            
-            # Filter options
-            transaction_types = ["모두 보기"] + sorted(transactions_df["유형"].unique().tolist())
-            selected_type = st.selectbox("거래 유형 필터링", transaction_types, key="transaction_type_filter")
-            
-            if selected_type != "모두 보기":
-                filtered_transactions = transactions_df[transactions_df["유형"] == selected_type]
-            else:
-                filtered_transactions = transactions_df
-            
-            # Display transactions
-            st.dataframe(filtered_transactions)
-        else:
-            st.info("거래 내역이 없습니다.")
+            if next_before:
+                st.info(f"내보내기는 파일당 최대 {EXPORT_PART_ROWS:,}건입니다. 이어지는 거래는 다음 파일로 받으세요.")
+        if st.session_state.transaction_export_next and st.button("다음 파일 ▶", key="transactions_export_next"):
+            st.session_state.transaction_export_parts.append(st.session_state.transaction_export_next)
+            st.session_state.transaction_export_next = None
+            st.rerun()
         
         # Jobs management
         st.subheader("💼 직업 관리")
         
-        # Check if jobs table exists
+        # Get jobs
         cur.execute("""
-            SELECT EXISTS (
-                SELECT 1 FROM information_schema.tables 
-                WHERE table_name = 'jobs'
-            )
+            SELECT j.job_id, j.name, j.salary, j.description,
+                   u.username as created_by, j.created_at,
+                   COUNT(u2.user_id) as assigned_users
+            FROM jobs j
+            LEFT JOIN users u ON j.created_by = u.user_id
+            LEFT JOIN users u2 ON u2.job_id = j.job_id
+            GROUP BY j.job_id, j.name, j.salary, j.description, u.username, j.created_at
+            ORDER BY j.name
         """)
         
-        if cur.fetchone()[0]:
-            # Get jobs
-            cur.execute("""
-                SELECT j.job_id, j.name, j.salary, j.description,
-                       u.username as created_by, j.created_at,
-                       COUNT(u2.user_id) as assigned_users
-                FROM jobs j
-                LEFT JOIN users u ON j.created_by = u.user_id
-                LEFT JOIN users u2 ON u2.job_id = j.job_id
-                GROUP BY j.job_id, j.name, j.salary, j.description, u.username, j.created_at
-                ORDER BY j.name
-            """)
-            
-            jobs = cur.fetchall()
-            jobs_df = pd.DataFrame(
-                jobs,
-                columns=["ID", "직업명", "급여", "설명", "생성자", "생성일", "배정된 학생 수"]
-            )
-            
-            # Display jobs
-            st.dataframe(jobs_df)
-            
-            # Add new job
-            with st.expander("새 직업 추가"):
-                job_name = st.text_input("직업명", key="new_job_name")
-                salary = st.number_input("급여", min_value=1, step=100, key="new_job_salary")
-                description = st.text_area("설명", key="new_job_description")
-                
-                if st.button("직업 추가"):
-                    try:
-                        cur.execute(
-                            """
-                            INSERT INTO jobs (name, salary, description, created_by)
-                            VALUES (%s, %s, %s, %s)
-                            """,
-                            (job_name, salary, description, user_id)
-                        )
-                        conn.commit()
-                        st.success(f"'{job_name}' 직업이 추가되었습니다!")
-                    except Exception as e:
-                        conn.rollback()
-                        st.error(f"오류가 발생했습니다: {str(e)}")
+        jobs = cur.fetchall()
+        jobs_df = pd.DataFrame(
+            jobs,
+            columns=["ID", "직업명", "급여", "설명", "생성자", "생성일", "배정된 학생 수"]
+        )
+        
+        # Display jobs
+        st.dataframe(jobs_df)
+        
+        # Add new job
+        with st.expander("새 직업 추가"):
+            job_name = st.text_input("직업명", key="new_job_name")
+            salary = st.number_input("급여", min_value=1, step=100, key="new_job_salary")
+            description = st.text_area("설명", key="new_job_description")
             
-            # Assign job to user
-            st.subheader("💼 직업 배정")
-            # Get all jobs
-            cur.execute("SELECT job_id, name FROM jobs")
-            job_rows = cur.fetchall()
+            if st.button("직업 추가"):
+                try:
+                    cur.execute(
+                        """
+                        INSERT INTO jobs (name, salary, description, created_by)
+                        VALUES (%s, %s, %s, %s)
+                        """,
+                        (job_name, salary, description, user_id)
+                    )
+                    conn.commit()
+                    st.success(f"'{job_name}' 직업이 추가되었습니다!")
+                except Exception as e:
+                    conn.rollback()
+                    st.error(f"오류가 발생했습니다: {str(e)}")
+        
+        # Assign job to user
+        st.subheader("💼 직업 배정")
+        # Get all jobs
+        job_rows = select_query("SELECT job_id, name FROM jobs", cache_ttl=300)
+        
+        # Get all students
+        cur.execute("SELECT user_id, username FROM users WHERE role IN ('student', '일반학생')")
+        student_rows = cur.fetchall()
+        
+        if not job_rows:
+            st.info("등록된 직업이 없습니다. 먼저 직업을 추가해주세요.")
+        elif not student_rows:
+            st.info("등록된 학생이 없습니다.")
+        else:
+            job_options = {row[1]: row[0] for row in job_rows}
+            student_options = {row[1]: row[0] for row in student_rows}
             
-            # Get all students
-            cur.execute("SELECT user_id, username FROM users WHERE role IN ('student', '일반학생')")
-            student_rows = cur.fetchall()
+            selected_job = st.selectbox("직업 선택", list(job_options.keys()), key="job_assign_select")
+            selected_student = st.selectbox("학생 선택", list(student_options.keys()), key="job_student_select")
             
-            if not job_rows:
-                st.info("등록된 직업이 없습니다. 먼저 직업을 추가해주세요.")
-            elif not student_rows:
-                st.info("등록된 학생이 없습니다.")
-            else:
-                job_options = {row[1]: row[0] for row in job_rows}
-                student_options = {row[1]: row[0] for row in student_rows}
-                
-                selected_job = st.selectbox("직업 선택", list(job_options.keys()), key="job_assign_select")
-                selected_student = st.selectbox("학생 선택", list(student_options.keys()), key="job_student_select")
-                
-                if st.button("배정"):
-                    try:
-                        cur.execute(
-                            "UPDATE users SET job_id = %s WHERE user_id = %s",
-                            (job_options[selected_job], student_options[selected_student])
-                        )
-                        conn.commit()
-                        st.success(f"{selected_student}에게 {selected_job} 직업이 배정되었습니다!")
-                    except Exception as e:
-                        conn.rollback()
-                        st.error(f"오류가 발생했습니다: {str(e)}")
-        else:
-            st.info("직업 정보가 없습니다.")
+            if st.button("배정"):
+                try:
+                    cur.execute(
+                        "UPDATE users SET job_id = %s WHERE user_id = %s",
+                        (job_options[selected_job], student_options[selected_student])
+                    )
+                    conn.commit()
+                    st.success(f"{selected_student}에게 {selected_job} 직업이 배정되었습니다!")
+                except Exception as e:
+                    conn.rollback()
+                    st.error(f"오류가 발생했습니다: {str(e)}")
         
         # Process monthly salaries
         st.subheader("💸 월급 처리")
+        pay_period = st.text_input("지급 기간 (YYYY-MM)", value=current_pay_period(), key="pay_period")
         if st.button("월급 지급 처리"):
             try:
-                # Get all users with jobs
-                cur.execute("""
-                    SELECT u.user_id, u.username, j.job_id, j.name, j.salary
-                    FROM users u
-                    JOIN jobs j ON u.job_id = j.job_id
-                """)
-                
-                users_with_jobs = cur.fetchall()
-                
-                for user_id, username, job_id, job_name, salary in users_with_jobs:
-                    # Add salary to user
-                    cur.execute(
-                        "UPDATE users SET currency = currency + %s WHERE user_id = %s",
-                        (salary, user_id)
-                    )
-                    
-                    # Record transaction
-                    cur.execute(
-                        """
-                        INSERT INTO transactions 
-                        (from_user_id, to_user_id, amount, type, description, created_by)
-                        VALUES (NULL, %s, %s, %s, %s, %s)
-                        """,
-                        (user_id, salary, "salary", f"{job_name} 월급", user_id)
-                    )
-                
-                conn.commit()
-                st.success(f"{len(users_with_jobs)}명의 사용자에게 월급이 지급되었습니다!")
+                summary = process_monthly_salaries(pay_period, created_by=user_id)
+                if summary["already_paid"]:
+                    st.info(f"{summary['pay_period']} 월급은 이미 지급되었습니다. ({summary['paid_users']}명, 총 {summary['total_amount']})")
+                else:
+                    st.success(f"{summary['paid_users']}명의 사용자에게 월급이 지급되었습니다! (총 {summary['total_amount']})")
             except Exception as e:
-                conn.rollback()
                 st.error(f"오류가 발생했습니다: {str(e)}")
-    
+        
+        salary_runs = get_salary_runs()
+        if salary_runs:
+            st.dataframe(pd.DataFrame(salary_runs, columns=["지급 기간", "인원", "총액", "지급 시각", "처리자"]))
+        
+        # Ledger verification and point-in-time balances
+        st.subheader("📒 원장 검증")
+        last_checkpoint = get_last_checkpoint()
+        if last_checkpoint:
+            st.write(f"마지막 체크포인트 #{last_checkpoint[0]}: 항목 {last_checkpoint[1]}번까지 ({last_checkpoint[3]})")
+        else:
+            st.write("아직 체크포인트가 없습니다.")
+        if st.button("원장 검증 및 체크포인트 생성"):
+            try:
+                report = verify_ledger(created_by=user_id)
+                if report["ok"]:
+                    if report["checkpoint_id"]:
+                        st.success(f"새 항목 {report['entries_checked']}개 검증 완료, 체크포인트 #{report['checkpoint_id']} 생성")
+                    else:
+                        st.success("마지막 체크포인트 이후 새 항목이 없습니다.")
+                else:
+                    st.error(f"불일치 발견: 균형이 맞지 않는 거래 {len(report['unbalanced'])}건, 잔고 불일치 {len(report['mismatches'])}명")
+                    if report["mismatches"]:
+                        st.dataframe(pd.DataFrame(report["mismatches"], columns=["사용자 ID", "사용자", "원장 잔고", "현재 잔고"]))
+                    if report["unbalanced"]:
+                        st.dataframe(pd.DataFrame(report["unbalanced"], columns=["거래 ID", "합계"]))
+            except Exception as e:
+                st.error(f"원장 검증 중 오류 발생: {str(e)}")
+        
+        # Replay the whole ledger-backed history against the stored balances
+        repair_drift = st.checkbox("불일치를 보정 거래로 기록", key="repair_drift")
+        if st.button("잔고 대사 실행"):
+            try:
+                report = reconcile_balances(repair=repair_drift, created_by=user_id)
+                if report["ok"]:
+                    st.success(f"거래 {report['transactions_scanned']:,}건, 사용자 {report['users_checked']}명 대사 완료: 불일치 없음")
+                else:
+                    st.warning(f"잔고 불일치 {len(report['drift'])}명 (총 {report['total_drift']:+,}원)")
+                    st.dataframe(pd.DataFrame(report["drift"], columns=["사용자 ID", "사용자", "거래 기준 잔고", "현재 잔고"]))
+                    if report["corrections"]:
+                        st.success(f"보정 거래 {len(report['corrections'])}건을 기록했습니다.")
+            except Exception as e:
+                st.error(f"잔고 대사 중 오류 발생: {str(e)}")
+        
+        if users:
+            as_of_users = {row[1]: row[0] for row in users}
+            col1, col2 = st.columns(2)
+            with col1:
+                as_of_user = st.selectbox("사용자", list(as_of_users.keys()), key="as_of_user")
+            with col2:
+                as_of_date = st.date_input("기준일", key="as_of_date")
+            as_of = datetime.combine(as_of_date, datetime.max.time()).astimezone()
+            st.write(f"{as_of_date} 기준 잔고: {get_balance_as_of(as_of_users[as_of_user], as_of):,}")
+
+        # What-if projection of the class economy
+        st.subheader("🔮 경제 시뮬레이션")
+        sim_settings = load_settings()
+        st.write(
+            f"학생 {len(sim_settings.balances)}명, 퀘스트 {len(sim_settings.quest_rewards)}개, "
+            f"상점 아이템 {len(sim_settings.item_prices)}개 기준 "
+            f"(최근 {HISTORY_WEEKS}주: 학생당 주간 퀘스트 {sim_settings.quest_rate:.2f}회, 구매 {sim_settings.purchase_rate:.2f}회)"
+        )
+        with st.form("economy_simulation"):
+            col1, col2 = st.columns(2)
+            with col1:
+                sim_weeks = st.slider("기간 (주)", 1, 52, 12)
+                sim_runs = st.slider("시뮬레이션 횟수", 100, 5000, 2000, step=100)
+                sim_quest_rate = st.number_input("학생당 주간 퀘스트 완료", min_value=0.0, value=round(sim_settings.quest_rate, 2), step=0.1)
+                sim_purchase_rate = st.number_input("학생당 주간 구매", min_value=0.0, value=round(sim_settings.purchase_rate, 2), step=0.1)
+            with col2:
+                sim_salary_scale = st.slider("월급 배율", 0.0, 3.0, 1.0, step=0.1)
+                sim_reward_scale = st.slider("퀘스트 보상 배율", 0.0, 3.0, 1.0, step=0.1)
+                sim_price_scale = st.slider("상점 가격 배율", 0.0, 3.0, 1.0, step=0.1)
+            run_simulation = st.form_submit_button("시뮬레이션 실행")
+
+        if run_simulation:
+            result = simulate(
+                sim_settings, weeks=sim_weeks, runs=sim_runs,
+                salary_scale=sim_salary_scale, reward_scale=sim_reward_scale, price_scale=sim_price_scale,
+                quest_rate=sim_quest_rate, purchase_rate=sim_purchase_rate
+            )
+            low, _, high = PERCENTILES
+            supply_df = pd.DataFrame({
+                f"하위 {low}%": result.money_supply[0],
+                "중앙값": result.money_supply[1],
+                f"상위 {100 - high}%": result.money_supply[2],
+            }, index=pd.Index(result.weeks, name="주"))
+            st.write("통화량 전망")
+            st.line_chart(supply_df)
+
+            col1, col2, col3 = st.columns(3)
+            col1.metric("예상 통화량 (중앙값)", f"{int(result.money_supply[1][-1]):,}원",
+                        f"{int(result.money_supply[1][-1] - result.money_supply[1][0]):+,}원")
+            col2.metric("학생 잔고 중앙값", f"{int(result.median_balance[1][-1]):,}원",
+                        f"{int(result.median_balance[1][-1] - result.median_balance[1][0]):+,}원")
+            col3.metric("중간 가격 아이템 구매 가능", f"{result.affordability[-1]:.0%}",
+                        f"{result.affordability[-1] - result.affordability[0]:+.0%}")
+            st.write("중간 가격 아이템을 살 수 있는 학생 비율")
+            st.line_chart(pd.DataFrame({"구매 가능 비율": result.affordability}, index=pd.Index(result.weeks, name="주")))
+
     #-----------------------------------------------------------
     # 3. SHOP MANAGEMENT TAB
     #-----------------------------------------------------------
     with tabs[2]:
         st.header("🛒 상점 관리")
         
-        # Check if shop_items table exists
+        # Get all shop items
         cur.execute("""
-            SELECT EXISTS (
-                SELECT 1 FROM information_schema.tables 
-                WHERE table_name = 'shop_items'
-            )
+            SELECT item_id, name, description, type, price, image_url, created_at
+            FROM shop_items
+            ORDER BY type, name
         """)
         
-        shop_exists = cur.fetchone()[0]
+        items = cur.fetchall()
         
-        if not shop_exists:
-            st.warning("상점 시스템이 초기화되지 않았습니다. 데이터베이스 초기화가 필요합니다.")
+        if not items:
+            st.info("등록된 상품이 없습니다. 새 아이템을 추가해주세요.")
         else:
-            # Get all shop items
-            cur.execute("""
-                SELECT item_id, name, description, type, price, image_url, created_at
-                FROM shop_items
-                ORDER BY type, name
-            """)
+            items_df = pd.DataFrame(
+                items,
+                columns=["ID", "아이템명", "설명", "유형", "가격", "이미지 URL", "생성일"]
+            )
             
-            items = cur.fetchall()
+            # Filter by type
+            item_types = ["모두 보기"] + sorted(items_df["유형"].unique().tolist())
+            selected_type = st.selectbox("아이템 유형 필터링", item_types, key="item_type_filter")
             
-            if not items:
-                st.info("등록된 상품이 없습니다. 새 아이템을 추가해주세요.")
+            if selected_type != "모두 보기":
+                filtered_items = items_df[items_df["유형"] == selected_type]
             else:
-                items_df = pd.DataFrame(
-                    items,
-                    columns=["ID", "아이템명", "설명", "유형", "가격", "이미지 URL", "생성일"]
-                )
-                
-                # Filter by type
-                item_types = ["모두 보기"] + sorted(items_df["유형"].unique().tolist())
-                selected_type = st.selectbox("아이템 유형 필터링", item_types, key="item_type_filter")
-                
-                if selected_type != "모두 보기":
-                    filtered_items = items_df[items_df["유형"] == selected_type]
-                else:
-                    filtered_items = items_df
-                
-                # Display items
-                st.dataframe(filtered_items)
+                filtered_items = items_df
+            
+            # Display items
+            st.dataframe(filtered_items)
+        
+        # Add new item
+        with st.expander("새 아이템 추가"):
+            col1, col2 = st.columns(2)
             
-            # Add new item
-            with st.expander("새 아이템 추가"):
-                col1, col2 = st.columns(2)
+            with col1:
+                new_name = st.text_input("아이템 이름", key="new_item_name")
+                new_description = st.text_area("아이템 설명", key="new_item_description")
+                new_price = st.number_input("가격", min_value=1, step=10, key="new_item_price")
+            
+            with col2:
+                new_type = st.selectbox("아이템 유형", 
+                                       ["avatar", "badge", "background", "font", "color"],
+                                       key="new_item_type",
+                                       format_func=lambda x: {
+                                           "avatar": "아바타",
+                                           "badge": "배지",
+                                           "background": "배경",
+                                           "font": "폰트",
+                                           "color": "색상"
+                                       }.get(x, x))
                 
-                with col1:
-                    new_name = st.text_input("아이템 이름", key="new_item_name")
-                    new_description = st.text_area("아이템 설명", key="new_item_description")
-                    new_price = st.number_input("가격", min_value=1, step=10, key="new_item_price")
+                # Two options for image upload
+                upload_method = st.radio("이미지 업로드 방식", ["URL 입력", "파일 업로드"], key="new_item_upload_method")
                 
-                with col2:
-                    new_type = st.selectbox("아이템 유형", 
-                                           ["avatar", "badge", "background", "font", "color"],
-                                           key="new_item_type",
-                                           format_func=lambda x: {
-                                               "avatar": "아바타",
-                                               "badge": "배지",
-                                               "background": "배경",
-                                               "font": "폰트",
-                                               "color": "색상"
-                                           }.get(x, x))
-                    
-                    # Two options for image upload
-                    upload_method = st.radio("이미지 업로드 방식", ["URL 입력", "파일 업로드"], key="new_item_upload_method")
+                if upload_method == "URL 입력":
+                    new_image_url = st.text_input("이미지 URL", key="new_item_url")
+                else:
+                    uploaded_file = st.file_uploader("이미지 파일", type=["jpg", "jpeg", "png"], key="new_item_file")
+                    new_image_url = None
                     
-                    if upload_method == "URL 입력":
-                        new_image_url = st.text_input("이미지 URL", key="new_item_url")
-                    else:
-                        uploaded_file = st.file_uploader("이미지 파일", type=["jpg", "jpeg", "png"], key="new_item_file")
-                        new_image_url = None
-                        
-                        if uploaded_file:
-                            try:
-                                # Convert to base64
-                                image = Image.open(uploaded_file)
-                                # Resize if needed
-                                if max(image.size) > 400:
-                                    image.thumbnail((400, 400))
-                                buffered = BytesIO()
-                                image.save(buffered, format="PNG")
-                                img_str = base64.b64encode(buffered.getvalue()).decode()
-                                new_image_url = f"data:image/png;base64,{img_str}"
-                                st.image(new_image_url, width=150)
-                            except Exception as e:
-                                st.error(f"이미지 처리 중 오류: {str(e)}")
-                
-                if st.button("아이템 추가"):
-                    if new_name and new_description and new_price > 0 and new_image_url:
+                    if uploaded_file:
                         try:
-                            cur.execute(
-                                """
-                                INSERT INTO shop_items (name, description, type, price, image_url)
-                                VALUES (%s, %s, %s, %s, %s)
-                                """,
-                                (new_name, new_description, new_type, new_price, new_image_url)
-                            )
-                            conn.commit()
-                            st.success(f"'{new_name}' 아이템이 추가되었습니다!")
-                            st.rerun()
+                            # Convert to base64
+                            image = Image.open(uploaded_file)
+                            # Resize if needed
+                            if max(image.size) > 400:
+                                image.thumbnail((400, 400))
+                            buffered = BytesIO()
+                            image.save(buffered, format="PNG")
+                            img_str = base64.b64encode(buffered.getvalue()).decode()
+                            new_image_url = f"data:image/png;base64,{img_str}"
+                            st.image(new_image_url, width=150)
                         except Exception as e:
-                            conn.rollback()
-                            st.error(f"오류가 발생했습니다: {str(e)}")
-                    else:
-                        st.error("모든 필드를 입력해주세요.")
+                            st.error(f"이미지 처리 중 오류: {str(e)}")
             
-            # Edit/Delete item
-            with st.expander("아이템 수정/삭제"):
-                # Get all items
-                cur.execute("SELECT item_id, name, type FROM shop_items ORDER BY type, name")
-                shop_items = cur.fetchall()
-                
-                if not shop_items:
-                    st.info("아직 등록된 아이템이 없습니다. 아이템을 추가해주세요.")
+            if st.button("아이템 추가"):
+                if new_name and new_description and new_price > 0 and new_image_url:
+                    try:
+                        cur.execute(
+                            """
+                            INSERT INTO shop_items (name, description, type, price, image_url)
+                            VALUES (%s, %s, %s, %s, %s)
+                            """,
+                            (new_name, new_description, new_type, new_price, new_image_url)
+                        )
+                        conn.commit()
+                        st.success(f"'{new_name}' 아이템이 추가되었습니다!")
+                        st.rerun()
+                    except Exception as e:
+                        conn.rollback()
+                        st.error(f"오류가 발생했습니다: {str(e)}")
                 else:
-                    item_options = {f"{row[1]} ({row[2]})": row[0] for row in shop_items}
-                    selected_item = st.selectbox("아이템 선택", list(item_options.keys()), key="edit_item_select")
+                    st.error("모든 필드를 입력해주세요.")
+        
+        # Edit/Delete item
+        with st.expander("아이템 수정/삭제"):
+            # Get all items
+            cur.execute("SELECT item_id, name, type FROM shop_items ORDER BY type, name")
+            shop_items = cur.fetchall()
+            
+            if not shop_items:
+                st.info("아직 등록된 아이템이 없습니다. 아이템을 추가해주세요.")
+            else:
+                item_options = {f"{row[1]} ({row[2]})": row[0] for row in shop_items}
+                selected_item = st.selectbox("아이템 선택", list(item_options.keys()), key="edit_item_select")
+                
+                if selected_item:
+                    item_id = item_options[selected_item]
                     
-                    if selected_item:
-                        item_id = item_options[selected_item]
+                    # Get item details
+                    cur.execute(
+                        "SELECT name, description, type, price, image_url FROM shop_items WHERE item_id = %s",
+                        (item_id,)
+                    )
+                    item = cur.fetchone()
+                    if item:
+                        name, description, type_, price, image_url = item
                         
-                        # Get item details
-                        cur.execute(
-                            "SELECT name, description, type, price, image_url FROM shop_items WHERE item_id = %s",
-                            (item_id,)
-                        )
-                        item = cur.fetchone()
-                        if item:
-                            name, description, type_, price, image_url = item
+                        col1, col2 = st.columns(2)
+                        
+                        with col1:
+                            edit_name = st.text_input("아이템 이름", value=name, key="edit_item_name")
+                            edit_description = st.text_area("아이템 설명", value=description, key="edit_item_description")
+                            edit_price = st.number_input("가격", min_value=1, step=10, value=price, key="edit_item_price")
+                        
+                        with col2:
+                            type_options = ["avatar", "badge", "background", "font", "color"]
+                            type_index = type_options.index(type_) if type_ in type_options else 0
                             
-                            col1, col2 = st.columns(2)
+                            edit_type = st.selectbox("아이템 유형", 
+                                                   type_options,
+                                                   index=type_index,
+                                                   key="edit_item_type",
+                                                   format_func=lambda x: {
+                                                       "avatar": "아바타",
+                                                       "badge": "배지",
+                                                       "background": "배경",
+                                                       "font": "폰트",
+                                                       "color": "색상"
+                                                   }.get(x, x))
                             
-                            with col1:
-                                edit_name = st.text_input("아이템 이름", value=name, key="edit_item_name")
-                                edit_description = st.text_area("아이템 설명", value=description, key="edit_item_description")
-                                edit_price = st.number_input("가격", min_value=1, step=10, value=price, key="edit_item_price")
+                            st.write("현재 이미지:")
+                            if image_url:
+                                st.image(image_url, width=150)
+                            else:
+                                st.info("이미지가 없습니다.")
                             
-                            with col2:
-                                type_options = ["avatar", "badge", "background", "font", "color"]
-                                type_index = type_options.index(type_) if type_ in type_options else 0
-                                
-                                edit_type = st.selectbox("아이템 유형", 
-                                                       type_options,
-                                                       index=type_index,
-                                                       key="edit_item_type",
-                                                       format_func=lambda x: {
-                                                           "avatar": "아바타",
-                                                           "badge": "배지",
-                                                           "background": "배경",
-                                                           "font": "폰트",
-                                                           "color": "색상"
-                                                       }.get(x, x))
+                            # Keep or change image
+                            change_image = st.checkbox("이미지 변경", key="edit_change_image")
+                            
+                            if change_image:
+                                upload_method = st.radio("새 이미지 업로드 방식", ["URL 입력", "파일 업로드"], key="edit_item_upload_method")
                                 
-                                st.write("현재 이미지:")
-                                if image_url:
-                                    st.image(image_url, width=150)
-                                else:
-                                    st.info("이미지가 없습니다.")
-                                
-                                # Keep or change image
-                                change_image = st.checkbox("이미지 변경", key="edit_change_image")
-                                
-                                if change_image:
-                                    upload_method = st.radio("새 이미지 업로드 방식", ["URL 입력", "파일 업로드"], key="edit_item_upload_method")
-                                    
-                                    if upload_method == "URL 입력":
-                                        edit_image_url = st.text_input("이미지 URL", value=image_url or "", key="edit_item_url")
-                                    else:
-                                        uploaded_file = st.file_uploader("이미지 파일", type=["jpg", "jpeg", "png"], key="edit_item_file")
-                                        edit_image_url = image_url
-                                        
-                                        if uploaded_file:
-                                            try:
-                                                # Convert to base64
-                                                image = Image.open(uploaded_file)
-                                                # Resize if needed
-                                                if max(image.size) > 400:
-                                                    image.thumbnail((400, 400))
-                                                buffered = BytesIO()
-                                                image.save(buffered, format="PNG")
-                                                img_str = base64.b64encode(buffered.getvalue()).decode()
-                                                edit_image_url = f"data:image/png;base64,{img_str}"
-                                                st.image(edit_image_url, width=150)
-                                            except Exception as e:
-                                                st.error(f"이미지 처리 중 오류: {str(e)}")
+                                if upload_method == "URL 입력":
+                                    edit_image_url = st.text_input("이미지 URL", value=image_url or "", key="edit_item_url")
                                 else:
+                                    uploaded_file = st.file_uploader("이미지 파일", type=["jpg", "jpeg", "png"], key="edit_item_file")
                                     edit_image_url = image_url
-                            
-                            col1, col2 = st.columns(2)
-                            with col1:
-                                if st.button("아이템 수정"):
-                                    if edit_name and edit_description and edit_price > 0 and edit_image_url:
+                                    
+                                    if uploaded_file:
                                         try:
-                                            cur.execute(
-                                                """
-                                                UPDATE shop_items 
-                                                SET name = %s, description = %s, type = %s, price = %s, image_url = %s
-                                                WHERE item_id = %s
-                                                """,
-                                                (edit_name, edit_description, edit_type, edit_price, edit_image_url, item_id)
-                                            )
-                                            conn.commit()
-                                            st.success(f"'{edit_name}' 아이템이 수정되었습니다!")
-                                            st.rerun()
+                                            # Convert to base64
+                                            image = Image.open(uploaded_file)
+                                            # Resize if needed
+                                            if max(image.size) > 400:
+                                                image.thumbnail((400, 400))
+                                            buffered = BytesIO()
+                                            image.save(buffered, format="PNG")
+                                            img_str = base64.b64encode(buffered.getvalue()).decode()
+                                            edit_image_url = f"data:image/png;base64,{img_str}"
+                                            st.image(edit_image_url, width=150)
                                         except Exception as e:
-                                            conn.rollback()
-                                            st.error(f"오류가 발생했습니다: {str(e)}")
-                                    else:
-                                        st.error("모든 필드를 입력해주세요.")
-                            
-                            with col2:
-                                delete_confirm = st.checkbox(f"'{name}' 아이템을 정말로 삭제하시겠습니까?", key=f"delete_item_confirm_{item_id}")
-                                if st.button("아이템 삭제") and delete_confirm:
+                                            st.error(f"이미지 처리 중 오류: {str(e)}")
+                            else:
+                                edit_image_url = image_url
+                        
+                        col1, col2 = st.columns(2)
+                        with col1:
+                            if st.button("아이템 수정"):
+                                if edit_name and edit_description and edit_price > 0 and edit_image_url:
                                     try:
-                                        # First delete from user_items
-                                        cur.execute("DELETE FROM user_items WHERE item_id = %s", (item_id,))
-                                        
-                                        # Then delete the item
-                                        cur.execute("DELETE FROM shop_items WHERE item_id = %s", (item_id,))
-                                        
+                                        cur.execute(
+                                            """
+                                            UPDATE shop_items 
+                                            SET name = %s, description = %s, type = %s, price = %s, image_url = %s
+                                            WHERE item_id = %s
+                                            """,
+                                            (edit_name, edit_description, edit_type, edit_price, edit_image_url, item_id)
+                                        )
                                         conn.commit()
-                                        st.success(f"'{name}' 아이템이 삭제되었습니다!")
+                                        st.success(f"'{edit_name}' 아이템이 수정되었습니다!")
                                         st.rerun()
                                     except Exception as e:
                                         conn.rollback()
                                         st.error(f"오류가 발생했습니다: {str(e)}")
-                    else:
-                        st.warning("아이템을 선택해주세요.")
+                                else:
+                                    st.error("모든 필드를 입력해주세요.")
+                        
+                        with col2:
+                            delete_confirm = st.checkbox(f"'{name}' 아이템을 정말로 삭제하시겠습니까?", key=f"delete_item_confirm_{item_id}")
+                            if st.button("아이템 삭제") and delete_confirm:
+                                try:
+                                    # First delete from user_items
+                                    cur.execute("DELETE FROM user_items WHERE item_id = %s", (item_id,))
+                                    
+                                    # Then delete the item
+                                    cur.execute("DELETE FROM shop_items WHERE item_id = %s", (item_id,))
+                                    
+                                    conn.commit()
+                                    st.success(f"'{name}' 아이템이 삭제되었습니다!")
+                                    st.rerun()
+                                except Exception as e:
+                                    conn.rollback()
+                                    st.error(f"오류가 발생했습니다: {str(e)}")
+                else:
+                    st.warning("아이템을 선택해주세요.")
     
     #-----------------------------------------------------------
     # 4. BLOG MANAGEMENT TAB
@@ -578,145 +639,132 @@ try:
     with tabs[3]:
         st.header("📝 블로그 관리")
         
-        # Check if blog_posts table exists
+        # Get all posts with author info
         cur.execute("""
-            SELECT EXISTS (
-                SELECT 1 FROM information_schema.tables 
-                WHERE table_name = 'blog_posts'
-            )
+            SELECT p.post_id, p.title, 
+                   CASE WHEN LENGTH(p.content) > 50 THEN SUBSTRING(p.content, 1, 50) || '...' ELSE p.content END,
+                   u.username, p.created_at, 
+                   (SELECT COUNT(*) FROM blog_comments WHERE post_id = p.post_id) AS comment_count
+            FROM blog_posts p
+            JOIN users u ON p.user_id = u.user_id
+            ORDER BY p.created_at DESC
         """)
         
-        blog_exists = cur.fetchone()[0]
+        posts = cur.fetchall()
         
-        if not blog_exists:
-            st.warning("블로그 시스템이 초기화되지 않았습니다. 데이터베이스 초기화가 필요합니다.")
-        else:
-            # Get all posts with author info
-            cur.execute("""
-                SELECT p.post_id, p.title, 
-                       CASE WHEN LENGTH(p.content) > 50 THEN SUBSTRING(p.content, 1, 50) || '...' ELSE p.content END,
-                       u.username, p.created_at, 
-                       (SELECT COUNT(*) FROM blog_comments WHERE post_id = p.post_id) AS comment_count
-                FROM blog_posts p
-                JOIN users u ON p.user_id = u.user_id
-                ORDER BY p.created_at DESC
-            """)
+        if posts:
+            posts_df = pd.DataFrame(
+                posts,
+                columns=["ID", "제목", "내용", "작성자", "작성일", "댓글 수"]
+            )
+            
+            # Filter options
+            author_filter = ["모두 보기"] + sorted(posts_df["작성자"].unique().tolist())
+            selected_author = st.selectbox("작성자별 필터링", author_filter, key="blog_author_filter")
             
-            posts = cur.fetchall()
+            if selected_author != "모두 보기":
+                filtered_posts = posts_df[posts_df["작성자"] == selected_author]
+            else:
+                filtered_posts = posts_df
             
-            if posts:
-                posts_df = pd.DataFrame(
-                    posts,
-                    columns=["ID", "제목", "내용", "작성자", "작성일", "댓글 수"]
-                )
+            # Display posts
+            st.dataframe(filtered_posts)
+            
+            # View/Edit/Delete post
+            with st.expander("게시글 보기/수정/삭제"):
+                # Get all posts
+                cur.execute("""
+                    SELECT p.post_id, p.title, u.username, p.created_at
+                    FROM blog_posts p
+                    JOIN users u ON p.user_id = u.user_id
+                    ORDER BY p.created_at DESC
+                """)
                 
-                # Filter options
-                author_filter = ["모두 보기"] + sorted(posts_df["작성자"].unique().tolist())
-                selected_author = st.selectbox("작성자별 필터링", author_filter, key="blog_author_filter")
+                posts = cur.fetchall()
+                post_options = {f"{row[1]} (by {row[2]} - {row[3].strftime('%Y-%m-%d')})": row[0] for row in posts}
                 
-                if selected_author != "모두 보기":
-                    filtered_posts = posts_df[posts_df["작성자"] == selected_author]
-                else:
-                    filtered_posts = posts_df
+                selected_post = st.selectbox("게시글 선택", list(post_options.keys()), key="blog_post_select")
+                post_id = post_options[selected_post]
                 
-                # Display posts
-                st.dataframe(filtered_posts)
+                # Get post details
+                cur.execute("""
+                    SELECT p.title, p.content, p.image_urls, p.user_id, u.username
+                    FROM blog_posts p
+                    JOIN users u ON p.user_id = u.user_id
+                    WHERE p.post_id = %s
+                """, (post_id,))
                 
-                # View/Edit/Delete post
-                with st.expander("게시글 보기/수정/삭제"):
-                    # Get all posts
-                    cur.execute("""
-                        SELECT p.post_id, p.title, u.username, p.created_at
-                        FROM blog_posts p
-                        JOIN users u ON p.user_id = u.user_id
-                        ORDER BY p.created_at DESC
-                    """)
+                post = cur.fetchone()
+                if post:
+                    title, content, image_urls_json, author_id, author_name = post
                     
-                    posts = cur.fetchall()
-                    post_options = {f"{row[1]} (by {row[2]} - {row[3].strftime('%Y-%m-%d')})": row[0] for row in posts}
+                    st.write(f"### {title}")
+                    st.write(f"**작성자**: {author_name}")
+                    st.write(content)
                     
-                    selected_post = st.selectbox("게시글 선택", list(post_options.keys()), key="blog_post_select")
-                    post_id = post_options[selected_post]
+                    # Display images if any
+                    if image_urls_json:
+                        try:
+                            image_urls = json.loads(image_urls_json)
+                            if image_urls:
+                                st.write("**첨부 이미지**:")
+                                cols = st.columns(min(len(image_urls), 3))
+                                for i, img_url in enumerate(image_urls):
+                                    with cols[i % 3]:
+                                        st.image(img_url, width=150)
+                        except:
+                            st.write("이미지를 불러올 수 없습니다.")
                     
-                    # Get post details
+                    # Get comments
                     cur.execute("""
-                        SELECT p.title, p.content, p.image_urls, p.user_id, u.username
-                        FROM blog_posts p
-                        JOIN users u ON p.user_id = u.user_id
-                        WHERE p.post_id = %s
+                        SELECT c.comment_id, c.content, u.username, c.created_at
+                        FROM blog_comments c
+                        JOIN users u ON c.user_id = u.user_id
+                        WHERE c.post_id = %s
+                        ORDER BY c.created_at
                     """, (post_id,))
                     
-                    post = cur.fetchone()
-                    if post:
-                        title, content, image_urls_json, author_id, author_name = post
-                        
-                        st.write(f"### {title}")
-                        st.write(f"**작성자**: {author_name}")
-                        st.write(content)
-                        
-                        # Display images if any
-                        if image_urls_json:
-                            try:
-                                image_urls = json.loads(image_urls_json)
-                                if image_urls:
-                                    st.write("**첨부 이미지**:")
-                                    cols = st.columns(min(len(image_urls), 3))
-                                    for i, img_url in enumerate(image_urls):
-                                        with cols[i % 3]:
-                                            st.image(img_url, width=150)
-                            except:
-                                st.write("이미지를 불러올 수 없습니다.")
-                        
-                        # Get comments
-                        cur.execute("""
-                            SELECT c.comment_id, c.content, u.username, c.created_at
-                            FROM blog_comments c
-                            JOIN users u ON c.user_id = u.user_id
-                            WHERE c.post_id = %s
-                            ORDER BY c.created_at
-                        """, (post_id,))
-                        
-                        comments = cur.fetchall()
-                        
-                        if comments:
-                            st.write("### 댓글")
-                            for comment_id, comment, comment_author, comment_time in comments:
-                                st.markdown(f"""
-                                    <div style="background-color: #f0f2f6; padding: 10px; border-radius: 5px; margin-bottom: 10px;">
-                                        <p><strong>{comment_author}</strong> • {comment_time.strftime('%Y-%m-%d %H:%M')}</p>
-                                        <p>{comment}</p>
-                                    </div>
-                                """, unsafe_allow_html=True)
-                                
-                                # Delete comment option
-                                if st.button(f"댓글 삭제", key=f"delete_comment_{comment_id}"):
-                                    try:
-                                        cur.execute("DELETE FROM blog_comments WHERE comment_id = %s", (comment_id,))
-                                        conn.commit()
-                                        st.success("댓글이 삭제되었습니다!")
-                                        st.rerun()
-                                    except Exception as e:
-                                        conn.rollback()
-                                        st.error(f"오류가 발생했습니다: {str(e)}")
-                        
-                        # Delete post option
-                        delete_confirm = st.checkbox(f"'{title}' 게시글을 정말로 삭제하시겠습니까?", key=f"delete_post_confirm_{post_id}")
-                        if st.button("게시글 삭제") and delete_confirm:
-                            try:
-                                # Delete comments first
-                                cur.execute("DELETE FROM blog_comments WHERE post_id = %s", (post_id,))
-                                
-                                # Then delete the post
-                                cur.execute("DELETE FROM blog_posts WHERE post_id = %s", (post_id,))
-                                
-                                conn.commit()
-                                st.success(f"'{title}' 게시글이 삭제되었습니다!")
-                                st.rerun()
-                            except Exception as e:
-                                conn.rollback()
-                                st.error(f"오류가 발생했습니다: {str(e)}")
-            else:
-                st.info("게시글이 없습니다.")
+                    comments = cur.fetchall()
+                    
+                    if comments:
+                        st.write("### 댓글")
+                        for comment_id, comment, comment_author, comment_time in comments:
+                            st.markdown(f"""
+                                <div style="background-color: #f0f2f6; padding: 10px; border-radius: 5px; margin-bottom: 10px;">
+                                    <p><strong>{comment_author}</strong> • {comment_time.strftime('%Y-%m-%d %H:%M')}</p>
+                                    <p>{comment}</p>
+                                </div>
+                            """, unsafe_allow_html=True)
+                            
+                            # Delete comment option
+                            if st.button(f"댓글 삭제", key=f"delete_comment_{comment_id}"):
+                                try:
+                                    cur.execute("DELETE FROM blog_comments WHERE comment_id = %s", (comment_id,))
+                                    conn.commit()
+                                    st.success("댓글이 삭제되었습니다!")
+                                    st.rerun()
+                                except Exception as e:
+                                    conn.rollback()
+                                    st.error(f"오류가 발생했습니다: {str(e)}")
+                    
+                    # Delete post option
+                    delete_confirm = st.checkbox(f"'{title}' 게시글을 정말로 삭제하시겠습니까?", key=f"delete_post_confirm_{post_id}")
+                    if st.button("게시글 삭제") and delete_confirm:
+                        try:
+                            # Delete comments first
+                            cur.execute("DELETE FROM blog_comments WHERE post_id = %s", (post_id,))
+                            
+                            # Then delete the post
+                            cur.execute("DELETE FROM blog_posts WHERE post_id = %s", (post_id,))
+                            
+                            conn.commit()
+                            st.success(f"'{title}' 게시글이 삭제되었습니다!")
+                            st.rerun()
+                        except Exception as e:
+                            conn.rollback()
+                            st.error(f"오류가 발생했습니다: {str(e)}")
+        else:
+            st.info("게시글이 없습니다.")
     
     #-----------------------------------------------------------
     # 5. STATISTICS TAB
@@ -724,98 +772,61 @@ try:
     with tabs[4]:
         st.header("📊 통계")
         
+        # Totals and the daily series both come from pre-aggregated data
+        role_rows, transaction_count, post_count, comment_count = get_economy_totals()
+        everyone = role_rows[-1] if role_rows else (None, 0, 0, 0, 0)
+        
         col1, col2, col3 = st.columns(3)
         
         with col1:
-            # User counts
-            cur.execute("""
-                SELECT COUNT(*) FROM users
-            """)
-            user_count = cur.fetchone()[0]
-            
-            cur.execute("""
-                SELECT role, COUNT(*) FROM users GROUP BY role
-            """)
-            role_counts = cur.fetchall()
-            
-            st.metric("총 사용자 수", user_count)
+            st.metric("총 사용자 수", everyone[1])
             
             st.write("### 역할별 사용자 수")
-            role_df = pd.DataFrame(role_counts, columns=["역할", "수"])
+            role_df = pd.DataFrame([row[:2] for row in role_rows[:-1]], columns=["역할", "수"])
             st.dataframe(role_df)
         
         with col2:
-            # Currency statistics
-            cur.execute("""
-                SELECT SUM(currency) FROM users
-            """)
-            total_currency = cur.fetchone()[0] or 0
-            
-            cur.execute("""
-                SELECT MAX(currency) FROM users
-            """)
-            max_currency = cur.fetchone()[0] or 0
-            
-            cur.execute("""
-                SELECT AVG(currency) FROM users
-            """)
-            avg_currency = cur.fetchone()[0] or 0
-            
-            st.metric("총 화폐량", f"{total_currency:,}원")
-            st.metric("최고 보유량", f"{max_currency:,}원")
-            st.metric("평균 보유량", f"{int(avg_currency):,}원")
+            st.metric("총 화폐량", f"{everyone[2]:,}원")
+            st.metric("최고 보유량", f"{everyone[3]:,}원")
+            st.metric("평균 보유량", f"{int(everyone[4]):,}원")
         
         with col3:
-            # Activity statistics
-            try:
-                cur.execute("""
-                    SELECT COUNT(*) FROM transactions
-                """)
-                transaction_count = cur.fetchone()[0] or 0
-                st.metric("총 거래 수", transaction_count)
-            except:
-                st.info("거래 정보가 없습니다.")
-            
-            try:
-                cur.execute("""
-                    SELECT COUNT(*) FROM blog_posts
-                """)
-                post_count = cur.fetchone()[0] or 0
-                st.metric("총 게시글 수", post_count)
-            except:
-                st.info("게시글 정보가 없습니다.")
-            
-            try:
-                cur.execute("""
-                    SELECT COUNT(*) FROM blog_comments
-                """)
-                comment_count = cur.fetchone()[0] or 0
-                st.metric("총 댓글 수", comment_count)
-            except:
-                pass
+            st.metric("총 거래 수", transaction_count)
+            st.metric("총 게시글 수", post_count)
+            st.metric("총 댓글 수", comment_count)
         
         # Activity over time
         st.subheader("시간별 활동")
         
-        try:
-            # Transactions by day
-            cur.execute("""
-                SELECT DATE(created_at) as date, COUNT(*) as count
-                FROM transactions
-                GROUP BY DATE(created_at)
-                ORDER BY date DESC
-                LIMIT 30
-            """)
-            
-            transactions_by_day = cur.fetchall()
-            
-            if transactions_by_day:
-                trans_df = pd.DataFrame(transactions_by_day, columns=["날짜", "거래 수"])
-                trans_df = trans_df.sort_values("날짜")
-                
-                st.line_chart(trans_df.set_index("날짜"))
-        except:
+        economy_daily = get_economy_daily(days=30)
+        if economy_daily:
+            economy_df = pd.DataFrame(
+                economy_daily,
+                columns=["날짜", "거래 수", "거래량", "퀘스트 보상", "상점 지출", "월급", "통화량"]
+            ).set_index("날짜")
+            st.line_chart(economy_df[["거래 수"]])
+            st.line_chart(economy_df[["통화량"]])
+            st.bar_chart(economy_df[["퀘스트 보상", "상점 지출", "월급"]])
+        else:
             st.info("거래 내역이 없습니다.")
+        
+        # Savings balances brought forward to now
+        st.subheader("저축 계좌")
+        savings_rows, savings_total, savings_accrued = get_savings_overview()
+        if savings_rows:
+            col1, col2 = st.columns(2)
+            col1.metric("총 저축액", f"{savings_total:,.0f}원")
+            col2.metric("미지급 이자", f"{savings_accrued:,.0f}원")
+            st.dataframe(pd.DataFrame(savings_rows, columns=["사용자", "기록 잔고", "발생 이자", "현재 잔고"]).round(2))
+        else:
+            st.info("저축 계좌가 없습니다.")
+        
+        if st.button("일별 집계 다시 계산", key="rebuild_economy_rollups"):
+            try:
+                rebuild_economy_rollups()
+                st.success("일별 집계를 다시 계산했습니다.")
+            except Exception as e:
+                st.error(f"집계 계산 중 오류 발생: {str(e)}")
 
     #-----------------------------------------------------------
     # 6. REFUND MANAGEMENT TAB
@@ -823,103 +834,72 @@ try:
     with tabs[5]:
         st.header("💸 환불 관리")
         
-        # First check if is_active column exists in user_items table
+        # user_items.is_active is guaranteed by schema migration 2
         try:
+            # Get all user items
             cur.execute("""
-                SELECT EXISTS (
-                    SELECT 1 FROM information_schema.columns 
-                    WHERE table_name = 'user_items' AND column_name = 'is_active'
-                )
+                SELECT ui.id, u.username, s.name, s.price, ui.purchased_at
+                FROM user_items ui
+                JOIN users u ON ui.user_id = u.user_id
+                JOIN shop_items s ON ui.item_id = s.item_id
+                WHERE ui.is_active = true
+                ORDER BY ui.purchased_at DESC
             """)
-            is_active_exists = cur.fetchone()[0]
+            user_items = cur.fetchall()
             
-            if not is_active_exists:
-                st.warning("'is_active' 컬럼이 user_items 테이블에 없습니다. 데이터베이스 진단 페이지에서 스키마를 업그레이드해주세요.")
-                st.info("데이터베이스 진단 페이지로 이동하여 '스키마 업그레이드' 섹션에서 'is_active 컬럼 빠른 추가' 기능을 사용하세요.")
-                if st.button("is_active 컬럼 추가"):
-                    try:
-                        # Add is_active column
-                        cur.execute("ALTER TABLE user_items ADD COLUMN is_active BOOLEAN DEFAULT true")
-                        conn.commit()
-                        st.success("is_active 컬럼이 추가되었습니다!")
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"컬럼 추가 중 오류 발생: {str(e)}")
+            if not user_items:
+                st.info("환불 가능한 아이템이 없습니다.")
             else:
-                # Get all user items
-                cur.execute("""
-                    SELECT ui.id, u.username, s.name, s.price, ui.purchased_at
-                    FROM user_items ui
-                    JOIN users u ON ui.user_id = u.user_id
-                    JOIN shop_items s ON ui.item_id = s.item_id
-                    WHERE ui.is_active = true
-                    ORDER BY ui.purchased_at DESC
-                """)
-                user_items = cur.fetchall()
-                
-                if not user_items:
-                    st.info("환불 가능한 아이템이 없습니다.")
-                else:
-                    for item in user_items:
-                        with st.expander(f"{item[1]} - {item[2]} (구매일: {item[4]})"):
-                            st.write(f"구매 금액: {item[3]}")
+                for item in user_items:
+                    with st.expander(f"{item[1]} - {item[2]} (구매일: {item[4]})"):
+                        st.write(f"구매 금액: {item[3]}")
+                        
+                        # Refund form
+                        with st.form(f"refund_form_{item[0]}"):
+                            reason = st.text_input("환불 사유", key=f"refund_reason_{item[0]}")
+                            submit = st.form_submit_button("환불 처리")
                             
-                            # Refund form
-                            with st.form(f"refund_form_{item[0]}"):
-                                reason = st.text_input("환불 사유", key=f"refund_reason_{item[0]}")
-                                submit = st.form_submit_button("환불 처리")
-                                
-                                if submit:
-                                    if reason:
-                                        try:
-                                            # Start transaction
-                                            cur.execute("BEGIN")
+                            if submit:
+                                if reason:
+                                    try:
+                                        # Start transaction
+                                        cur.execute("BEGIN")
+                                        
+                                        # Get user_id and item_id
+                                        cur.execute("SELECT user_id, item_id FROM user_items WHERE id = %s", (item[0],))
+                                        user_item = cur.fetchone()
+                                        
+                                        if user_item:
+                                            # Add refund record
+                                            cur.execute("""
+                                                INSERT INTO refunds (user_item_id, user_id, item_id, amount, reason, processed_by)
+                                                VALUES (%s, %s, %s, %s, %s, %s)
+                                            """, (item[0], user_item[0], user_item[1], item[3], reason, user_id))
                                             
-                                            # Get user_id and item_id
-                                            cur.execute("SELECT user_id, item_id FROM user_items WHERE id = %s", (item[0],))
-                                            user_item = cur.fetchone()
+                                            # Deactivate user item
+                                            cur.execute("""
+                                                UPDATE user_items 
+                                                SET is_active = false 
+                                                WHERE id = %s
+                                            """, (item[0],))
                                             
-                                            if user_item:
-                                                # Add refund record
-                                                cur.execute("""
-                                                    INSERT INTO refunds (user_item_id, user_id, item_id, amount, reason, processed_by)
-                                                    VALUES (%s, %s, %s, %s, %s, %s)
-                                                """, (item[0], user_item[0], user_item[1], item[3], reason, user_id))
-                                                
-                                                # Update user's currency
-                                                cur.execute("""
-                                                    UPDATE users 
-                                                    SET currency = currency + %s 
-                                                    WHERE user_id = %s
-                                                """, (item[3], user_item[0]))
-                                                
-                                                # Deactivate user item
-                                                cur.execute("""
-                                                    UPDATE user_items 
-                                                    SET is_active = false 
-                                                    WHERE id = %s
-                                                """, (item[0],))
-                                                
-                                                # Add transaction record
-                                                cur.execute("""
-                                                    INSERT INTO transactions (from_user_id, to_user_id, amount, type, description, created_by)
-                                                    VALUES (%s, %s, %s, %s, %s, %s)
-                                                """, (user_id, user_item[0], item[3], 'refund', reason, user_id))
-                                                
-                                                # Commit transaction
-                                                cur.execute("COMMIT")
-                                                st.success(f"{item[2]} 아이템이 환불되었습니다.")
-                                                st.rerun()
-                                            else:
-                                                cur.execute("ROLLBACK")
-                                                st.error("아이템 정보를 찾을 수 없습니다.")
-                                        except Exception as e:
+                                            # Refund from the treasury the purchase was paid into
+                                            post_transaction(cur, None, user_item[0], item[3], 'refund', reason, user_id)
+                                            
+                                            # Commit transaction
+                                            cur.execute("COMMIT")
+                                            st.success(f"{item[2]} 아이템이 환불되었습니다.")
+                                            st.rerun()
+                                        else:
                                             cur.execute("ROLLBACK")
-                                            st.error(f"환불 처리 중 오류 발생: {str(e)}")
-                                    else:
-                                        st.error("환불 사유를 입력해주세요.")
+                                            st.error("아이템 정보를 찾을 수 없습니다.")
+                                    except Exception as e:
+                                        cur.execute("ROLLBACK")
+                                        st.error(f"환불 처리 중 오류 발생: {str(e)}")
+                                else:
+                                    st.error("환불 사유를 입력해주세요.")
         except Exception as e:
-            st.error(f"테이블 구조 확인 중 오류 발생: {str(e)}")
+            st.error(f"환불 목록을 불러오는 중 오류 발생: {str(e)}")
             st.info("데이터베이스 진단 페이지에서 테이블 구조를 확인하고 필요한 경우 초기화해주세요.")
 
     #-----------------------------------------------------------
@@ -1021,6 +1001,84 @@ try:
         except Exception as e:
             st.error(f"공지 목록을 불러오는 중 오류가 발생했습니다: {str(e)}")
 
+    #-----------------------------------------------------------
+    # 8. STOCK MANAGEMENT TAB
+    #-----------------------------------------------------------
+    with tabs[7]:
+        st.header("📈 주식 관리")
+        
+        provider = get_price_provider()
+        ticker_status = get_price_ticker().status()
+        st.write(
+            f"가격 소스: {provider.name}, {ticker_status['interval']}초마다 자동 갱신 "
+            f"(가격 기준 {ticker_status['prices_as_of']}, 버전 {ticker_status['version']})"
+        )
+        if ticker_status["last_error"]:
+            st.warning(f"마지막 가격 갱신 오류: {ticker_status['last_error']}")
+        if st.button("지금 갱신"):
+            get_price_ticker().request_tick()
+            st.info("가격 갱신을 요청했습니다. 잠시 후 반영됩니다.")
+        
+        # Drift, volatility and market correlation drive the simulated market
+        market_parameters = get_market_parameters()
+        if market_parameters:
+            parameters_df = pd.DataFrame(
+                market_parameters,
+                columns=["ID", "종목", "이름", "현재가", "연 기대수익률", "연 변동성", "시장 상관계수"]
+            ).set_index("ID")
+            edited_parameters = st.data_editor(
+                parameters_df,
+                disabled=["종목", "이름", "현재가"],
+                column_config={
+                    "연 기대수익률": st.column_config.NumberColumn(min_value=-1.0, max_value=1.0, step=0.01, format="%.2f"),
+                    "연 변동성": st.column_config.NumberColumn(min_value=0.0, max_value=2.0, step=0.01, format="%.2f"),
+                    "시장 상관계수": st.column_config.NumberColumn(min_value=0.0, max_value=1.0, step=0.05, format="%.2f"),
+                },
+                key="market_parameters"
+            )
+            if st.button("시장 설정 저장"):
+                try:
+                    set_market_parameters(
+                        (int(stock_id), row["연 기대수익률"], row["연 변동성"], row["시장 상관계수"])
+                        for stock_id, row in edited_parameters.iterrows()
+                    )
+                    st.success("시장 설정이 저장되었습니다.")
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"시장 설정 저장 중 오류 발생: {str(e)}")
+        else:
+            st.info("등록된 종목이 없습니다.")
+        
+        # Charts read the stored ticks; backfill only fetches ranges with no ticks
+        if market_parameters:
+            col1, col2 = st.columns(2)
+            with col1:
+                chart_symbol = st.selectbox("차트 종목", [row[1] for row in market_parameters], key="chart_symbol")
+            with col2:
+                chart_interval = st.radio("봉", list(BAR_INTERVALS), horizontal=True, key="chart_interval")
+            bars = get_stock_history(chart_symbol, days=365, interval=chart_interval)
+            if bars.empty:
+                st.info("저장된 가격이 없습니다.")
+            else:
+                st.line_chart(bars[["Open", "High", "Low", "Close"]])
+            if st.button("과거 가격 채우기"):
+                try:
+                    st.success(f"가격 {backfill_stock_prices(provider=provider):,}건을 추가했습니다.")
+                except Exception as e:
+                    st.error(f"과거 가격을 가져오는 중 오류 발생: {str(e)}")
+        
+        with st.expander("새 종목 추가"):
+            new_symbol = st.text_input("종목 코드", key="new_stock_symbol")
+            new_stock_name = st.text_input("종목 이름", key="new_stock_name")
+            listing_price = st.number_input("상장가 (0이면 가격 소스에서 가져옴)", min_value=0.0, step=10.0, key="new_stock_price")
+            if st.button("종목 추가"):
+                try:
+                    add_stock(new_symbol.strip().upper(), new_stock_name, listing_price or None, provider)
+                    st.success(f"{new_symbol} 종목이 추가되었습니다.")
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"종목 추가 중 오류 발생: {str(e)}")
+
 except Exception as e:
     st.error(f"오류가 발생했습니다: {str(e)}")
     st.write("Debug - Error Details:", e) 
\ No newline at end of file
@@ -1,10 +1,12 @@
 import streamlit as st
-from libs.db_utils import test_connection, recover_connection, check_table_exists, execute_query
-from libs.db import init_tables
+from libs.db_utils import test_connection, recover_connection, check_table_exists, execute_query, get_circuit_breaker
+from libs.db import (
+    init_tables, try_get_conn, get_pool, pool_stats, get_query_cache, get_query_stats, get_replica_router,
+    get_singleflight, migrate, schema_status, MIGRATIONS, LATEST_SCHEMA_VERSION
+)
 import json
 import pandas as pd
 import time
-import psycopg2
 import traceback
 
 # Check if user is logged in and is admin
@@ -23,33 +25,12 @@ st.info("""
 5. **연결 풀 상태**를 확인하여 활성 연결을 모니터링할 수 있습니다.(테스트 중 하나)
 """) 
 
-# Function to get a fresh connection for each operation
-def get_fresh_connection():
-    """Get a completely fresh database connection for this operation"""
-    try:
-        # Create a brand new connection using secrets
-        conn = psycopg2.connect(
-            user=st.secrets["user"],
-            password=st.secrets["password"],
-            host=st.secrets["host"],
-            port=st.secrets["port"],
-            dbname=st.secrets["dbname"],
-            keepalives=1,
-            keepalives_idle=30,
-            keepalives_interval=10,
-            keepalives_count=5
-        )
-        conn.autocommit = True
-        return conn, None
-    except Exception as e:
-        return None, str(e)
-
 # Connection test section
 st.header("1️⃣ 데이터베이스 연결 테스트")
 
 if st.button("연결 테스트 실행", key="test_conn_btn"):
     with st.spinner("데이터베이스 연결 테스트 중..."):
-        conn, error = get_fresh_connection()
+        conn, error = try_get_conn()
         
         if conn:
             try:
@@ -74,8 +55,9 @@ if st.button("연결 테스트 실행", key="test_conn_btn"):
                         if "db_conn" in st.session_state:
                             del st.session_state.db_conn
                             
-                        # Try a completely fresh connection    
-                        new_conn, new_error = get_fresh_connection()
+                        # Drop idle pooled connections and try again
+                        get_pool().reset()
+                        new_conn, new_error = try_get_conn()
                         if new_conn:
                             st.success("✅ 복구 성공: 새 연결이 성공적으로 생성되었습니다.")
                             try:
@@ -101,7 +83,7 @@ if st.button("전체 진단 실행", key="diagnose_btn"):
         }
         
         # Test connection
-        conn, error = get_fresh_connection()
+        conn, error = try_get_conn()
         if conn:
             results["connection"]["status"] = "ok"
             results["connection"]["message"] = "데이터베이스에 성공적으로 연결되었습니다."
@@ -145,7 +127,7 @@ if st.button("전체 진단 실행", key="diagnose_btn"):
                             results["columns"]["user_items.is_active"] = has_is_active
                             
                             if not has_is_active:
-                                results["recommended_actions"].append("'user_items' 테이블에 'is_active' 컬럼이 없습니다. 스키마 업그레이드가 필요합니다.")
+                                results["recommended_actions"].append("'user_items' 테이블에 'is_active' 컬럼이 없습니다. 스키마 업그레이드에서 마이그레이션을 실행하세요.")
                 
                 cur.close()
             except Exception as e:
@@ -235,7 +217,7 @@ if st.button("데이터베이스 초기화 실행", key="init_db_btn"):
                 time.sleep(2)
                 
                 # Check if it worked
-                conn, error = get_fresh_connection()
+                conn, error = try_get_conn()
                 if conn:
                     try:
                         cur = conn.cursor()
@@ -278,47 +260,34 @@ if st.button("데이터베이스 초기화 실행", key="init_db_btn"):
 
 # Database schema upgrade section
 st.header("4️⃣ 스키마 업그레이드")
-st.write("데이터베이스 스키마 변경이 필요한 경우 이 섹션을 사용하세요.")
+st.write("스키마 변경은 버전이 매겨진 마이그레이션으로 관리됩니다. 앱이 시작될 때 프로세스당 한 번 자동으로 적용됩니다.")
 
-# Add is_active column to user_items table
-with st.expander("is_active 컬럼 추가"):
-    st.warning("환불 기능을 위해 user_items 테이블에 is_active 컬럼이 필요합니다.")
-    if st.button("is_active 컬럼 추가", key="add_is_active"):
-        conn, error = get_fresh_connection()
-        if conn:
-            try:
-                cur = conn.cursor()
-                
-                # Check if column exists first
-                cur.execute("""
-                    SELECT EXISTS (
-                        SELECT 1 FROM information_schema.columns 
-                        WHERE table_name = 'user_items' AND column_name = 'is_active'
-                    )
-                """)
-                column_exists = cur.fetchone()[0]
-                
-                if column_exists:
-                    st.info("is_active 컬럼이 이미 존재합니다.")
-                else:
-                    cur.execute("ALTER TABLE user_items ADD COLUMN is_active BOOLEAN DEFAULT true")
-                    st.success("✅ user_items 테이블에 is_active 컬럼이 추가되었습니다!")
-                    
-                    # Set all existing records to active
-                    cur.execute("UPDATE user_items SET is_active = true")
-                    st.success("✅ 모든 기존 아이템이 활성 상태로 설정되었습니다.")
-                
-                cur.close()
-                conn.close()
-            except Exception as e:
-                st.error(f"is_active 컬럼 추가 중 오류 발생: {str(e)}")
-                try:
-                    cur.close()
-                    conn.close()
-                except:
-                    pass
+if st.button("스키마 버전 확인", key="schema_status_btn"):
+    try:
+        current_version, pending = schema_status()
+        st.metric("현재 스키마 버전", f"{current_version} / {LATEST_SCHEMA_VERSION}")
+        
+        migrations_df = pd.DataFrame([
+            {"버전": version, "설명": description, "상태": "✅ 적용됨" if version <= current_version else "⏳ 대기 중"}
+            for version, description, _ in MIGRATIONS
+        ])
+        st.dataframe(migrations_df)
+        
+        if pending:
+            st.warning(f"{len(pending)}개의 마이그레이션이 적용되지 않았습니다.")
+    except Exception as e:
+        st.error(f"스키마 버전 확인 중 오류 발생: {str(e)}")
+
+if st.button("마이그레이션 실행", key="run_migrations_btn"):
+    try:
+        version, applied = migrate()
+        if applied:
+            st.success(f"✅ 마이그레이션 {', '.join(str(v) for v in applied)} 적용 완료 (현재 버전 {version})")
         else:
-            st.error(f"데이터베이스 연결 실패: {error}")
+            st.info(f"이미 최신 버전입니다 (버전 {version}).")
+    except Exception as e:
+        st.error(f"마이그레이션 중 오류 발생: {str(e)}")
+        st.code(traceback.format_exc())
 
 # Manual query section (for advanced users)
 st.header("5️⃣ 수동 쿼리 실행 (고급)")
@@ -329,7 +298,7 @@ execute_btn = st.button("쿼리 실행", key="execute_query_btn")
 
 if execute_btn and query:
     with st.spinner("쿼리 실행 중..."):
-        conn, error = get_fresh_connection()
+        conn, error = try_get_conn()
         if conn:
             try:
                 cur = conn.cursor()
@@ -376,7 +345,7 @@ if execute_btn and query:
 # Connection pool status (for monitoring)
 st.header("6️⃣ 연결 풀 상태")
 if st.button("연결 풀 상태 확인", key="check_pool_btn"):
-    conn, error = get_fresh_connection()
+    conn, error = try_get_conn()
     if conn:
         try:
             cur = conn.cursor()
@@ -387,6 +356,63 @@ if st.button("연결 풀 상태 확인", key="check_pool_btn"):
             
             cur.close()
             conn.close()
+            
+            # Shared pool statistics for this process
+            stats = pool_stats()
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("풀 크기", f"{stats['size']} / {stats['max_size']}")
+            col2.metric("사용 중", stats["in_use"])
+            col3.metric("유휴", stats["idle"])
+            col4.metric("재사용률", f"{stats['hit_rate']:.0%}")
+            
+            stats_df = pd.DataFrame([
+                {"항목": "재사용 (hit)", "값": stats["hits"]},
+                {"항목": "새 연결 (miss)", "값": stats["misses"]},
+                {"항목": "대기 횟수", "값": stats["waits"]},
+                {"항목": "총 대기 시간(초)", "값": round(stats["wait_time"], 3)},
+                {"항목": "대기 시간 초과", "값": stats["timeouts"]},
+                {"항목": "폐기된 연결", "값": stats["recycled"]},
+                {"항목": "pre-ping 실패", "값": stats["ping_failures"]},
+            ])
+            st.dataframe(stats_df)
+            
+            # Circuit breaker guarding new connections
+            breaker_stats = get_circuit_breaker().status()
+            st.write(
+                f"회로 차단기: {breaker_stats['state']} "
+                f"(연속 실패 {breaker_stats['consecutive_failures']}회, 차단 {breaker_stats['trips']}회, "
+                f"즉시 거부 {breaker_stats['rejected']}회"
+                + (f", {breaker_stats['retry_in']:.0f}초 후 재시도" if breaker_stats['retry_in'] else "")
+                + ")"
+            )
+            
+            # Read replica routing (only when replica_dsn is configured)
+            router = get_replica_router()
+            if router is not None:
+                replica_stats = router.status()
+                st.write(
+                    f"읽기 복제본: 복제본 읽기 {replica_stats['replica_reads']}회, "
+                    f"복제 지연으로 기본 서버 읽기 {replica_stats['lag_fallbacks']}회, "
+                    f"연결 실패로 기본 서버 읽기 {replica_stats['error_fallbacks']}회, "
+                    f"복제본 연결 {replica_stats['pool']['size']} / {replica_stats['pool']['max_size']}"
+                )
+            
+            # Query result cache statistics
+            cache_stats = get_query_cache().status()
+            st.write(
+                f"쿼리 캐시: {cache_stats['entries']}개 항목, "
+                f"{cache_stats['bytes'] / 1024:,.1f} KB / {cache_stats['max_bytes'] / 1024 / 1024:,.0f} MB, "
+                f"적중률 {cache_stats['hit_rate']:.0%} "
+                f"(무효화 {cache_stats['invalidations']}회, 제거 {cache_stats['evictions']}회)"
+            )
+            
+            # Identical concurrent reads coalesced by select_query
+            flight_stats = get_singleflight().status()
+            st.write(
+                f"동시 요청 병합: 실행 {flight_stats['executions']}회, "
+                f"공유로 아낀 실행 {flight_stats['shared']}회 ({flight_stats['saved_rate']:.0%}), "
+                f"재실행 {flight_stats['retried']}회"
+            )
         except Exception as e:
             st.error(f"연결 풀 상태 확인 중 오류 발생: {str(e)}")
             try:
@@ -397,4 +423,63 @@ if st.button("연결 풀 상태 확인", key="check_pool_btn"):
     else:
         st.error(f"데이터베이스 연결 실패: {error}")
 
+# Per-query instrumentation recorded by the pooled cursors in this process
+st.subheader("쿼리 계측")
+top_n = st.number_input("표시할 쿼리 수", min_value=1, max_value=50, value=10, key="query_stats_top_n")
+query_stats = get_query_stats()
+query_stats.detail = st.checkbox(
+    "모든 쿼리의 호출 위치와 페이지별 집계 기록",
+    value=query_stats.detail,
+    help=f"끄면 {query_stats.slow_threshold * 1000:.0f}ms 이상 걸린 쿼리만 호출 위치를 기록합니다.",
+    key="query_stats_detail"
+)
+query_summary = query_stats.summary(top_n=int(top_n))
+
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("기록된 쿼리", f"{query_summary['count']:,}")
+col2.metric("p50", f"{query_summary['p50'] * 1000:.1f} ms")
+col3.metric("p95", f"{query_summary['p95'] * 1000:.1f} ms")
+col4.metric("p99", f"{query_summary['p99'] * 1000:.1f} ms")
+
+def _statements_df(entries):
+    return pd.DataFrame([
+        {
+            "쿼리": entry["statement"],
+            "실행 수": entry["count"],
+            "평균(ms)": round(entry["avg"] * 1000, 2),
+            "p95(ms)": round(entry["p95"] * 1000, 2),
+            "최대(ms)": round(entry["max"] * 1000, 2),
+            "총 행 수": entry["rows"],
+            "오류": entry["errors"],
+            "호출 위치": entry["callers"],
+        }
+        for entry in entries
+    ])
+
+if query_summary["count"]:
+    st.write("**가장 느린 쿼리 (p95 기준)**")
+    st.dataframe(_statements_df(query_summary["slowest"]))
+    
+    st.write("**가장 자주 실행된 쿼리**")
+    st.dataframe(_statements_df(query_summary["most_frequent"]))
+    
+    st.write("**페이지별 실행당 쿼리 수**")
+    if not query_summary["pages"]:
+        st.caption("페이지별 집계는 위의 호출 위치 기록을 켠 뒤 실행된 쿼리부터 쌓입니다.")
+    st.dataframe(pd.DataFrame([
+        {
+            "페이지": entry["page"],
+            "실행 수": entry["runs"],
+            "실행당 쿼리 수": round(entry["queries_per_run"], 1),
+            "실행당 DB 시간(ms)": round(entry["ms_per_run"], 1),
+        }
+        for entry in query_summary["pages"]
+    ]))
+else:
+    st.info("아직 기록된 쿼리가 없습니다.")
+
+if st.button("계측 기록 초기화", key="clear_query_stats_btn"):
+    query_stats.clear()
+    st.rerun()
+
 st.markdown("---")
\ No newline at end of file
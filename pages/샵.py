@@ -1,7 +1,7 @@
 import streamlit as st
-from libs.db import get_conn
-from libs.currency import get_user_currency
-import psycopg2
+from libs.db import get_conn, execute_query
+from libs.page_data import load_shop_page
+from libs.currency import purchase_item
 from datetime import datetime
 
 st.title("🛍️ 프로필 아이템 상점")
@@ -16,29 +16,13 @@ if not user_id:
     st.stop()
 
 try:
-    conn = get_conn()
-    cur = conn.cursor()
-    
-    # Get user balance
-    balance = get_user_currency(user_id)
+    # Balance, catalog and inventory in one round trip
+    shop = load_shop_page(user_id, cache_ttl=60)
+    balance = shop.balance
     st.metric("내 잔고", f"{balance:,}원")
     
-    # Check if shop_items table exists
-    cur.execute("""
-        SELECT EXISTS (
-            SELECT 1 FROM information_schema.tables 
-            WHERE table_name = 'shop_items'
-        )
-    """)
-    
-    table_exists = cur.fetchone()[0]
-    if not table_exists:
-        st.warning("상점 시스템이 아직 준비되지 않았습니다. 데이터베이스 초기화가 필요합니다.")
-        st.stop()
-    
     # Initialize the shop with default items if none exist
-    cur.execute("SELECT COUNT(*) FROM shop_items")
-    if cur.fetchone()[0] == 0:
+    if not shop.items:
         # Only teachers and admins can add items
         if st.session_state.get('role') in ['teacher', '제작자']:
             st.info("상점에 아이템이 없습니다. 몇 가지 기본 아이템을 추가할까요?")
@@ -56,13 +40,14 @@ try:
                     ("귀여운 폰트", "폰트의 업그레이드?!", "font", 150, "https://i.imgur.com/QA3SrWc.png"),
                 ]
                 
-                for name, desc, type_, price, img_url in default_items:
-                    cur.execute(
-                        "INSERT INTO shop_items (name, description, type, price, image_url) VALUES (%s, %s, %s, %s, %s)",
-                        (name, desc, type_, price, img_url)
-                    )
-                
+                conn = get_conn()
+                cur = conn.cursor()
+                cur.executemany(
+                    "INSERT INTO shop_items (name, description, type, price, image_url) VALUES (%s, %s, %s, %s, %s)",
+                    default_items
+                )
                 conn.commit()
+                conn.close()
                 st.success("기본 아이템이 추가되었습니다!")
                 st.rerun()
         else:
@@ -93,11 +78,10 @@ try:
             if st.button("아이템 추가"):
                 if new_name and new_description and new_price > 0:
                     try:
-                        cur.execute(
+                        execute_query(
                             "INSERT INTO shop_items (name, description, type, price, image_url) VALUES (%s, %s, %s, %s, %s)",
                             (new_name, new_description, new_type, new_price, new_image_url)
                         )
-                        conn.commit()
                         st.success(f"'{new_name}' 아이템이 상점에 추가되었습니다!")
                     except Exception as e:
                         st.error(f"아이템 추가 중 오류가 발생했습니다: {str(e)}")
@@ -107,20 +91,8 @@ try:
     # Display shop items by category
     st.subheader("🛒 아이템 구매")
     
-    # Get all available shop items
-    cur.execute("""
-        SELECT item_id, name, description, type, price, image_url
-        FROM shop_items
-        ORDER BY type, price
-    """)
-    all_items = cur.fetchall()
-    
-    # Get user's purchased items
-    cur.execute("""
-        SELECT item_id FROM user_items
-        WHERE user_id = %s
-    """, (user_id,))
-    purchased_items = [row[0] for row in cur.fetchall()]
+    all_items = shop.items
+    purchased_items = shop.purchased_item_ids
     
     # Create tabs for each item category
     tabs = st.tabs(["전체", "아바타", "배지", "배경", "폰트", "색상"])
@@ -157,53 +129,21 @@ try:
                     else:
                         # Buy button
                         if st.button(f"구매하기", key=f"buy_{item_id}_{idx}_{tab_name}"):
-                            # Check if user has enough currency
-                            if balance >= price:
-                                try:
-                                    # Add to user's inventory
-                                    cur.execute(
-                                        "INSERT INTO user_items (user_id, item_id) VALUES (%s, %s)",
-                                        (user_id, item_id)
-                                    )
-                                    
-                                    # Deduct currency
-                                    cur.execute(
-                                        "UPDATE users SET currency = currency - %s WHERE user_id = %s",
-                                        (price, user_id)
-                                    )
-                                    
-                                    # Record transaction
-                                    cur.execute(
-                                        """
-                                        INSERT INTO transactions 
-                                        (from_user_id, to_user_id, amount, type, description, created_by)
-                                        VALUES (%s, NULL, %s, 'transfer', %s, %s)
-                                        """,
-                                        (user_id, price, f"상점에서 '{name}' 아이템 구매", user_id)
-                                    )
-                                    
-                                    conn.commit()
-                                    st.success(f"'{name}' 아이템을 구매했습니다!")
-                                    st.rerun()
-                                except Exception as e:
-                                    conn.rollback()
-                                    st.error(f"구매 중 오류가 발생했습니다: {str(e)}")
-                            else:
+                            # Price check, debit, inventory and ledger in one guarded statement
+                            try:
+                                purchase_item(user_id, item_id)
+                                st.success(f"'{name}' 아이템을 구매했습니다!")
+                                st.rerun()
+                            except LookupError:
+                                st.error("이미 보유했거나 판매하지 않는 아이템입니다.")
+                            except ValueError:
                                 st.error("잔액이 부족합니다!")
                     st.markdown("---")
     
     # Display user's inventory
     st.subheader("🎒 내 인벤토리")
     
-    # Get user's purchased items with details
-    cur.execute("""
-        SELECT i.item_id, i.name, i.description, i.type, i.image_url, ui.is_equipped
-        FROM user_items ui
-        JOIN shop_items i ON ui.item_id = i.item_id
-        WHERE ui.user_id = %s
-        ORDER BY ui.purchased_at DESC
-    """, (user_id,))
-    user_items = cur.fetchall()
+    user_items = shop.inventory
     
     if not user_items:
         st.info("구매한 아이템이 없습니다.")
@@ -231,6 +171,8 @@ try:
                         # Button to equip/unequip
                         button_text = "장착 해제하기" if is_equipped else "장착하기"
                         if st.button(button_text, key=f"equip_{item_id}_{idx}_{tab_name}"):
+                            conn = get_conn()
+                            cur = conn.cursor()
                             try:
                                 # If equipping, unequip any other items of the same type first
                                 if not is_equipped:
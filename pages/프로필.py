@@ -1,7 +1,6 @@
 import streamlit as st
-from libs.db import get_conn
-from libs.currency import get_user_currency
-import psycopg2
+from libs.db import execute_query
+from libs.page_data import load_profile_page
 from datetime import datetime
 import base64
 from io import BytesIO
@@ -19,39 +18,15 @@ if not user_id:
     st.stop()
 
 try:
-    conn = get_conn()
-    cur = conn.cursor()
-    
-    # Get user information
-    cur.execute("""
-        SELECT username, role, currency, 
-               CASE WHEN EXISTS (SELECT 1 FROM information_schema.columns 
-                               WHERE table_name = 'users' AND column_name = 'bio')
-                    THEN bio ELSE '' END as bio,
-               CASE WHEN EXISTS (SELECT 1 FROM information_schema.columns 
-                               WHERE table_name = 'users' AND column_name = 'avatar_url')
-                    THEN avatar_url ELSE '' END as avatar_url,
-               job_id
-        FROM users 
-        WHERE user_id = %s
-    """, (user_id,))
-    
-    user_data = cur.fetchone()
-    if not user_data:
+    # Everything this page renders, in one round trip
+    profile = load_profile_page(user_id, cache_ttl=60)
+    if not profile:
         st.error("사용자 정보를 찾을 수 없습니다.")
         st.stop()
     
-    username, role, currency, bio, avatar_url, job_id = user_data
-    
-    # Get user's equipped items
-    cur.execute("""
-        SELECT i.type, i.image_url
-        FROM user_items ui
-        JOIN shop_items i ON ui.item_id = i.item_id
-        WHERE ui.user_id = %s AND ui.is_equipped = TRUE
-    """, (user_id,))
-    
-    equipped_items = {item_type: url for item_type, url in cur.fetchall()}
+    username, role, currency = profile.username, profile.role, profile.currency
+    bio, avatar_url, job_id = profile.bio, profile.avatar_url, profile.job_id
+    equipped_items = profile.equipped_items
     
     # Main profile display
     col1, col2 = st.columns([1, 3])
@@ -108,21 +83,14 @@ try:
             </div>
         """, unsafe_allow_html=True)
     
-    # Get job information if user has a job
-    if job_id:
-        cur.execute("""
-            SELECT name, salary, description
-            FROM jobs
-            WHERE job_id = %s
-        """, (job_id,))
-        job_data = cur.fetchone()
-        if job_data:
-            job_name, salary, job_description = job_data
-            
-            st.subheader("💼 직업 정보")
-            st.write(f"직업: {job_name}")
-            st.write(f"급여: {salary:,}원")
-            st.write(f"설명: {job_description}")
+    # Job information if user has a job
+    if profile.job:
+        job_name, salary, job_description = profile.job
+        
+        st.subheader("💼 직업 정보")
+        st.write(f"직업: {job_name}")
+        st.write(f"급여: {salary:,}원")
+        st.write(f"설명: {job_description}")
     
     # Edit profile section
     st.subheader("⚙️ 프로필 수정")
@@ -153,17 +121,15 @@ try:
                     new_avatar_url = f"data:image/png;base64,{img_str}"
                 
                 # Update profile in database
-                cur.execute("""
+                execute_query("""
                     UPDATE users
                     SET bio = %s, avatar_url = %s
                     WHERE user_id = %s
                 """, (new_bio, new_avatar_url, user_id))
                 
-                conn.commit()
                 st.success("프로필이 업데이트되었습니다!")
                 st.rerun()
             except Exception as e:
-                conn.rollback()
                 st.error(f"프로필 업데이트 중 오류가 발생했습니다: {str(e)}")
     
     # Equipped items display
@@ -183,25 +149,7 @@ try:
     
     # Transactions
     with st.expander("💰 거래 내역"):
-        cur.execute("""
-            SELECT t.amount, t.type, t.description, t.created_at,
-                   CASE 
-                       WHEN t.from_user_id = %s THEN '출금'
-                       ELSE '입금'
-                   END as direction,
-                   CASE
-                       WHEN t.from_user_id = %s THEN u.username
-                       ELSE u2.username
-                   END as other_user
-            FROM transactions t
-            LEFT JOIN users u ON t.to_user_id = u.user_id
-            LEFT JOIN users u2 ON t.from_user_id = u2.user_id
-            WHERE t.from_user_id = %s OR t.to_user_id = %s
-            ORDER BY t.created_at DESC
-            LIMIT 10
-        """, (user_id, user_id, user_id, user_id))
-        
-        transactions = cur.fetchall()
+        transactions = profile.transactions
         if transactions:
             for amount, t_type, description, created_at, direction, other_user in transactions:
                 if direction == '출금':
@@ -213,16 +161,7 @@ try:
     
     # Quests completed
     with st.expander("🎯 완료한 퀘스트"):
-        cur.execute("""
-            SELECT q.title, q.reward, qc.completed_at, qc.verified_at, u.username
-            FROM quest_completions qc
-            JOIN quests q ON qc.quest_id = q.quest_id
-            LEFT JOIN users u ON qc.verified_by = u.user_id
-            WHERE qc.user_id = %s
-            ORDER BY qc.completed_at DESC
-        """, (user_id,))
-        
-        quests = cur.fetchall()
+        quests = profile.quests
         if quests:
             for title, reward, completed_at, verified_at, verifier in quests:
                 verification_status = f"✅ 인증됨 ({verifier})" if verified_at else "⏳ 인증 대기 중"
@@ -232,15 +171,7 @@ try:
     
     # Purchased items
     with st.expander("🛍️ 구매한 아이템"):
-        cur.execute("""
-            SELECT i.name, i.price, ui.purchased_at
-            FROM user_items ui
-            JOIN shop_items i ON ui.item_id = i.item_id
-            WHERE ui.user_id = %s
-            ORDER BY ui.purchased_at DESC
-        """, (user_id,))
-        
-        items = cur.fetchall()
+        items = profile.purchases
         if items:
             for name, price, purchased_at in items:
                 st.write(f"{purchased_at.strftime('%Y-%m-%d')} - {name} - {price:,}원")
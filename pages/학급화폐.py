@@ -1,9 +1,18 @@
 import streamlit as st
 from libs.currency import (
-    get_user_currency, transfer_currency, create_job, assign_job,
-    create_quest, complete_quest, get_rankings, process_monthly_salaries
+    get_user_currency, transfer_currency, bulk_transfer, create_job, assign_job,
+    create_quest, process_monthly_salaries,
+    get_pending_completions, count_pending_completions, verify_completions, request_completion,
+    get_savings_account, deposit_savings, withdraw_savings, savings_rate
 )
-from libs.db import get_conn
+from libs.db import get_conn, select_query
+from libs.leaderboard import get_leaderboard
+from libs.portfolio import get_valuation
+from libs.stocks import get_all_stocks, place_order, cancel_order, get_user_orders
+import pandas as pd
+
+QUEST_QUEUE_PAGE_SIZE = 20
+RANKING_PAGE_SIZE = 20
 
 st.title("🏦 학급 화폐 시스템")
 
@@ -58,6 +67,27 @@ try:
                 except Exception as e:
                     st.error(str(e))
         
+        # Pay many students at once
+        with st.expander("👥 일괄 지급"):
+            payout_df = pd.DataFrame({"학생": list(student_options.keys()), "금액": [0] * len(student_options)})
+            edited_payouts = st.data_editor(payout_df, disabled=["학생"], hide_index=True, key="bulk_payouts")
+            bulk_description = st.text_input("설명", key="bulk_description")
+            
+            if st.button("일괄 지급"):
+                payouts = [
+                    (student_options[name], int(amount))
+                    for name, amount in zip(edited_payouts["학생"], edited_payouts["금액"])
+                    if amount and amount > 0
+                ]
+                if not payouts:
+                    st.warning("지급할 금액을 입력해주세요.")
+                else:
+                    try:
+                        new_balance = bulk_transfer(user_id, payouts, bulk_description)
+                        st.success(f"{len(payouts)}명에게 총 {sum(amount for _, amount in payouts):,}원을 지급했습니다! (남은 잔고 {new_balance:,}원)")
+                    except Exception as e:
+                        st.error(str(e))
+        
         # Create job
         with st.expander("💼 직업 생성"):
             job_name = st.text_input("직업 이름")
@@ -70,12 +100,11 @@ try:
         
         # Assign job
         with st.expander("👔 직업 배정"):
-            cur.execute("SELECT job_id, name FROM jobs")
-            jobs = cur.fetchall()
+            jobs = select_query("SELECT job_id, name FROM jobs", cache_ttl=300)
             job_options = {name: job_id for job_id, name in jobs}
             
             selected_job = st.selectbox("직업 선택", options=list(job_options.keys()))
-            selected_student = st.selectbox("학생 선택", options=list(student_options.keys()))
+            selected_student = st.selectbox("학생 선택", options=list(student_options.keys()), key="assign_job_student")
             
             if st.button("배정"):
                 assign_job(student_options[selected_student], job_options[selected_job])
@@ -94,20 +123,46 @@ try:
         
         # Verify quest completion
         with st.expander("✅ 퀘스트 인증"):
-            cur.execute("""
-                SELECT q.quest_id, q.title, qc.user_id, u.username
-                FROM quests q
-                JOIN quest_completions qc ON q.quest_id = qc.quest_id
-                JOIN users u ON qc.user_id = u.user_id
-                WHERE qc.verified_at IS NULL
-            """)
-            pending_quests = cur.fetchall()
+            # Stack of page starts for keyset pagination (None = first page)
+            if "quest_queue_pages" not in st.session_state:
+                st.session_state.quest_queue_pages = [None]
+            page_start = st.session_state.quest_queue_pages[-1]
+            pending = get_pending_completions(after=page_start, limit=QUEST_QUEUE_PAGE_SIZE)
             
-            for quest_id, title, student_id, username in pending_quests:
-                st.write(f"퀘스트: {title} - 학생: {username}")
-                if st.button(f"인증하기", key=f"verify_{quest_id}_{student_id}"):
-                    complete_quest(student_id, quest_id, user_id)
-                    st.success("퀘스트 인증 완료!")
+            st.write(f"인증 대기: {count_pending_completions():,}건 (페이지 {len(st.session_state.quest_queue_pages)})")
+            
+            if not pending:
+                st.info("인증 대기 중인 퀘스트가 없습니다.")
+            else:
+                select_all = st.checkbox("이 페이지 전체 선택", key="quest_queue_select_all")
+                queue_df = pd.DataFrame(pending, columns=["ID", "신청 시각", "퀘스트", "보상", "학생"])
+                queue_df.insert(0, "승인", select_all)
+                edited_queue = st.data_editor(
+                    queue_df,
+                    disabled=["ID", "신청 시각", "퀘스트", "보상", "학생"],
+                    hide_index=True,
+                    key=f"quest_queue_{page_start}",
+                )
+                
+                if st.button("선택 항목 승인"):
+                    selected_ids = edited_queue.loc[edited_queue["승인"], "ID"].tolist()
+                    if not selected_ids:
+                        st.warning("승인할 항목을 선택해주세요.")
+                    else:
+                        approved, total_reward = verify_completions(selected_ids, user_id)
+                        st.success(f"{approved}건 인증 완료! (보상 합계 {total_reward:,}원)")
+                        st.rerun()
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                if len(st.session_state.quest_queue_pages) > 1 and st.button("◀ 이전 페이지"):
+                    st.session_state.quest_queue_pages.pop()
+                    st.rerun()
+            with col2:
+                if len(pending) == QUEST_QUEUE_PAGE_SIZE and st.button("다음 페이지 ▶"):
+                    last = pending[-1]
+                    st.session_state.quest_queue_pages.append((last[1], last[0]))
+                    st.rerun()
     
     # Student-specific features
     if user_role == 'student':
@@ -128,6 +183,74 @@ try:
             st.write(f"월급: {salary:,}원")
             st.write(f"설명: {description}")
         
+        # Savings account; interest is brought forward on every read
+        st.subheader("🐷 저축 계좌")
+        account = get_savings_account(user_id)
+        if account:
+            savings_balance, annual_rate = account
+            st.metric("저축 잔고", f"{savings_balance:,.2f}원", help=f"연 {annual_rate:.1%}, 매일 복리")
+        else:
+            st.write(f"아직 저축 계좌가 없습니다. 입금하면 연 {savings_rate():.1%} 이자가 매일 복리로 붙습니다.")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            deposit_amount = st.number_input("입금액", min_value=1, step=100, key="savings_deposit_amount")
+            if st.button("입금", key="savings_deposit"):
+                try:
+                    deposit_savings(user_id, deposit_amount)
+                    st.success(f"{deposit_amount:,}원을 저축했습니다!")
+                    st.rerun()
+                except ValueError:
+                    st.error("잔액이 부족합니다.")
+        with col2:
+            withdraw_amount = st.number_input("출금액", min_value=1, step=100, key="savings_withdraw_amount")
+            if st.button("출금", key="savings_withdraw"):
+                try:
+                    withdraw_savings(user_id, withdraw_amount)
+                    st.success(f"{withdraw_amount:,}원을 출금했습니다!")
+                    st.rerun()
+                except ValueError:
+                    st.error("저축 잔고가 부족합니다.")
+        
+        # Limit and stop orders; they settle on the next price tick that triggers them
+        st.subheader("📈 주식 주문")
+        listed_stocks = get_all_stocks()
+        if listed_stocks:
+            stock_labels = {f"{symbol} - {name} ({float(price):,.2f})": (stock_id, float(price)) for stock_id, symbol, name, price, _ in listed_stocks}
+            order_stock = st.selectbox("종목", list(stock_labels.keys()), key="order_stock")
+            col1, col2 = st.columns(2)
+            with col1:
+                order_side = st.radio("구분", ["매수", "매도"], horizontal=True, key="order_side")
+                order_quantity = st.number_input("수량", min_value=1, step=1, key="order_quantity")
+            with col2:
+                order_type = st.radio("주문 유형", ["지정가", "스탑"], horizontal=True, key="order_type",
+                                      help="지정가: 그 가격 이하에 매수/이상에 매도, 스탑: 가격이 그 값을 넘으면 매수/밑돌면 매도")
+                order_price = st.number_input("가격", min_value=0.01, value=max(stock_labels[order_stock][1], 0.01), step=1.0, key="order_price")
+            if st.button("주문하기", key="place_order"):
+                place_order(
+                    user_id, stock_labels[order_stock][0],
+                    "buy" if order_side == "매수" else "sell",
+                    "limit" if order_type == "지정가" else "stop",
+                    order_quantity, order_price
+                )
+                st.success("주문이 접수되었습니다. 다음 가격 갱신 때 조건이 맞으면 체결됩니다.")
+            
+            my_orders = get_user_orders(user_id)
+            if my_orders:
+                st.dataframe(pd.DataFrame(
+                    my_orders,
+                    columns=["주문 번호", "종목", "구분", "유형", "수량", "가격", "상태", "체결가", "주문 시각"]
+                ), hide_index=True, use_container_width=True)
+                open_orders = [row[0] for row in my_orders if row[6] == "open"]
+                if open_orders:
+                    cancel_id = st.selectbox("취소할 주문", open_orders, key="cancel_order_id")
+                    if st.button("주문 취소", key="cancel_order"):
+                        if cancel_order(user_id, cancel_id):
+                            st.success("주문이 취소되었습니다.")
+                            st.rerun()
+                        else:
+                            st.info("이미 체결되었거나 취소된 주문입니다.")
+        
         # Display available quests
         st.subheader("🎯 가능한 퀘스트")
         cur.execute("""
@@ -143,24 +266,55 @@ try:
             with st.expander(f"{title} (보상: {reward:,}원)"):
                 st.write(description)
                 if st.button("완료 신청", key=f"complete_{quest_id}"):
-                    cur.execute("""
-                        INSERT INTO quest_completions (quest_id, user_id)
-                        VALUES (%s, %s)
-                    """, (quest_id, user_id))
-                    conn.commit()
-                    st.success("완료 신청이 접수되었습니다!")
+                    if request_completion(user_id, quest_id):
+                        st.success("완료 신청이 접수되었습니다!")
+                    else:
+                        st.info("이미 신청한 퀘스트입니다.")
     
     # Display rankings
     st.subheader("🏆 랭킹")
-    rankings = get_rankings()
-    for i, (username, currency, role) in enumerate(rankings, 1):
-        st.write(f"{i}. {username} ({role}) - {currency:,}원")
+    leaderboard = get_leaderboard()
+    my_rank = leaderboard.user_rank(user_id)
+    if my_rank:
+        rank, percent_rank, _ = my_rank
+        st.metric("내 순위", f"{rank}위 / {len(leaderboard)}명", f"상위 {percent_rank:.0%}", delta_color="off")
+    
+    page_count = max(1, -(-len(leaderboard) // RANKING_PAGE_SIZE))
+    ranking_page = st.number_input("페이지", min_value=1, max_value=page_count, value=1, key="ranking_page")
+    ranking_df = pd.DataFrame(
+        [(rank, username, role, currency) for _, username, role, currency, rank, _ in leaderboard.page(ranking_page, RANKING_PAGE_SIZE)],
+        columns=["순위", "이름", "역할", "잔고"],
+    )
+    st.dataframe(ranking_df, hide_index=True, use_container_width=True)
+    
+    # Net worth: cash plus holdings at the latest prices
+    st.subheader("💼 순자산 랭킹")
+    valuation = get_valuation()
+    my_worth = valuation.user(user_id)
+    if my_worth:
+        _, _, _, cash, market_value, unrealized_pnl, net_worth, rank = my_worth
+        col1, col2, col3 = st.columns(3)
+        col1.metric("내 순자산 순위", f"{rank}위 / {len(valuation)}명")
+        col2.metric("순자산", f"{net_worth:,.0f}원")
+        col3.metric("주식 평가액", f"{market_value:,.0f}원", f"{unrealized_pnl:+,.0f}원")
+    
+    worth_page_count = max(1, -(-len(valuation) // RANKING_PAGE_SIZE))
+    worth_page = st.number_input("페이지", min_value=1, max_value=worth_page_count, value=1, key="net_worth_page")
+    worth_df = pd.DataFrame(
+        [(rank, username, cash, market_value, unrealized_pnl, net_worth)
+         for _, username, _, cash, market_value, unrealized_pnl, net_worth, rank in valuation.page(worth_page, RANKING_PAGE_SIZE)],
+        columns=["순위", "이름", "현금", "주식 평가액", "평가 손익", "순자산"],
+    ).round(0)
+    st.dataframe(worth_df, hide_index=True, use_container_width=True)
     
     # Monthly salary processing (only for teachers)
     if user_role == 'teacher':
         if st.button("월급 지급"):
-            process_monthly_salaries()
-            st.success("월급 지급이 완료되었습니다!")
+            summary = process_monthly_salaries(created_by=user_id)
+            if summary["already_paid"]:
+                st.info(f"{summary['pay_period']} 월급은 이미 지급되었습니다. ({summary['paid_users']}명, 총 {summary['total_amount']})")
+            else:
+                st.success(f"{summary['pay_period']} 월급 지급이 완료되었습니다! ({summary['paid_users']}명, 총 {summary['total_amount']})")
 
 except Exception as e:
     st.error(f"오류가 발생했습니다: {str(e)}")